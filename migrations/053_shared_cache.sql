@@ -0,0 +1,23 @@
+-- 053: Shared cache between uvicorn workers
+--
+-- UNLOGGED: no WAL, table is truncated after a crash — acceptable for cache data.
+-- Used by src/services/shared_cache.py (SHARED_CACHE_BACKEND=postgres):
+-- one worker recomputes heavy views (e.g. /machines/operator-view),
+-- the others read the serialized JSON payload.
+
+BEGIN;
+
+CREATE UNLOGGED TABLE IF NOT EXISTS shared_cache (
+    cache_key  TEXT PRIMARY KEY,
+    payload    TEXT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE shared_cache IS
+    'Cross-worker cache (UNLOGGED). payload = JSON text, age = NOW() - updated_at.';
+
+INSERT INTO schema_migrations (version, applied_at)
+VALUES ('053_shared_cache', NOW())
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
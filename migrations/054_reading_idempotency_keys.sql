@@ -0,0 +1,30 @@
+-- 054: Idempotency keys for POST /readings and POST /readings/batch
+--
+-- Tablets on flaky Wi-Fi retry the same reading. The client sends an
+-- idempotency_key; the first request claims it here (PRIMARY KEY = unique index)
+-- in the same transaction as the reading, and a replay gets the stored response
+-- without touching setup_jobs / batches. A concurrent duplicate blocks on the
+-- uncommitted key and then sees the stored response.
+-- Used by src/services/reading_idempotency.py. Old keys are purged by a daily job.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS reading_idempotency_keys (
+    idempotency_key TEXT PRIMARY KEY,
+    machine_id      INTEGER,
+    reading_id      INTEGER REFERENCES machine_readings(id) ON DELETE SET NULL,
+    response        JSONB,
+    created_at      TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_reading_idempotency_keys_created_at
+    ON reading_idempotency_keys (created_at);
+
+COMMENT ON TABLE reading_idempotency_keys IS
+    'Client idempotency keys for counter readings; response = original API result returned on replay.';
+
+INSERT INTO schema_migrations (version, applied_at)
+VALUES ('054_reading_idempotency_keys', NOW())
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,41 @@
+-- 055: Last counter reading per machine, maintained on write
+--
+-- The row is kept current in the same transaction as the machine_readings
+-- write. Originally POST /readings and /readings/batch upserted it; since
+-- 062_machine_last_reading_trigger.sql a trigger on machine_readings does it
+-- for every writer, including updates and deletes.
+-- Hot reads (operator view, planning queues, previous reading in save_reading)
+-- join it instead of ROW_NUMBER()/DISTINCT ON over the whole machine_readings.
+--
+-- created_at has the same type as machine_readings.created_at (naive UTC).
+-- Initial fill below; scripts/backfill_machine_last_reading.py re-syncs it from
+-- history after manual edits of machine_readings.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS machine_last_reading (
+    machine_id   INTEGER PRIMARY KEY REFERENCES machines(id) ON DELETE CASCADE,
+    setup_job_id INTEGER,
+    reading_id   INTEGER,
+    reading      INTEGER,
+    created_at   TIMESTAMP NOT NULL,
+    updated_at   TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE machine_last_reading IS
+    'Latest machine_readings row per machine (denormalized, kept current on reading write).';
+
+INSERT INTO machine_last_reading (machine_id, setup_job_id, reading_id, reading, created_at)
+SELECT DISTINCT ON (mr.machine_id)
+    mr.machine_id, mr.setup_job_id, mr.id, mr.reading, mr.created_at
+FROM machine_readings mr
+JOIN machines m ON m.id = mr.machine_id
+WHERE mr.created_at IS NOT NULL
+ORDER BY mr.machine_id, mr.created_at DESC, mr.id DESC
+ON CONFLICT (machine_id) DO NOTHING;
+
+INSERT INTO schema_migrations (version, applied_at)
+VALUES ('055_machine_last_reading', NOW())
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
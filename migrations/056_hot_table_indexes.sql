@@ -0,0 +1,41 @@
+-- 056: Composite indexes for hot queries on machine_readings, setup_jobs, batches
+-- migrate:no-transaction
+--
+-- These tables are written all day, so the indexes are built CONCURRENTLY
+-- (no write lock). CREATE INDEX CONCURRENTLY cannot run inside a transaction:
+-- the "migrate:no-transaction" marker makes scripts/apply_migrations.py
+-- run this file statement by statement in autocommit mode. If a build fails,
+-- the INVALID index is dropped and rebuilt on the next run.
+--
+-- Query shapes covered (checked by scripts/verify_query_plans.py):
+--   previous reading of a machine      machine_readings (machine_id, created_at)
+--   readings of a setup / lot          machine_readings (setup_job_id, created_at)
+--   active setup of a machine          setup_jobs (machine_id, status) WHERE end_time IS NULL
+--   setups of a lot                    setup_jobs (lot_id)
+--   batches of a lot by location       batches (lot_id, current_location)
+--   warehouse acceptance by date       batches (warehouse_received_at)
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_machine_readings_machine_created
+    ON machine_readings (machine_id, created_at);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_machine_readings_setup_created
+    ON machine_readings (setup_job_id, created_at)
+    WHERE setup_job_id IS NOT NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_setup_jobs_machine_status_open
+    ON setup_jobs (machine_id, status)
+    WHERE end_time IS NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_setup_jobs_lot_id
+    ON setup_jobs (lot_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_batches_lot_location
+    ON batches (lot_id, current_location);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_batches_warehouse_received_at
+    ON batches (warehouse_received_at)
+    WHERE warehouse_received_at IS NOT NULL;
+
+INSERT INTO schema_migrations (version, applied_at)
+VALUES ('056_hot_table_indexes', NOW())
+ON CONFLICT (version) DO NOTHING;
@@ -0,0 +1,98 @@
+-- 057: Cache of /daily-production-report for closed report dates
+--
+-- A report date D covers the morning shift (D 06:00-18:00) and the evening
+-- shift (D 18:00 - D+1 06:00), local time Asia/Jerusalem. Once the evening
+-- shift is over the report no longer changes, so src/main.py stores the
+-- computed payload here and serves it without recomputing.
+--
+-- Late edits invalidate the cache in the database itself (triggers below),
+-- so writes from the API, the Telegram bot and manual SQL are all covered:
+--   machine_readings: any INSERT/UPDATE/DELETE drops reports from the
+--     reading's report date onwards (the reading is also the start value of
+--     the following days);
+--   setup_jobs: changes of part, cycle time, plan, machinist, machine or
+--     start time drop reports from the setup's start date onwards. Normal
+--     status/end_time transitions happen "now" and touch no closed date.
+-- Readings written in real time belong to the open report date, which is
+-- never cached, so the trigger DELETE finds nothing.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS daily_production_report_cache (
+    report_date  DATE PRIMARY KEY,
+    payload      JSONB NOT NULL,
+    generated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE daily_production_report_cache IS
+    'Computed /daily-production-report for closed dates. Rows are deleted by triggers on late edits.';
+
+-- Report date of a UTC timestamp: local time minus 6 hours (evening shift belongs to the previous day)
+CREATE OR REPLACE FUNCTION production_report_date(ts TIMESTAMP)
+RETURNS DATE AS $$
+    SELECT ((ts AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Jerusalem') - INTERVAL '6 hours')::date;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION invalidate_report_cache_on_reading()
+RETURNS TRIGGER AS $$
+DECLARE
+    since DATE;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        since := production_report_date(NEW.created_at);
+    ELSIF TG_OP = 'DELETE' THEN
+        since := production_report_date(OLD.created_at);
+    ELSE
+        since := LEAST(production_report_date(OLD.created_at), production_report_date(NEW.created_at));
+    END IF;
+
+    IF since IS NOT NULL THEN
+        DELETE FROM daily_production_report_cache WHERE report_date >= since;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_report_cache_readings ON machine_readings;
+
+CREATE TRIGGER trigger_report_cache_readings
+AFTER INSERT OR UPDATE OR DELETE ON machine_readings
+FOR EACH ROW
+EXECUTE FUNCTION invalidate_report_cache_on_reading();
+
+CREATE OR REPLACE FUNCTION invalidate_report_cache_on_setup()
+RETURNS TRIGGER AS $$
+DECLARE
+    since DATE;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        since := production_report_date(COALESCE(OLD.start_time, OLD.created_at));
+    ELSIF TG_OP = 'INSERT' THEN
+        since := production_report_date(COALESCE(NEW.start_time, NEW.created_at));
+    ELSE
+        since := LEAST(
+            production_report_date(COALESCE(OLD.start_time, OLD.created_at)),
+            production_report_date(COALESCE(NEW.start_time, NEW.created_at))
+        );
+    END IF;
+
+    IF since IS NOT NULL THEN
+        DELETE FROM daily_production_report_cache WHERE report_date >= since;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_report_cache_setups ON setup_jobs;
+
+CREATE TRIGGER trigger_report_cache_setups
+AFTER INSERT OR DELETE OR UPDATE OF part_id, cycle_time, planned_quantity, employee_id, machine_id, start_time
+ON setup_jobs
+FOR EACH ROW
+EXECUTE FUNCTION invalidate_report_cache_on_setup();
+
+INSERT INTO schema_migrations (version, applied_at)
+VALUES ('057_daily_production_report_cache', NOW())
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
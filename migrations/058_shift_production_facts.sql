@@ -0,0 +1,107 @@
+-- 058: Per-shift production facts
+--
+-- One row per (shift, machine, setup, operator): parts produced and the
+-- first/last counter reading in the shift. Shifts are 06:00-18:00 and
+-- 18:00-06:00 Asia/Jerusalem; shift_start is naive UTC like
+-- machine_readings.created_at.
+--
+-- Maintained by src/services/shift_facts.py:
+--   * a leader-only APScheduler job rebuilds the open shift every few minutes
+--     (and the shift that has just closed);
+--   * a late reading (created_at in an already closed shift: offline replay,
+--     manual correction, delete) marks its shift in
+--     shift_production_facts_pending via the trigger below; the job rebuilds
+--     marked shifts and drops affected daily_production_report_cache rows;
+--   * history: python scripts/backfill_shift_production_facts.py --from ... --to ...
+--
+-- parts_produced = sum of counter deltas of the operator's readings within the
+-- setup; a counter reset counts the new value (same rule as the daily report).
+--
+-- Replaces trigger_report_cache_readings from 057: the daily report reads
+-- these facts, so its cache is invalidated when a shift is rebuilt.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS shift_production_facts (
+    id               BIGSERIAL PRIMARY KEY,
+    shift_start      TIMESTAMP NOT NULL,
+    shift_date       DATE NOT NULL,
+    shift_type       VARCHAR(10) NOT NULL,
+    machine_id       INTEGER NOT NULL REFERENCES machines(id) ON DELETE CASCADE,
+    operator_id      INTEGER REFERENCES employees(id) ON DELETE SET NULL,
+    setup_id         INTEGER NOT NULL REFERENCES setup_jobs(id) ON DELETE CASCADE,
+    lot_id           INTEGER REFERENCES lots(id) ON DELETE SET NULL,
+    parts_produced   INTEGER NOT NULL DEFAULT 0,
+    readings_count   INTEGER NOT NULL DEFAULT 0,
+    first_reading    INTEGER,
+    last_reading     INTEGER,
+    first_reading_at TIMESTAMP,
+    last_reading_at  TIMESTAMP,
+    updated_at       TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_shift_production_facts_shift ON shift_production_facts (shift_start);
+CREATE INDEX IF NOT EXISTS idx_shift_production_facts_machine_shift ON shift_production_facts (machine_id, shift_start);
+CREATE INDEX IF NOT EXISTS idx_shift_production_facts_operator_date ON shift_production_facts (operator_id, shift_date);
+CREATE INDEX IF NOT EXISTS idx_shift_production_facts_setup ON shift_production_facts (setup_id);
+
+COMMENT ON TABLE shift_production_facts IS
+    'Parts produced per shift/machine/setup/operator. Rebuilt per shift by src/services/shift_facts.py.';
+
+CREATE TABLE IF NOT EXISTS shift_production_facts_pending (
+    shift_start TIMESTAMP PRIMARY KEY,
+    marked_at   TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE shift_production_facts_pending IS
+    'Closed shifts with late reading edits, waiting to be rebuilt in shift_production_facts.';
+
+-- Start of the shift (naive UTC) that contains a naive-UTC timestamp
+CREATE OR REPLACE FUNCTION production_shift_start(ts TIMESTAMP)
+RETURNS TIMESTAMP AS $$
+    SELECT (
+        date_trunc('day', local_ts - INTERVAL '6 hours')
+        + INTERVAL '6 hours'
+        + CASE WHEN (local_ts - INTERVAL '6 hours')::time >= TIME '12:00' THEN INTERVAL '12 hours' ELSE INTERVAL '0' END
+    ) AT TIME ZONE 'Asia/Jerusalem' AT TIME ZONE 'UTC'
+    FROM (SELECT ts AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Jerusalem' AS local_ts) t;
+$$ LANGUAGE sql STABLE;
+
+-- Real-time readings belong to the open shift, which the job rebuilds anyway:
+-- only readings of closed shifts are marked (no contention on the hot path).
+CREATE OR REPLACE FUNCTION mark_shift_facts_pending()
+RETURNS TRIGGER AS $$
+DECLARE
+    open_shift TIMESTAMP := production_shift_start((NOW() AT TIME ZONE 'UTC')::timestamp);
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.created_at IS NOT NULL
+       AND production_shift_start(NEW.created_at) < open_shift THEN
+        INSERT INTO shift_production_facts_pending (shift_start)
+        VALUES (production_shift_start(NEW.created_at))
+        ON CONFLICT (shift_start) DO NOTHING;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.created_at IS NOT NULL
+       AND production_shift_start(OLD.created_at) < open_shift THEN
+        INSERT INTO shift_production_facts_pending (shift_start)
+        VALUES (production_shift_start(OLD.created_at))
+        ON CONFLICT (shift_start) DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_report_cache_readings ON machine_readings;
+DROP FUNCTION IF EXISTS invalidate_report_cache_on_reading();
+
+DROP TRIGGER IF EXISTS trigger_shift_facts_pending ON machine_readings;
+
+CREATE TRIGGER trigger_shift_facts_pending
+AFTER INSERT OR UPDATE OF created_at, reading, setup_job_id, employee_id, machine_id OR DELETE ON machine_readings
+FOR EACH ROW
+EXECUTE FUNCTION mark_shift_facts_pending();
+
+INSERT INTO schema_migrations (version, applied_at)
+VALUES ('058_shift_production_facts', NOW())
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,54 @@
+-- 059: Transactional outbox for post-commit side effects
+--
+-- Endpoints (approve_setup, complete_setup, accept_batch_on_warehouse,
+-- /admin/setup/{id}/approve, /qc/setups/notify-*) insert a row here in the
+-- same transaction as their business change instead of calling Telegram,
+-- WhatsApp or MTConnect inline / via asyncio.create_task. A side effect is
+-- therefore recorded iff the change is committed and survives a worker restart.
+--
+-- Delivered by the dispatcher in src/services/outbox.py (leader worker only):
+--   * claims due rows with FOR UPDATE SKIP LOCKED in batches;
+--   * runs handlers with a concurrency limit per destination;
+--   * on failure: status back to 'pending' with exponential backoff in
+--     available_at; after max attempts (or a permanent error): status 'dead';
+--   * rows stuck in 'processing' (leader crashed mid-batch) are returned to
+--     'pending' after a timeout, so delivery is at-least-once.
+-- 'done' rows are purged after a retention period, 'dead' rows are kept.
+--
+-- Re-send dead rows after fixing the cause:
+--   UPDATE outbox SET status = 'pending', attempts = 0, available_at = NOW() WHERE status = 'dead';
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS outbox (
+    id           BIGSERIAL PRIMARY KEY,
+    destination  VARCHAR(32) NOT NULL,
+    kind         VARCHAR(64) NOT NULL,
+    payload      JSONB NOT NULL DEFAULT '{}'::jsonb,
+    status       VARCHAR(16) NOT NULL DEFAULT 'pending',
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    available_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    locked_at    TIMESTAMPTZ,
+    last_error   TEXT,
+    created_at   TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    processed_at TIMESTAMPTZ,
+    CONSTRAINT outbox_status_check CHECK (status IN ('pending', 'processing', 'done', 'dead'))
+);
+
+-- Dispatcher scans only undelivered rows
+CREATE INDEX IF NOT EXISTS idx_outbox_undelivered
+    ON outbox (status, available_at, id)
+    WHERE status IN ('pending', 'processing');
+
+CREATE INDEX IF NOT EXISTS idx_outbox_dead
+    ON outbox (created_at)
+    WHERE status = 'dead';
+
+COMMENT ON TABLE outbox IS
+    'Side effects (notifications, MTConnect calls) written in the business transaction, delivered by src/services/outbox.py.';
+
+INSERT INTO schema_migrations (version, applied_at)
+VALUES ('059_outbox', NOW())
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,61 @@
+-- 060: Notify workers when machine queues change
+--
+-- /planning/recommend-machines and /planning/recommend-with-queue read a
+-- per-worker MachineQueueSnapshot (src/services/machine_queue_snapshot.py)
+-- instead of scanning machines, setups and queued lots on every call.
+-- The snapshot is rebuilt when it receives a "planning_queue_changed" event
+-- on the cache invalidation channel (src/services/cache_invalidation.py).
+--
+-- Lots, setups and parts are also written by the Telegram bot and by manual
+-- SQL, so the event comes from statement-level triggers rather than from
+-- endpoints. Postgres delivers identical notifications from one transaction
+-- once, so a bulk UPDATE produces a single event.
+--
+-- The channel name must match CACHE_INVALIDATION_CHANNEL (default below).
+-- Counter progress of lots in production is not an event: the snapshot
+-- expires after PLANNING_SNAPSHOT_TTL_SEC.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION notify_planning_queue_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('mls_cache_invalidation', '{"kind": "planning_queue_changed"}');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_planning_queue_lots ON lots;
+CREATE TRIGGER trigger_planning_queue_lots
+AFTER INSERT OR DELETE OR UPDATE OF status, assigned_machine_id, assigned_order, actual_diameter,
+    total_planned_quantity, initial_planned_quantity, due_date, part_id, lot_number
+ON lots
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_planning_queue_changed();
+
+DROP TRIGGER IF EXISTS trigger_planning_queue_setups ON setup_jobs;
+CREATE TRIGGER trigger_planning_queue_setups
+AFTER INSERT OR DELETE OR UPDATE OF status, end_time, machine_id, lot_id
+ON setup_jobs
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_planning_queue_changed();
+
+DROP TRIGGER IF EXISTS trigger_planning_queue_parts ON parts;
+CREATE TRIGGER trigger_planning_queue_parts
+AFTER UPDATE OF drawing_number, avg_cycle_time, recommended_diameter
+ON parts
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_planning_queue_changed();
+
+DROP TRIGGER IF EXISTS trigger_planning_queue_machines ON machines;
+CREATE TRIGGER trigger_planning_queue_machines
+AFTER INSERT OR DELETE OR UPDATE
+ON machines
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_planning_queue_changed();
+
+INSERT INTO schema_migrations (version, applied_at)
+VALUES ('060_planning_queue_notify', NOW())
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
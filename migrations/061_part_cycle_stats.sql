@@ -0,0 +1,157 @@
+-- 061: Per-part cycle time statistics maintained by trigger
+--
+-- /lots/{id}/cycle-time and /lots/{id}/cycle-time-detailed used to aggregate
+-- every setup of the part (AVG, MIN and nested SELECT MIN(cycle_time)
+-- subqueries for the best machine / machinist) on every call. Kanban and the
+-- lot modal now read one row per part from part_cycle_stats
+-- (POST /parts/cycle-stats for many parts at once).
+--
+-- Source: setup_jobs with cycle_time > 0, any status (same set as the
+-- parts.avg_cycle_time trigger, migrations/add_avg_cycle_time_to_parts.sql).
+-- A row trigger on setup_jobs recomputes only the affected part(s) when a
+-- setup is inserted, deleted, or its cycle_time / part_id / machine_id /
+-- employee_id changes, so writes from the Telegram bot are covered too.
+-- A part without cycle times has no row.
+--
+-- parts.avg_cycle_time is unchanged: for new parts it holds the manual
+-- estimate (PUT /parts/{id}/cycle-time).
+--
+-- Full rebuild if ever needed:
+--   SELECT refresh_part_cycle_stats(id) FROM parts;
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS part_cycle_stats (
+    part_id           INTEGER PRIMARY KEY REFERENCES parts(id) ON DELETE CASCADE,
+    setups_count      INTEGER NOT NULL,
+    avg_cycle_time    INTEGER NOT NULL,
+    min_cycle_time    INTEGER NOT NULL,
+    p50_cycle_time    INTEGER NOT NULL,
+    p90_cycle_time    INTEGER NOT NULL,
+    best_setup_id     INTEGER,
+    best_machine_id   INTEGER,
+    best_machinist_id INTEGER,
+    updated_at        TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+COMMENT ON TABLE part_cycle_stats IS
+    'Cycle time statistics per part over setup_jobs.cycle_time > 0, kept current by trigger_part_cycle_stats.';
+
+CREATE OR REPLACE FUNCTION refresh_part_cycle_stats(p_part_id INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    IF p_part_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    WITH cycles AS (
+        SELECT id, cycle_time, machine_id, employee_id
+        FROM setup_jobs
+        WHERE part_id = p_part_id
+          AND cycle_time IS NOT NULL
+          AND cycle_time > 0
+    ),
+    best AS (
+        SELECT id, machine_id, employee_id
+        FROM cycles
+        ORDER BY cycle_time, id
+        LIMIT 1
+    )
+    INSERT INTO part_cycle_stats (
+        part_id, setups_count, avg_cycle_time, min_cycle_time, p50_cycle_time, p90_cycle_time,
+        best_setup_id, best_machine_id, best_machinist_id, updated_at
+    )
+    SELECT
+        p_part_id,
+        COUNT(*),
+        ROUND(AVG(c.cycle_time))::int,
+        MIN(c.cycle_time),
+        ROUND(percentile_cont(0.5) WITHIN GROUP (ORDER BY c.cycle_time))::int,
+        ROUND(percentile_cont(0.9) WITHIN GROUP (ORDER BY c.cycle_time))::int,
+        b.id, b.machine_id, b.employee_id,
+        NOW()
+    FROM cycles c
+    CROSS JOIN best b
+    GROUP BY b.id, b.machine_id, b.employee_id
+    ON CONFLICT (part_id) DO UPDATE SET
+        setups_count      = EXCLUDED.setups_count,
+        avg_cycle_time    = EXCLUDED.avg_cycle_time,
+        min_cycle_time    = EXCLUDED.min_cycle_time,
+        p50_cycle_time    = EXCLUDED.p50_cycle_time,
+        p90_cycle_time    = EXCLUDED.p90_cycle_time,
+        best_setup_id     = EXCLUDED.best_setup_id,
+        best_machine_id   = EXCLUDED.best_machine_id,
+        best_machinist_id = EXCLUDED.best_machinist_id,
+        updated_at        = EXCLUDED.updated_at;
+
+    IF NOT FOUND THEN
+        DELETE FROM part_cycle_stats WHERE part_id = p_part_id;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION update_part_cycle_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        IF NEW.cycle_time IS NOT NULL AND NEW.cycle_time > 0 THEN
+            PERFORM refresh_part_cycle_stats(NEW.part_id);
+        END IF;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM refresh_part_cycle_stats(OLD.part_id);
+    ELSIF NEW.cycle_time IS DISTINCT FROM OLD.cycle_time
+       OR NEW.part_id IS DISTINCT FROM OLD.part_id
+       OR NEW.machine_id IS DISTINCT FROM OLD.machine_id
+       OR NEW.employee_id IS DISTINCT FROM OLD.employee_id THEN
+        PERFORM refresh_part_cycle_stats(OLD.part_id);
+        IF NEW.part_id IS DISTINCT FROM OLD.part_id THEN
+            PERFORM refresh_part_cycle_stats(NEW.part_id);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_part_cycle_stats ON setup_jobs;
+CREATE TRIGGER trigger_part_cycle_stats
+AFTER INSERT OR DELETE OR UPDATE OF cycle_time, part_id, machine_id, employee_id
+ON setup_jobs
+FOR EACH ROW
+EXECUTE FUNCTION update_part_cycle_stats();
+
+-- Initial population (one pass over setup_jobs)
+INSERT INTO part_cycle_stats (
+    part_id, setups_count, avg_cycle_time, min_cycle_time, p50_cycle_time, p90_cycle_time,
+    best_setup_id, best_machine_id, best_machinist_id, updated_at
+)
+SELECT
+    agg.part_id, agg.setups_count, agg.avg_cycle_time, agg.min_cycle_time, agg.p50_cycle_time, agg.p90_cycle_time,
+    best.id, best.machine_id, best.employee_id, NOW()
+FROM (
+    SELECT
+        sj.part_id,
+        COUNT(*) AS setups_count,
+        ROUND(AVG(sj.cycle_time))::int AS avg_cycle_time,
+        MIN(sj.cycle_time) AS min_cycle_time,
+        ROUND(percentile_cont(0.5) WITHIN GROUP (ORDER BY sj.cycle_time))::int AS p50_cycle_time,
+        ROUND(percentile_cont(0.9) WITHIN GROUP (ORDER BY sj.cycle_time))::int AS p90_cycle_time
+    FROM setup_jobs sj
+    JOIN parts p ON p.id = sj.part_id
+    WHERE sj.cycle_time IS NOT NULL
+      AND sj.cycle_time > 0
+    GROUP BY sj.part_id
+) agg
+JOIN (
+    SELECT DISTINCT ON (part_id) part_id, id, machine_id, employee_id
+    FROM setup_jobs
+    WHERE cycle_time IS NOT NULL
+      AND cycle_time > 0
+    ORDER BY part_id, cycle_time, id
+) best ON best.part_id = agg.part_id
+ON CONFLICT (part_id) DO NOTHING;
+
+INSERT INTO schema_migrations (version, applied_at)
+VALUES ('061_part_cycle_stats', NOW())
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,89 @@
+-- 062: Maintain machine_last_reading by trigger on machine_readings
+--
+-- Migration 055 kept machine_last_reading current only from POST /readings and
+-- /readings/batch. Readings deleted or corrected by the Telegram bot or by
+-- manual SQL left a stale row that save_reading then used as the previous
+-- counter value. The row is now maintained by a trigger on machine_readings,
+-- in the same transaction as the write, whoever writes:
+--   INSERT           upsert if the new reading is not older than the current one
+--   UPDATE / DELETE  recompute the machine(s) from machine_readings
+--
+-- All paths take a transaction-level advisory lock per machine, so a
+-- recompute cannot overwrite a newer reading inserted concurrently.
+-- The API no longer upserts the row itself.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION refresh_machine_last_reading(p_machine_id INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    IF p_machine_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    PERFORM pg_advisory_xact_lock(hashtext('machine_last_reading'), p_machine_id);
+
+    INSERT INTO machine_last_reading (machine_id, setup_job_id, reading_id, reading, created_at, updated_at)
+    SELECT mr.machine_id, mr.setup_job_id, mr.id, mr.reading, mr.created_at, NOW()
+    FROM machine_readings mr
+    WHERE mr.machine_id = p_machine_id
+      AND mr.created_at IS NOT NULL
+    ORDER BY mr.created_at DESC, mr.id DESC
+    LIMIT 1
+    ON CONFLICT (machine_id) DO UPDATE SET
+        setup_job_id = EXCLUDED.setup_job_id,
+        reading_id   = EXCLUDED.reading_id,
+        reading      = EXCLUDED.reading,
+        created_at   = EXCLUDED.created_at,
+        updated_at   = NOW();
+
+    IF NOT FOUND THEN
+        DELETE FROM machine_last_reading WHERE machine_id = p_machine_id;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION update_machine_last_reading()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        IF NEW.machine_id IS NOT NULL AND NEW.created_at IS NOT NULL THEN
+            PERFORM pg_advisory_xact_lock(hashtext('machine_last_reading'), NEW.machine_id);
+            -- Only a newer reading moves the row (batches may replay old readings)
+            INSERT INTO machine_last_reading (machine_id, setup_job_id, reading_id, reading, created_at, updated_at)
+            VALUES (NEW.machine_id, NEW.setup_job_id, NEW.id, NEW.reading, NEW.created_at, NOW())
+            ON CONFLICT (machine_id) DO UPDATE SET
+                setup_job_id = EXCLUDED.setup_job_id,
+                reading_id   = EXCLUDED.reading_id,
+                reading      = EXCLUDED.reading,
+                created_at   = EXCLUDED.created_at,
+                updated_at   = NOW()
+            WHERE machine_last_reading.created_at <= EXCLUDED.created_at;
+        END IF;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM refresh_machine_last_reading(OLD.machine_id);
+    ELSE
+        PERFORM refresh_machine_last_reading(OLD.machine_id);
+        IF NEW.machine_id IS DISTINCT FROM OLD.machine_id THEN
+            PERFORM refresh_machine_last_reading(NEW.machine_id);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_machine_last_reading ON machine_readings;
+CREATE TRIGGER trigger_machine_last_reading
+AFTER INSERT OR DELETE OR UPDATE OF machine_id, setup_job_id, reading, created_at
+ON machine_readings
+FOR EACH ROW
+EXECUTE FUNCTION update_machine_last_reading();
+
+-- Re-sync rows that went stale before the trigger existed
+SELECT refresh_machine_last_reading(m.id) FROM machines m;
+
+INSERT INTO schema_migrations (version, applied_at)
+VALUES ('062_machine_last_reading_trigger', NOW())
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,73 @@
+-- 063: Serialize part_cycle_stats recomputes per part
+--
+-- refresh_part_cycle_stats() (migration 061) recomputed a part from its own
+-- snapshot. Under READ COMMITTED, two transactions writing setups of the same
+-- part could each miss the other's uncommitted row, and the later upsert
+-- left statistics without one of them. The recompute now takes a
+-- transaction-level advisory lock per part first, the same pattern as
+-- refresh_machine_last_reading() in migration 062.
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION refresh_part_cycle_stats(p_part_id INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    IF p_part_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    -- Concurrent setups of one part wait here; the recompute below then sees
+    -- the other transaction's committed rows (READ COMMITTED, new snapshot)
+    PERFORM pg_advisory_xact_lock(hashtext('part_cycle_stats'), p_part_id);
+
+    WITH cycles AS (
+        SELECT id, cycle_time, machine_id, employee_id
+        FROM setup_jobs
+        WHERE part_id = p_part_id
+          AND cycle_time IS NOT NULL
+          AND cycle_time > 0
+    ),
+    best AS (
+        SELECT id, machine_id, employee_id
+        FROM cycles
+        ORDER BY cycle_time, id
+        LIMIT 1
+    )
+    INSERT INTO part_cycle_stats (
+        part_id, setups_count, avg_cycle_time, min_cycle_time, p50_cycle_time, p90_cycle_time,
+        best_setup_id, best_machine_id, best_machinist_id, updated_at
+    )
+    SELECT
+        p_part_id,
+        COUNT(*),
+        ROUND(AVG(c.cycle_time))::int,
+        MIN(c.cycle_time),
+        ROUND(percentile_cont(0.5) WITHIN GROUP (ORDER BY c.cycle_time))::int,
+        ROUND(percentile_cont(0.9) WITHIN GROUP (ORDER BY c.cycle_time))::int,
+        b.id, b.machine_id, b.employee_id,
+        NOW()
+    FROM cycles c
+    CROSS JOIN best b
+    GROUP BY b.id, b.machine_id, b.employee_id
+    ON CONFLICT (part_id) DO UPDATE SET
+        setups_count      = EXCLUDED.setups_count,
+        avg_cycle_time    = EXCLUDED.avg_cycle_time,
+        min_cycle_time    = EXCLUDED.min_cycle_time,
+        p50_cycle_time    = EXCLUDED.p50_cycle_time,
+        p90_cycle_time    = EXCLUDED.p90_cycle_time,
+        best_setup_id     = EXCLUDED.best_setup_id,
+        best_machine_id   = EXCLUDED.best_machine_id,
+        best_machinist_id = EXCLUDED.best_machinist_id,
+        updated_at        = EXCLUDED.updated_at;
+
+    IF NOT FOUND THEN
+        DELETE FROM part_cycle_stats WHERE part_id = p_part_id;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+INSERT INTO schema_migrations (version, applied_at)
+VALUES ('063_part_cycle_stats_lock', NOW())
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
@@ -0,0 +1,53 @@
+"""
+backfill_shift_production_facts.py — пересобирает shift_production_facts за период.
+
+Нужен один раз после миграции 058 (история) и после массовых ручных правок
+показаний. Каждая смена пересобирается в своей транзакции тем же кодом, что
+и задача планировщика (src/services/shift_facts.py); повторный запуск безопасен.
+
+    python scripts/backfill_shift_production_facts.py --from 2025-01-01 [--to 2025-12-31]
+
+Даты — отчётные (локальное время Asia/Jerusalem); по умолчанию --to = сегодня.
+"""
+
+import argparse
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src import database  # noqa: E402
+from src.services.production_day import production_day_window  # noqa: E402
+from src.services.shift_facts import refresh_range  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Rebuild shift_production_facts for a date range")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, required=True)
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, default=date.today())
+    args = parser.parse_args()
+
+    if args.date_to < args.date_from:
+        print("--to must not be earlier than --from", file=sys.stderr)
+        return 1
+
+    database.initialize_database()
+    db = database.SessionLocal()
+    try:
+        current = args.date_from
+        total = 0
+        while current <= args.date_to:
+            window = production_day_window(current)
+            rows = refresh_range(db, window.morning_start, window.evening_end)
+            total += rows
+            print(f"[shift-facts] {current}: {rows} rows")
+            current += timedelta(days=1)
+        print(f"[shift-facts] Done. {total} rows for {args.date_from} .. {args.date_to}.")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
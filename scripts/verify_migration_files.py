@@ -1,6 +1,9 @@
+import re
 import sys
 from pathlib import Path
 
+NO_TRANSACTION_MARKER = "-- migrate:no-transaction"
+
 
 LEGACY_MIGRATIONS = {
     "021_ai_assistant_tables.sql",
@@ -27,12 +30,21 @@ def main() -> int:
     sql_files = sorted(migrations_dir.glob("*.sql"))
 
     missing = []
+    bad_transaction_mode = []
     for file in sql_files:
         if file.name in LEGACY_MIGRATIONS:
             continue
         content = file.read_text(encoding="utf-8")
         if "schema_migrations" not in content:
             missing.append(file.name)
+        # CONCURRENTLY нельзя выполнить внутри транзакции (apply_migrations.py
+        # выполняет файл целиком в одной), поэтому нужен маркер и нет BEGIN/COMMIT
+        no_transaction = any(line.strip() == NO_TRANSACTION_MARKER for line in content.splitlines())
+        code = "\n".join(line for line in content.splitlines() if not line.strip().startswith("--"))
+        if re.search(r"\bCONCURRENTLY\b", code, re.IGNORECASE) and not no_transaction:
+            bad_transaction_mode.append(f"{file.name}: CONCURRENTLY without '{NO_TRANSACTION_MARKER}'")
+        if no_transaction and re.search(r"^\s*(BEGIN|COMMIT)\s*;", code, re.IGNORECASE | re.MULTILINE):
+            bad_transaction_mode.append(f"{file.name}: '{NO_TRANSACTION_MARKER}' with BEGIN/COMMIT")
 
     if missing:
         print("Migrations missing schema_migrations log:")
@@ -40,6 +52,12 @@ def main() -> int:
             print(f"  - {name}")
         return 1
 
+    if bad_transaction_mode:
+        print("Migrations with invalid transaction mode:")
+        for item in bad_transaction_mode:
+            print(f"  - {item}")
+        return 1
+
     print("All migrations contain schema_migrations log.")
     return 0
 
@@ -1,9 +1,11 @@
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy import create_engine, Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from pydantic_settings import BaseSettings
 import os
-from typing import Generator, Optional
+from typing import AsyncGenerator, Generator, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 # ИЗМЕНЕННАЯ Pydantic модель для настроек
 class DatabaseSettings(BaseSettings):
@@ -24,24 +26,56 @@ db_settings = DatabaseSettings()
 # Объявляем Base здесь
 Base = declarative_base()
 
+# Размер пула sync engine. Используется также для размера пула потоков,
+# в котором выполняются async-эндпоинты с синхронной Session (см. src/utils/sync_db_offload.py)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
 # Эти переменные будут инициализированы в main.py
 engine: Engine | None = None
 SessionLocal: sessionmaker[Session] | None = None
 
+# Async engine (asyncpg) для горячих эндпоинтов, чтобы не блокировать event loop
+async_engine: AsyncEngine | None = None
+AsyncSessionLocal: async_sessionmaker[AsyncSession] | None = None
+
 # AI Database (pgvector) - для RAG и AI Assistant
 ai_engine: Engine | None = None
 AISessionLocal: sessionmaker[Session] | None = None
 
+
+def _to_async_url(url: str) -> tuple[str, dict]:
+    """
+    Преобразует DATABASE_URL (psycopg2) в URL для asyncpg.
+    asyncpg не понимает ?sslmode=..., поэтому переносим его в connect_args.
+    """
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    if url.startswith("postgresql+psycopg2://"):
+        url = url.replace("postgresql+psycopg2://", "postgresql://", 1)
+    if url.startswith("postgresql://"):
+        url = url.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    connect_args: dict = {}
+    sslmode = query.pop("sslmode", None)
+    if sslmode and sslmode != "disable":
+        connect_args["ssl"] = sslmode if sslmode in ("require", "verify-ca", "verify-full", "prefer", "allow") else True
+    url = urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
+    return url, connect_args
+
+
 def initialize_database():
     """Инициализирует engine и SessionLocal после загрузки конфигурации."""
-    global engine, SessionLocal, ai_engine, AISessionLocal
+    global engine, SessionLocal, async_engine, AsyncSessionLocal, ai_engine, AISessionLocal
     if engine is None:
         # Используем атрибут из нашего объекта настроек
         # Увеличиваем размер пула соединений для предотвращения timeout ошибок
         engine = create_engine(
             db_settings.DATABASE_URL,
-            pool_size=5,  # Уменьшено для работы с несколькими workers
-            max_overflow=10,  # 8 workers × (5+10) = 120 max connections
+            pool_size=DB_POOL_SIZE,  # Уменьшено для работы с несколькими workers
+            max_overflow=DB_MAX_OVERFLOW,  # 8 workers × (5+10) = 120 max connections
             pool_timeout=30,  # Таймаут ожидания соединения
             pool_recycle=3600,  # Переиспользование соединений через час
             pool_pre_ping=True,  # Проверка соединения перед использованием
@@ -49,6 +83,21 @@ def initialize_database():
         SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
         # Важно: НЕ вызываем create_all здесь. Миграции должны управляться отдельно.
         # Base.metadata.create_all(bind=engine) 
+
+    if async_engine is None:
+        # Отдельный пул для async-эндпоинтов: 8 workers × (5+5) = 80 дополнительных соединений
+        async_url, async_connect_args = _to_async_url(db_settings.DATABASE_URL)
+        async_engine = create_async_engine(
+            async_url,
+            pool_size=int(os.getenv("ASYNC_DB_POOL_SIZE", "5")),
+            max_overflow=int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "5")),
+            pool_timeout=30,
+            pool_recycle=3600,
+            pool_pre_ping=True,
+            connect_args=async_connect_args,
+        )
+        # expire_on_commit=False: после commit объекты остаются читаемыми без ленивого IO
+        AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
     
     # Инициализация AI Database (pgvector)
     if ai_engine is None and db_settings.AI_DATABASE_URL:
@@ -92,6 +141,23 @@ def get_db_session() -> Generator[Session, None, None]:
         db.close()
 
 
+async def get_async_db_session() -> AsyncGenerator[AsyncSession, None]:
+    """FastAPI dependency to get an async DB session (asyncpg)."""
+    if AsyncSessionLocal is None:
+        raise RuntimeError("Async database session factory not initialized.")
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def dispose_async_engine() -> None:
+    """Закрывает пул async engine при остановке приложения."""
+    global async_engine, AsyncSessionLocal
+    if async_engine is not None:
+        await async_engine.dispose()
+        async_engine = None
+        AsyncSessionLocal = None
+
+
 def get_ai_db_session() -> Generator[Session, None, None]:
     """FastAPI dependency to get an AI Database session (pgvector)."""
     if AISessionLocal is None:
@@ -6,6 +6,12 @@ from .setup import SetupStatus
 from ..database import Base
 from sqlalchemy.sql import func
 
+
+def utcnow_naive() -> datetime:
+    """Текущее время UTC без tzinfo: колонки DateTime — timestamp without time zone, asyncpg не принимает aware."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class AreaDB(Base):
     __tablename__ = "areas"
 
@@ -14,7 +20,7 @@ class AreaDB(Base):
     code = Column(String(255), nullable=True)
     is_active = Column(Boolean, default=True, nullable=False)
     bot_row_size = Column(Integer, default=4, nullable=False)  # Кол-во станков в ряду в TG-боте (2-6)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    created_at = Column(DateTime, default=utcnow_naive, nullable=False)
 
     machines = relationship("MachineDB", back_populates="area")
 
@@ -27,7 +33,7 @@ class MachineDB(Base):
     min_diameter = Column(Float, nullable=True)
     max_diameter = Column(Float, nullable=True)
     max_bar_length = Column(Float, nullable=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow_naive)
     is_active = Column(Boolean, default=True)
     is_operational = Column(Boolean, default=True)  # False = поломан/на обслуживании
     location_id = Column(Integer, ForeignKey("areas.id"), nullable=False)
@@ -55,7 +61,7 @@ class EmployeeDB(Base):
     username = Column(String(255))
     role_id = Column(Integer)
     factory_number = Column(String(50), nullable=True, unique=True)  # Заводской номер оператора
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow_naive)
     added_by = Column(Integer)
     is_active = Column(Boolean, default=True)
     whatsapp_phone = Column(String(20), nullable=True)  # WhatsApp номер для уведомлений
@@ -93,7 +99,7 @@ class PartDB(Base):
     profile_type = Column(String(20), nullable=True, default='round')
     part_length = Column(Float, nullable=True)
     drawing_url = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow_naive)
     avg_cycle_time = Column(Integer, nullable=True)
     pinned_machine_id = Column(Integer, ForeignKey("machines.id"), nullable=True)
 
@@ -110,7 +116,7 @@ class LotDB(Base):
     id = Column(Integer, primary_key=True, index=True)
     lot_number = Column(String(255))
     part_id = Column(Integer, ForeignKey("parts.id"))
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow_naive)
     # is_active = Column(Boolean, default=True)
 
     # Новые поля, добавленные ранее:
@@ -146,7 +152,7 @@ class SetupDB(Base):
     machine_id = Column(Integer, ForeignKey("machines.id"))
     start_time = Column(DateTime)
     end_time = Column(DateTime)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow_naive)
     planned_quantity = Column(Integer)
     status = Column(String(50))
     cycle_time = Column(Integer)
@@ -164,6 +170,12 @@ class SetupDB(Base):
     machine = relationship("MachineDB")
     operator = relationship("EmployeeDB", foreign_keys=[employee_id])
 
+    # Индексы создаются миграцией 056 (CONCURRENTLY)
+    __table_args__ = (
+        Index('idx_setup_jobs_machine_status_open', 'machine_id', 'status', postgresql_where=end_time.is_(None)),
+        Index('idx_setup_jobs_lot_id', 'lot_id'),
+    )
+
 class BatchDB(Base):
     __tablename__ = "batches"
 
@@ -184,7 +196,7 @@ class BatchDB(Base):
     warehouse_employee_id = Column(Integer, ForeignKey("employees.id"), nullable=True)
     qc_inspector_id = Column(Integer, ForeignKey("employees.id"), nullable=True)
 
-    batch_time = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    batch_time = Column(DateTime, default=utcnow_naive)
     warehouse_received_at = Column(DateTime, nullable=True)
     qa_date = Column(DateTime, nullable=True)
     
@@ -195,8 +207,8 @@ class BatchDB(Base):
     discrepancy_percentage = Column(Float, nullable=True) 
     admin_acknowledged_discrepancy = Column(Boolean, default=False, nullable=False)
 
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow_naive)
+    updated_at = Column(DateTime, default=utcnow_naive, onupdate=utcnow_naive)
 
     # Связи
     lot = relationship("LotDB", back_populates="batches")
@@ -211,6 +223,13 @@ class BatchDB(Base):
     # Добавляем связь с карточкой
     card = relationship("CardDB", back_populates="batch", uselist=False)
 
+    # Индексы создаются миграцией 056 (CONCURRENTLY)
+    __table_args__ = (
+        Index('idx_batches_lot_location', 'lot_id', 'current_location'),
+        Index('idx_batches_warehouse_received_at', 'warehouse_received_at',
+              postgresql_where=warehouse_received_at.isnot(None)),
+    )
+
 class SetupDefectDB(Base):
     __tablename__ = "setup_defects"
 
@@ -219,7 +238,7 @@ class SetupDefectDB(Base):
     defect_quantity = Column(Integer, nullable=True)
     defect_reason = Column(String, nullable=True)
     employee_id = Column(Integer, ForeignKey("employees.id"), nullable=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow_naive)
 
     setup_job = relationship("SetupDB", foreign_keys=[setup_job_id])
     employee = relationship("EmployeeDB", foreign_keys=[employee_id])
@@ -229,7 +248,7 @@ class SetupQuantityAdjustmentDB(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     setup_job_id = Column(Integer, ForeignKey("setup_jobs.id"), nullable=True, unique=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow_naive)
     created_by = Column(Integer, ForeignKey("employees.id"), nullable=True)
     auto_adjustment = Column(Integer, nullable=True)
     manual_adjustment = Column(Integer, nullable=True)
@@ -245,7 +264,14 @@ class ReadingDB(Base):
     machine_id = Column(Integer, ForeignKey("machines.id"))
     reading = Column(Integer)
     setup_job_id = Column(Integer, ForeignKey("setup_jobs.id"), nullable=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow_naive)
+
+    # Индексы создаются миграцией 056 (CONCURRENTLY)
+    __table_args__ = (
+        Index('idx_machine_readings_machine_created', 'machine_id', 'created_at'),
+        Index('idx_machine_readings_setup_created', 'setup_job_id', 'created_at',
+              postgresql_where=setup_job_id.isnot(None)),
+    )
 
 class CardDB(Base):
     """Модель для пластиковых карточек операторов"""
@@ -274,7 +300,7 @@ class MaterialTypeDB(Base):
     material_name = Column(String(100), unique=True, nullable=False)
     density_kg_per_m3 = Column(Float, nullable=False)
     description = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow_naive)
 
 class LotMaterialDB(Base):
     __tablename__ = "lot_materials"
@@ -311,7 +337,7 @@ class LotMaterialDB(Base):
     material_low_notified_at = Column(DateTime, nullable=True)
     closed_at = Column(DateTime, nullable=True)  # Дата закрытия записи кладовщиком
     closed_by = Column(Integer, ForeignKey("employees.id", ondelete="SET NULL"), nullable=True)  # Кто закрыл
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow_naive)
 
     lot = relationship("LotDB", back_populates="lot_materials")
     machine = relationship("MachineDB", back_populates="lot_materials")
@@ -345,9 +371,9 @@ class MaterialOperationDB(Base):
     facing_allowance_mm = Column(Float, nullable=True)
     min_remainder_mm = Column(Float, nullable=True)
     performed_by = Column(Integer, ForeignKey("employees.id", ondelete="SET NULL"), nullable=True)
-    performed_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    performed_at = Column(DateTime, default=utcnow_naive)
     notes = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = Column(DateTime, default=utcnow_naive)
 
     # Отношения
     lot_material = relationship("LotMaterialDB", back_populates="operations")
@@ -389,7 +415,7 @@ class MaterialBatchDB(Base):
     preferred_drawing = Column(Text, nullable=True)
     status = Column(String, nullable=False, default="active")
     created_by = Column(Integer, ForeignKey("employees.id", ondelete="SET NULL"), nullable=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    created_at = Column(DateTime, default=utcnow_naive, nullable=False)
     parent_batch_id = Column(String, ForeignKey("material_batches.batch_id", ondelete="SET NULL"), nullable=True)
 
     creator = relationship("EmployeeDB", foreign_keys=[created_by])
@@ -408,7 +434,7 @@ class MaterialGroupDB(Base):
     name = Column(String, nullable=False)
     density_kg_m3 = Column(Numeric(10, 3), nullable=True)
     is_active = Column(Boolean, default=True, nullable=False)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    created_at = Column(DateTime, default=utcnow_naive, nullable=False)
 
     subgroups = relationship("MaterialSubgroupDB", back_populates="group")
 
@@ -423,7 +449,7 @@ class MaterialSubgroupDB(Base):
     name = Column(String, nullable=False)
     density_kg_m3 = Column(Numeric(10, 3), nullable=True)
     is_active = Column(Boolean, default=True, nullable=False)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    created_at = Column(DateTime, default=utcnow_naive, nullable=False)
 
     group = relationship("MaterialGroupDB", back_populates="subgroups")
 
@@ -437,7 +463,7 @@ class StorageLocationDB(Base):
     type = Column(String, nullable=False)
     capacity = Column(Integer, nullable=True)
     status = Column(String, nullable=False, default="active")
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    created_at = Column(DateTime, default=utcnow_naive, nullable=False)
 
 
 class StorageLocationSegmentDB(Base):
@@ -449,7 +475,7 @@ class StorageLocationSegmentDB(Base):
     name = Column(String, nullable=False)
     sort_order = Column(Integer, default=0)
     is_active = Column(Boolean, default=True, nullable=False)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    created_at = Column(DateTime, default=utcnow_naive, nullable=False)
 
 
 class InventoryPositionDB(Base):
@@ -459,7 +485,7 @@ class InventoryPositionDB(Base):
     batch_id = Column(String, ForeignKey("material_batches.batch_id", ondelete="CASCADE"), primary_key=True)
     location_code = Column(String, ForeignKey("storage_locations.code", ondelete="RESTRICT"), primary_key=True)
     quantity = Column(Integer, nullable=False, default=0)
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    updated_at = Column(DateTime, default=utcnow_naive, nullable=False)
 
     batch = relationship("MaterialBatchDB")
     location = relationship("StorageLocationDB")
@@ -479,7 +505,7 @@ class WarehouseMovementDB(Base):
     related_machine_id = Column(Integer, ForeignKey("machines.id", ondelete="SET NULL"), nullable=True)
     cut_factor = Column(Integer, nullable=True)
     performed_by = Column(Integer, ForeignKey("employees.id", ondelete="SET NULL"), nullable=True)
-    performed_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    performed_at = Column(DateTime, default=utcnow_naive, nullable=False)
     notes = Column(Text, nullable=True)
 
     batch = relationship("MaterialBatchDB")
@@ -496,4 +522,4 @@ class StoppageReasonDB(Base):
     name_ru = Column(Text, nullable=False)
     name_en = Column(Text, nullable=False)
     is_active = Column(Boolean, default=True, nullable=False)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
\ No newline at end of file
+    created_at = Column(DateTime, default=utcnow_naive, nullable=False)
\ No newline at end of file
@@ -10,8 +10,10 @@ from sqlalchemy import func
 
 # Относительные импорты для доступа к моделям и сессии БД
 from ..database import get_db_session
+from ..utils.sync_db_offload import SyncDBOffloadRoute
 from ..models.models import MachineDB, CardDB, SetupDB, LotDB, PartDB, EmployeeDB, BatchDB
-from ..services.mtconnect_client import reset_counter_on_qa_approval
+from ..services import outbox
+from ..services.cache_invalidation import notify_change
 from ..services.telegram_client import send_telegram_message
 from ..services.whatsapp_client import send_whatsapp_to_all_enabled_roles, WHATSAPP_ENABLED
 from ..services.setup_program_handover import check_setup_program_handover_gate, ensure_setup_program_handover_row
@@ -22,7 +24,8 @@ logger = logging.getLogger(__name__)
 # Создание экземпляра роутера
 router = APIRouter(
     prefix="/admin",
-    tags=["Admin Tools"]
+    tags=["Admin Tools"],
+    route_class=SyncDBOffloadRoute,
 )
 
 class ResetCardsPayload(BaseModel):
@@ -318,6 +321,8 @@ async def transfer_setup(setup_id: int, payload: TransferSetupPayload, db: Sessi
                 if lot.status in ("new", "assigned"):
                     lot.status = "in_production"
 
+        # Исходная наладка завершена: кэши operator-view, дашборд и история чертежей
+        notify_change(db, "setup_completed", machine_id=setup.machine_id, lot_id=setup.lot_id, setup_id=setup.id)
         db.commit()
         db.refresh(target_setup)
         return {
@@ -440,28 +445,13 @@ async def approve_setup(setup_id: int, payload: ApproveSetupPayload, db: Session
         setup.status = 'allowed'
         setup.qa_id = payload.qa_id
         setup.qa_date = datetime.now()
-        db.commit()
 
-        # Получаем имя станка для сброса счётчика MTConnect
+        # Сброс счётчика MTConnect и уведомления — через outbox в той же транзакции
         machine = db.query(MachineDB.name).filter(MachineDB.id == setup.machine_id).scalar()
-        
-        # Сбрасываем счётчик MTConnect на 0 при разрешении ОТК
         if machine:
-            try:
-                await reset_counter_on_qa_approval(machine)
-            except Exception as mtc_error:
-                logger.warning(f"MTConnect counter reset failed (non-critical): {mtc_error}")
-
-        # Отправляем уведомление через встроенный QC роутер (локально внутри сервиса)
-        try:
-            # Импортируем здесь, чтобы избежать циклических импортов на уровне модуля
-            from .qc import notify_setup_allowed, NotifyRequest
-            # Вызовем хендлер напрямую, передав сессию
-            req = NotifyRequest(setup_id=setup.id)
-            # notify_setup_allowed — async; вызовем и проигнорируем ошибки, чтобы не ломать approve
-            await notify_setup_allowed(req, db)
-        except Exception as notify_err:
-            logger.warning(f"Approve ok, но уведомление не отправлено: {notify_err}")
+            outbox.enqueue(db, "mtconnect_counter_reset", {"machine_name": machine, "setup_id": setup.id})
+        outbox.enqueue(db, "qc_setup_allowed", {"setup_id": setup.id})
+        db.commit()
 
         return {"success": True, "status": setup.status}
     except HTTPException:
@@ -21,6 +21,7 @@ import json
 import httpx
 
 from src.database import get_ai_db_session, is_ai_database_available, get_db_session
+from src.utils.sync_db_offload import SyncDBOffloadRoute
 
 # Path to schema documentation
 SCHEMA_DOCS_PATH = Path(__file__).parent.parent / "text2sql" / "docs" / "schema_docs.md"
@@ -29,7 +30,7 @@ SCHEMA_DOCS_PATH = Path(__file__).parent.parent / "text2sql" / "docs" / "schema_
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 EMBEDDING_MODEL = "text-embedding-3-small"
 
-router = APIRouter(prefix="/ai", tags=["AI Assistant"])
+router = APIRouter(prefix="/ai", tags=["AI Assistant"], route_class=SyncDBOffloadRoute)
 
 
 # ============================================================================
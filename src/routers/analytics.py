@@ -12,12 +12,13 @@ from typing import List, Optional
 from datetime import datetime, timezone
 
 from ..database import get_db_session
+from ..utils.sync_db_offload import SyncDBOffloadRoute
 from ..models.models import LotDB, PartDB, SetupDB, BatchDB, EmployeeDB, MachineDB, AreaDB
 from ..models.reports import LotDetailReport
 from ..services.metrics import aggregates_for_lots, planned_resolved
 
 logger = logging.getLogger(__name__)
-router = APIRouter(tags=["Analytics"])
+router = APIRouter(tags=["Analytics"], route_class=SyncDBOffloadRoute)
 
 @router.get("/lots/{lot_id}/analytics", response_model=LotDetailReport)
 async def get_lot_analytics(lot_id: int, db: Session = Depends(get_db_session)):
@@ -266,16 +267,31 @@ async def lots_overview(
             produced_rows = db.execute(
                 text(
                     """
-                    SELECT sj.lot_id AS lot_id, mr.reading AS reading
-                    FROM machine_readings mr
-                    JOIN setup_jobs sj ON mr.setup_job_id = sj.id
-                    WHERE sj.lot_id IN :lot_ids
-                      AND mr.created_at = (
-                        SELECT max(mr2.created_at)
-                        FROM machine_readings mr2
-                        JOIN setup_jobs sj2 ON mr2.setup_job_id = sj2.id
-                        WHERE sj2.lot_id = sj.lot_id
-                      )
+                    SELECT l.id AS lot_id, last_mr.reading AS reading
+                    FROM lots l
+                    -- Лот сейчас на станке: последнее показание из machine_last_reading
+                    LEFT JOIN LATERAL (
+                        SELECT mlr.reading, mlr.created_at
+                        FROM setup_jobs sj
+                        JOIN machine_last_reading mlr
+                          ON mlr.machine_id = sj.machine_id AND mlr.setup_job_id = sj.id
+                        WHERE sj.lot_id = l.id
+                        ORDER BY mlr.created_at DESC
+                        LIMIT 1
+                    ) cur ON TRUE
+                    -- Иначе (лот завершён) — одно последнее показание из истории
+                    CROSS JOIN LATERAL (
+                        SELECT COALESCE(cur.reading, (
+                            SELECT mr.reading
+                            FROM setup_jobs sj
+                            JOIN machine_readings mr ON mr.setup_job_id = sj.id
+                            WHERE sj.lot_id = l.id
+                            ORDER BY mr.created_at DESC
+                            LIMIT 1
+                        )) AS reading
+                    ) last_mr
+                    WHERE l.id IN :lot_ids
+                      AND last_mr.reading IS NOT NULL
                     """
                 ).bindparams(bindparam('lot_ids', expanding=True)),
                 { 'lot_ids': lot_ids }
@@ -6,9 +6,11 @@ from sqlalchemy import func
 from datetime import datetime
 
 from src.database import get_db_session
+from src.utils.sync_db_offload import SyncDBOffloadRoute
+from src.services.cache_invalidation import notify_change
 from src.models.models import AreaDB, MachineDB, SetupDB
 
-router = APIRouter(prefix="/catalog", tags=["Catalog"])
+router = APIRouter(prefix="/catalog", tags=["Catalog"], route_class=SyncDBOffloadRoute)
 
 
 # ======== Areas ========
@@ -205,6 +207,8 @@ async def create_machine(payload: MachineCreate, db: Session = Depends(get_db_se
         display_order=next_order,
     )
     db.add(item)
+    db.flush()
+    notify_change(db, "machines_changed", machine_id=item.id)
     db.commit()
     db.refresh(item)
     return item
@@ -239,6 +243,7 @@ async def update_machine(machine_id: int, payload: MachineUpdate, db: Session =
         item.is_active = payload.is_active
     # Игнорируем любые внешние попытки изменить display_order
     # (раскладка сетки отключена, порядок задаётся только при создании или переносе зоны)
+    notify_change(db, "machines_changed", machine_id=machine_id)
     db.commit()
     db.refresh(item)
     return item
@@ -258,6 +263,7 @@ async def delete_machine(machine_id: int, db: Session = Depends(get_db_session))
     if active_setup:
         raise HTTPException(status_code=409, detail="Machine has active or queued setups. Deactivate instead.")
     db.delete(item)
+    notify_change(db, "machines_changed", machine_id=machine_id)
     db.commit()
     return {"success": True}
 
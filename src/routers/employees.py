@@ -5,9 +5,10 @@ from sqlalchemy import func
 from typing import List, Optional
 
 from src.database import get_db_session
+from src.utils.sync_db_offload import SyncDBOffloadRoute
 from src.models.models import EmployeeDB, AreaDB, EmployeeAreaRoleDB
 
-router = APIRouter(prefix="/employees", tags=["Employees"])
+router = APIRouter(prefix="/employees", tags=["Employees"], route_class=SyncDBOffloadRoute)
 
 
 class DefaultAreaPayload(BaseModel):
@@ -0,0 +1,57 @@
+"""
+Диагностика воркера: /health/*.
+
+Фоновые очереди и кэши живут в каждом uvicorn worker отдельно — ответы
+относятся к worker, принявшему запрос. Базовый /health для мониторинга — в src/main.py.
+"""
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from src.database import get_db_session
+from src.services import outbox
+from src.services.leader_election import get_leader
+from src.services.mtconnect_client import get_counter_sync_queue
+from src.services.mtconnect_snapshot import get_mtconnect_snapshot
+from src.utils.sheets_handler import get_sheets_writer
+from src.utils.sync_db_offload import SyncDBOffloadRoute, get_loop_block_stats, get_offload_pool_status
+
+router = APIRouter(prefix="/health", tags=["Health"], route_class=SyncDBOffloadRoute)
+
+
+@router.get("/loop-blocking")
+async def loop_blocking_stats():
+    """Сколько времени каждый роут держал event loop (и сколько выполнялся в пуле потоков)."""
+    return {
+        "pool": get_offload_pool_status(),
+        "routes": get_loop_block_stats(),
+    }
+
+
+@router.get("/leader")
+async def leader_status():
+    """Какой worker выполняет фоновые singleton-задачи (коллектор, супервизор, планировщик)."""
+    return get_leader().status()
+
+
+@router.get("/mtconnect")
+async def mtconnect_snapshot_status():
+    """Состояние общего снимка MTConnect в этом worker (возраст, число запросов, ошибка)."""
+    return get_mtconnect_snapshot().status()
+
+
+@router.get("/mtconnect/counter-sync")
+async def mtconnect_counter_sync_status():
+    """Очередь синхронизации счётчиков MTConnect в этом worker: глубина и состояние по станкам."""
+    return get_counter_sync_queue().status()
+
+
+@router.get("/outbox")
+async def outbox_status(db: Session = Depends(get_db_session)):
+    """Outbox: очереди по назначениям (pending/processing/dead) и счётчики диспетчера этого worker."""
+    return outbox.get_outbox_dispatcher().status(db)
+
+
+@router.get("/sheets")
+async def sheets_writer_status():
+    """Состояние очереди записи в Google Sheets в этом worker."""
+    return get_sheets_writer().status()
@@ -13,13 +13,14 @@ from datetime import datetime
 import logging
 
 from ..database import get_db_session
+from ..utils.sync_db_offload import SyncDBOffloadRoute
 
 # Импортируем модели из models.py
 from ..models.models import LotDB, SetupDB, BatchDB
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/lots-management", tags=["Lots Management"])
+router = APIRouter(prefix="/lots-management", tags=["Lots Management"], route_class=SyncDBOffloadRoute)
 
 # Pydantic модели для редактирования лотов
 from pydantic import BaseModel, Field
@@ -0,0 +1,150 @@
+"""
+Станки: время наладок за смену сразу по нескольким станкам.
+
+Остальные эндпоинты /machines пока в src/main.py.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from src.database import get_db_session
+from src.services.machine_resolver import get_machine_index
+from src.utils.sync_db_offload import SyncDBOffloadRoute
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/machines", tags=["Machines"], route_class=SyncDBOffloadRoute)
+
+
+class SetupTimeBulkRequest(BaseModel):
+    shift_start: str = Field(..., description="Начало смены ISO формат")
+    shift_end: str = Field(..., description="Конец смены ISO формат")
+    machine_names: Optional[List[str]] = Field(None, description="Станки (любой формат имени); по умолчанию все активные")
+
+
+# Те же правила, что в /machines/shift-setup-time и /machines/hourly-setup-time, одним запросом:
+# наладка длится от created_at до qa_date (или start_time), а в статусе created/pending_qc — до сейчас.
+# Все даты приводятся к naive UTC (qa_date хранится как timestamptz).
+_SETUP_TIME_BULK_SQL = text("""
+    WITH sj AS (
+        SELECT machine_id, status, created_at, start_time,
+               qa_date AT TIME ZONE 'UTC' AS qa_date
+        FROM setup_jobs
+        WHERE machine_id = ANY(:machine_ids)
+    ),
+    matched AS (
+        SELECT machine_id,
+               GREATEST(COALESCE(created_at, :start_dt), :start_dt) AS seg_start,
+               CASE
+                   WHEN status IN ('created', 'pending_qc') THEN :now_dt
+                   WHEN qa_date IS NOT NULL THEN qa_date
+                   ELSE start_time
+               END AS end_point
+        FROM sj
+        WHERE (created_at >= :start_dt AND created_at <= :end_dt)
+           OR (qa_date >= :start_dt AND qa_date <= :end_dt)
+           OR (start_time >= :start_dt AND start_time <= :end_dt)
+           OR (created_at < :start_dt AND status IN ('created', 'pending_qc') AND qa_date IS NULL)
+           OR (created_at < :start_dt AND (qa_date >= :start_dt OR start_time >= :start_dt))
+    ),
+    counts AS (
+        SELECT machine_id, COUNT(*) AS setup_count
+        FROM matched
+        GROUP BY machine_id
+    ),
+    segments AS (
+        SELECT machine_id, seg_start, LEAST(end_point, :end_dt) AS seg_end
+        FROM matched
+        WHERE end_point IS NOT NULL
+    ),
+    hours AS (
+        SELECT generate_series(
+            date_trunc('hour', CAST(:start_dt AS timestamp)),
+            CAST(:end_dt AS timestamp) - interval '1 microsecond',
+            interval '1 hour'
+        ) AS hour_start
+    ),
+    hourly AS (
+        SELECT s.machine_id, h.hour_start,
+               SUM(EXTRACT(EPOCH FROM LEAST(s.seg_end, h.hour_start + interval '1 hour')
+                                     - GREATEST(s.seg_start, h.hour_start))) AS setup_sec
+        FROM segments s
+        JOIN hours h ON h.hour_start < s.seg_end AND h.hour_start + interval '1 hour' > s.seg_start
+        WHERE s.seg_end > s.seg_start
+        GROUP BY s.machine_id, h.hour_start
+    )
+    SELECT c.machine_id, c.setup_count, hr.hour_start, hr.setup_sec
+    FROM counts c
+    LEFT JOIN hourly hr ON hr.machine_id = c.machine_id
+""")
+
+
+@router.post("/setup-time/bulk")
+async def get_machines_setup_time_bulk(payload: SetupTimeBulkRequest, db: Session = Depends(get_db_session)):
+    """
+    Время наладок за смену сразу по всем станкам: суммарно и по часам.
+    Заменяет пару вызовов shift-setup-time + hourly-setup-time на каждый станок.
+    """
+    try:
+        try:
+            start_dt = datetime.fromisoformat(payload.shift_start.replace('Z', '+00:00')).replace(tzinfo=None)
+            end_dt = datetime.fromisoformat(payload.shift_end.replace('Z', '+00:00')).replace(tzinfo=None)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid date format: {e}")
+
+        index = get_machine_index(db)
+        if payload.machine_names is None:
+            requested = [(m.name, m.id) for m in index.active()]
+        else:
+            requested = [(name, index.resolve(name)) for name in payload.machine_names]
+        machine_ids = sorted({machine_id for _, machine_id in requested if machine_id is not None})
+
+        # Часы смены в том же порядке, что и в /machines/hourly-setup-time
+        shift_hours = []
+        current_hour = start_dt.replace(minute=0, second=0, microsecond=0)
+        while current_hour < end_dt:
+            shift_hours.append(current_hour.hour)
+            current_hour += timedelta(hours=1)
+
+        setup_counts: Dict[int, int] = {}
+        hourly_sec: Dict[int, Dict[int, float]] = {}
+        if machine_ids and end_dt > start_dt:
+            rows = db.execute(_SETUP_TIME_BULK_SQL, {
+                "machine_ids": machine_ids,
+                "start_dt": start_dt,
+                "end_dt": end_dt,
+                "now_dt": datetime.now(timezone.utc).replace(tzinfo=None),
+            }).fetchall()
+            for row in rows:
+                setup_counts[row.machine_id] = row.setup_count
+                if row.hour_start is not None:
+                    by_hour = hourly_sec.setdefault(row.machine_id, {})
+                    by_hour[row.hour_start.hour] = by_hour.get(row.hour_start.hour, 0.0) + float(row.setup_sec or 0)
+
+        machines = []
+        for name, machine_id in requested:
+            by_hour = hourly_sec.get(machine_id, {})
+            machines.append({
+                "machine_name": name,
+                "machine_id": machine_id,
+                "setup_time_sec": int(sum(by_hour.values())),
+                "setup_count": setup_counts.get(machine_id, 0),
+                "hourly": [{"hour": h, "setup_sec": int(by_hour.get(h, 0))} for h in shift_hours],
+            })
+
+        return {
+            "shift_start": payload.shift_start,
+            "shift_end": payload.shift_end,
+            "machines": machines,
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка при получении bulk времени наладок: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Ошибка: {str(e)}")
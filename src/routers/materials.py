@@ -7,7 +7,6 @@
 """
 import logging
 import os
-import httpx
 import asyncio
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session, joinedload
@@ -31,6 +30,8 @@ from src.models.models import (
     MaterialSubgroupDB,
 )
 from src.services.notification_service import send_material_low_notification
+from src.services.machine_resolver import machine_key
+from src.services.mtconnect_snapshot import get_mtconnect_snapshot
 from datetime import datetime, timezone, timedelta
 
 logger = logging.getLogger(__name__)
@@ -112,17 +113,6 @@ def _calculate_bars_needed(
     return int(math.ceil(quantity_parts / parts_per_bar))
 
 
-def _normalize_machine_name(name: Optional[str]) -> str:
-    if not name:
-        return ""
-    normalized = name
-    if normalized.startswith('M_') and '_' in normalized[2:]:
-        parts = normalized.split('_', 2)
-        if len(parts) >= 3:
-            normalized = parts[2]
-    return normalized.replace('_', '-').upper()
-
-
 def _get_source_batch_for_lot_material(
     *,
     db: Session,
@@ -224,25 +214,8 @@ def _apply_warehouse_return_sync(
 
 
 def _fetch_mtconnect_counts() -> dict:
-    mtconnect_api_url = os.getenv('MTCONNECT_API_URL', 'https://mtconnect-core-production.up.railway.app')
-    counts: dict[str, Optional[int]] = {}
-    try:
-        with httpx.Client(timeout=5.0) as client:
-            response = client.get(f"{mtconnect_api_url}/api/machines")
-            if response.status_code != 200:
-                return counts
-            data = response.json()
-            all_machines = []
-            if data.get('machines', {}).get('mtconnect'):
-                all_machines.extend(data['machines']['mtconnect'])
-            if data.get('machines', {}).get('adam'):
-                all_machines.extend(data['machines']['adam'])
-            for m in all_machines:
-                name = _normalize_machine_name(m.get('name', ''))
-                counts[name] = m.get('data', {}).get('displayPartCount')
-    except Exception as e:
-        logger.warning(f"MTConnect API unavailable: {e}")
-    return counts
+    """{нормализованное имя станка: displayPartCount} из общего снимка MTConnect (без HTTP на каждый запрос)."""
+    return get_mtconnect_snapshot().get_sync().part_counts()
 
 
 def _get_produced_for_lot(
@@ -267,8 +240,7 @@ def _get_produced_for_lot(
 
     produced = None
     if machine_name:
-        normalized = _normalize_machine_name(machine_name)
-        produced = mtconnect_counts.get(normalized)
+        produced = mtconnect_counts.get(machine_key(machine_name))
 
     if produced is None:
         return None
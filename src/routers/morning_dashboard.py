@@ -11,12 +11,13 @@ import os
 import httpx
 
 from ..database import get_db_session
+from ..utils.sync_db_offload import SyncDBOffloadRoute
 from ..models.models import LotDB, BatchDB, SetupDB, MachineDB
 
 import logging
 logger = logging.getLogger(__name__)
 
-router = APIRouter(tags=["Morning Dashboard"])
+router = APIRouter(tags=["Morning Dashboard"], route_class=SyncDBOffloadRoute)
 
 # URL израматского дашборда для вызова API morning-report
 _dashboard_url = os.getenv("ISRAMAT_DASHBOARD_URL", "http://localhost:3000")
@@ -24,10 +24,11 @@ from sqlalchemy import text
 from sqlalchemy.orm import Session
 
 from ..database import get_db_session
+from ..utils.sync_db_offload import SyncDBOffloadRoute
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/nc-programs", tags=["NC Programs"])
+router = APIRouter(prefix="/nc-programs", tags=["NC Programs"], route_class=SyncDBOffloadRoute)
 
 # IMPORTANT (Railway Volume):
 # Drawings are stored on a Volume mounted at /app/drawings.
@@ -11,9 +11,10 @@ from sqlalchemy import text
 from pydantic import BaseModel
 
 from src.database import get_db_session
+from src.utils.sync_db_offload import SyncDBOffloadRoute
 
 logger = logging.getLogger(__name__)
-router = APIRouter(prefix="/admin/notifications", tags=["Notification Settings"])
+router = APIRouter(prefix="/admin/notifications", tags=["Notification Settings"], route_class=SyncDBOffloadRoute)
 
 
 class NotificationSettingResponse(BaseModel):
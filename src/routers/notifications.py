@@ -9,13 +9,14 @@ from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 from src.database import get_db_session
+from src.utils.sync_db_offload import SyncDBOffloadRoute
 from src.services.whatsapp_client import (
     send_whatsapp_to_role,
     send_whatsapp_to_all_enabled_roles,
 )
 
 logger = logging.getLogger(__name__)
-router = APIRouter(prefix="/notifications", tags=["Notifications"])
+router = APIRouter(prefix="/notifications", tags=["Notifications"], route_class=SyncDBOffloadRoute)
 
 
 ROLE_NAME_TO_ID = {
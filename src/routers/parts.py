@@ -0,0 +1,89 @@
+"""
+Детали: статистика времени цикла (part_cycle_stats, миграция 061).
+
+PART_CYCLE_STATS_SQL читают и эндпоинты лотов /lots/{lot_id}/cycle-time*
+в src/main.py; остальные эндпоинты /parts пока там же.
+"""
+import logging
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from src.database import get_db_session
+from src.utils.sync_db_offload import SyncDBOffloadRoute
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/parts", tags=["Parts"], route_class=SyncDBOffloadRoute)
+
+# Статистика времени цикла детали: одна строка part_cycle_stats (поддерживается триггером, миграция 061)
+PART_CYCLE_STATS_SQL = """
+    SELECT
+        p.id AS part_id,
+        p.avg_cycle_time AS part_avg_cycle_time,
+        s.setups_count, s.avg_cycle_time, s.min_cycle_time, s.p50_cycle_time, s.p90_cycle_time,
+        s.updated_at,
+        m.name AS min_machine_name,
+        e.full_name AS min_machinist_name
+    FROM parts p
+    LEFT JOIN part_cycle_stats s ON s.part_id = p.id
+    LEFT JOIN machines m ON m.id = s.best_machine_id
+    LEFT JOIN employees e ON e.id = s.best_machinist_id
+"""
+
+
+PART_CYCLE_STATS_MAX_PARTS = 2000
+
+
+@router.post("/cycle-stats")
+async def get_multiple_part_cycle_stats(part_ids: List[int], db: Session = Depends(get_db_session)):
+    """
+    BULK: статистика времени цикла для множества деталей одним запросом (Kanban, модалки лотов).
+    Читает по одной строке part_cycle_stats на деталь.
+    
+    Returns:
+        Dict[str, dict]: {part_id: {
+            "avg_cycle_time": int | null,      # parts.avg_cycle_time (для новых деталей — оценка)
+            "history_avg_cycle_time": int | null,
+            "min_cycle_time": int | null,
+            "p50_cycle_time": int | null,
+            "p90_cycle_time": int | null,
+            "min_machine_name": str | null,
+            "min_machinist_name": str | null,
+            "total_historical_setups": int,
+            "is_estimated": bool,
+            "updated_at": datetime | null
+        }}
+        Несуществующие детали в ответ не попадают.
+    """
+    if not part_ids:
+        return {}
+    if len(part_ids) > PART_CYCLE_STATS_MAX_PARTS:
+        raise HTTPException(status_code=400, detail=f"Не более {PART_CYCLE_STATS_MAX_PARTS} деталей за запрос")
+    try:
+        rows = db.execute(
+            text(PART_CYCLE_STATS_SQL + " WHERE p.id = ANY(CAST(:part_ids AS integer[]))"),
+            {"part_ids": sorted(set(part_ids))}
+        ).fetchall()
+        
+        return {
+            str(r.part_id): {
+                "avg_cycle_time": r.part_avg_cycle_time,
+                "history_avg_cycle_time": r.avg_cycle_time,
+                "min_cycle_time": r.min_cycle_time,
+                "p50_cycle_time": r.p50_cycle_time,
+                "p90_cycle_time": r.p90_cycle_time,
+                "min_machine_name": r.min_machine_name,
+                "min_machinist_name": r.min_machinist_name,
+                "total_historical_setups": r.setups_count or 0,
+                "is_estimated": not r.setups_count,
+                "updated_at": r.updated_at
+            }
+            for r in rows
+        }
+        
+    except Exception as e:
+        logger.error(f"Ошибка при получении статистики cycle_time для деталей: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Ошибка при получении статистики cycle_time: {str(e)}")
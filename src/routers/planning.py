@@ -4,23 +4,39 @@
 from fastapi import APIRouter, Depends, Query, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from typing import Optional, List
-from pydantic import BaseModel
+from typing import Dict, Optional, List, Tuple
+from pydantic import BaseModel, Field
 from datetime import datetime, timedelta, timezone
 from ..database import get_db_session
+from ..utils.sync_db_offload import SyncDBOffloadRoute
+from ..services.machine_queue_snapshot import (
+    SETUP_TIME_NORMAL,
+    MachineQueue,
+    QueuedLot,
+    drawing_base,
+    get_machine_queue_snapshot,
+)
+from ..services.planning_scoring import (
+    HUGE_QUEUE_HOURS,
+    SAME_DIAMETER_TOLERANCE,
+    MachineArrays,
+    rank,
+    score_lots,
+)
+from ..services.queue_simulator import SimLot, simulate_assignment
+from ..services.drawing_history import get_drawing_history
 import logging
-import re
+
+import numpy as np
 
 logger = logging.getLogger(__name__)
-router = APIRouter(prefix="/planning", tags=["Planning"])
+router = APIRouter(prefix="/planning", tags=["Planning"], route_class=SyncDBOffloadRoute)
 
 # Константы для умных рекомендаций
 SLACK_THRESHOLD_DAYS = 3  # Порог запаса: если slack > 3 дней, лот можно сдвинуть
 MIN_QTY_FOR_TRANSFER = 100  # Минимальное количество для переноса на другой станок
 
-# Время переналадки
-SETUP_TIME_NORMAL = 12.0   # Переналадка на другую деталь (часы)
-SETUP_TIME_RELATED = 6.0   # Переналадка на родственную деталь (часы)
+# Время переналадки (SETUP_TIME_NORMAL / SETUP_TIME_RELATED) — в services/machine_queue_snapshot.py
 
 
 # ============ МОДЕЛИ ОТВЕТА ============
@@ -52,12 +68,10 @@ class RecommendationsResponse(BaseModel):
 
 
 # ============ КОНСТАНТЫ ВЕСОВ ============
+# W_HISTORY, W_SAME_DIAMETER, W_FREE_QUEUE, W_CAPABILITIES, W_RELATED_DRAWING — в services/planning_scoring.py
 
-W_HISTORY = 30           # Бонус за историю (делали раньше)
-W_SAME_DIAMETER = 10     # Бонус за тот же диаметр (без переналадки)
-W_FREE_QUEUE = 25        # Бонус за свободную очередь
-W_CAPABILITIES = 20      # Бонус за специальные возможности (JBS, etc)
-W_RELATED_DRAWING = 20   # Бонус за родственный чертёж в очереди
+RECOMMEND_TOP_N = 5
+RECOMMEND_BATCH_MAX_LOTS = 500
 
 
 # ============ DEBUG ENDPOINT ============
@@ -91,6 +105,191 @@ async def debug_machines(
     return {"diameter": diameter, "machines": machines}
 
 
+# ============ ОБЩИЕ ЧАСТИ РЕКОМЕНДАЦИЙ ============
+
+class LotCandidate(BaseModel):
+    """Новый лот, для которого подбираются станки"""
+    key: Optional[str] = Field(None, max_length=128, description="Ключ клиента, возвращается в ответе")
+    diameter: float = Field(..., description="Диаметр материала (мм)")
+    quantity: int = Field(..., description="Количество деталей")
+    due_days: int = Field(..., description="Дней до срока поставки")
+    cycle_time_sec: Optional[int] = Field(None, description="Время цикла (сек), если известно")
+    part_length: Optional[float] = Field(None, description="Длина детали (мм)")
+    part_id: Optional[int] = Field(None, description="ID детали")
+    drawing_number: Optional[str] = Field(None, description="Номер чертежа")
+
+class BatchRecommendRequest(BaseModel):
+    lots: List[LotCandidate] = Field(..., min_length=1, max_length=RECOMMEND_BATCH_MAX_LOTS)
+    top_n: int = Field(RECOMMEND_TOP_N, ge=1, le=50, description="Сколько станков вернуть на лот")
+
+class BatchLotRecommendations(RecommendationsResponse):
+    """Рекомендации для одного лота пачки (в порядке запроса)"""
+    index: int
+    key: Optional[str] = None
+
+class BatchRecommendationsResponse(BaseModel):
+    machines_considered: int
+    results: List[BatchLotRecommendations]
+
+
+def _load_history(db: Session, keys: List[Tuple[Optional[int], Optional[str]]]) -> List[Dict[int, int]]:
+    """
+    История изготовления для списка (part_id, drawing_number) из индекса истории
+    чертежей: machine_id → сколько завершённых наладок детали (по id ИЛИ по чертежу).
+    """
+    index = get_drawing_history(db)
+    return [index.times_made(part_id, drawing) for part_id, drawing in keys]
+
+
+def _related_in_queue(machines: List[MachineQueue], drawing_number: Optional[str]) -> Dict[int, QueuedLot]:
+    """
+    Родственные чертежи в очередях (для группировки похожих деталей):
+    machine_id → последний (по позиции) assigned-лот с тем же базовым чертежом.
+
+    Родственный чертёж = тот же базовый номер (например 1409-04-1 и 1409-04-2 → база 1409-04)
+    ВАЖНО: суффикс только ОДНА цифра! 577-42 это база, не 577!
+    """
+    related: Dict[int, QueuedLot] = {}
+    base_drawing = drawing_base(drawing_number)
+    if not base_drawing:
+        return related
+    # Ищем саму базу ИЛИ с суффиксом -N (одна цифра): у таких лотов та же база
+    # Например для 577-42-1: ищем 577-42 или 577-42-2, 577-42-3...
+    # Для 577-42: ищем 577-42-1, 577-42-2...
+    for m in machines:
+        for lot in reversed(m.lots):
+            if lot.status != 'assigned' or not lot.drawing_number or lot.drawing_number == drawing_number:
+                continue
+            if lot.drawing_number == base_drawing or lot.base_drawing == base_drawing:
+                related[m.machine_id] = lot
+                break
+    return related
+
+
+def _forecast(lot: LotCandidate) -> Optional[MachineForecast]:
+    """Прогноз к сроку (от станка не зависит: время цикла задано для детали)."""
+    if not lot.cycle_time_sec or lot.cycle_time_sec <= 0 or lot.quantity <= 0:
+        return None
+    available_seconds = lot.due_days * 24 * 3600
+    can_make = available_seconds // lot.cycle_time_sec
+    total_seconds = lot.quantity * lot.cycle_time_sec
+    return MachineForecast(
+        can_make_by_deadline=min(can_make, lot.quantity),
+        completion_rate=min(int(can_make * 100 / lot.quantity), 100),
+        days_for_full=round(total_seconds / (24 * 3600), 1)
+    )
+
+
+def _reasons(
+    m: MachineQueue,
+    lot: LotCandidate,
+    times_made: int,
+    related: Optional[QueuedLot],
+    forecast: Optional[MachineForecast],
+) -> List[str]:
+    """Объяснения score станка (те же слагаемые, что в planning_scoring.score_lots)."""
+    diameter = lot.diameter
+    reasons = [f"✅ Диаметр {diameter}мм подходит ({m.min_diameter or '?'}-{m.max_diameter or '?'})"]
+
+    if lot.part_length and m.max_part_length:
+        reasons.append(f"✅ Длина детали {lot.part_length}мм ≤ {m.max_part_length}мм")
+    elif lot.part_length:
+        reasons.append("✅ Без ограничения длины детали")
+
+    if times_made:
+        reasons.append(f"✅ Делали раньше ({times_made} раз)")
+    else:
+        reasons.append("🆕 Раньше не делали")
+
+    hours = m.queue_hours
+    if hours == 0:
+        reasons.append("✅ Свободен")
+    elif hours < 24:
+        reasons.append(f"⚡ Очередь: {hours:.0f}ч")
+    elif hours < 72:
+        reasons.append(f"⏳ Очередь: {hours:.0f}ч")
+    elif hours < HUGE_QUEUE_HOURS:
+        reasons.append(f"⚠️ Большая очередь: {hours:.0f}ч (-10)")
+    else:
+        reasons.append(f"🔴 Огромная очередь: {hours:.0f}ч (-20)")
+
+    current_d = m.current_diameter
+    if current_d:
+        if abs(current_d - diameter) < SAME_DIAMETER_TOLERANCE:
+            if hours >= HUGE_QUEUE_HOURS:
+                reasons.append(f"✅ Без переналадки (сейчас {current_d}мм, но очередь!)")
+            else:
+                reasons.append(f"✅ Без переналадки (сейчас {current_d}мм)")
+        else:
+            reasons.append(f"⚠️ Переналадка {current_d}мм → {diameter}мм")
+
+    if related:
+        reasons.append(f"🔗 Родственный чертёж: после лота {related.lot_number} ({related.drawing_number})")
+
+    if m.is_jbs:
+        reasons.append("🔧 JBS (неидеальный диаметр)")
+
+    if forecast and forecast.completion_rate < 100:
+        reasons.append(f"⚠️ Частичная поставка: {forecast.completion_rate}% к сроку")
+
+    return reasons
+
+
+def _recommend_lots(
+    db: Session,
+    machines: List[MachineQueue],
+    lots: List[LotCandidate],
+    top_n: int,
+) -> List[List[MachineRecommendation]]:
+    """
+    Рекомендации для пачки лотов: история — один запрос на всю пачку,
+    score всех пар лот × станок — один проход planning_scoring.score_lots.
+    """
+    arrays = MachineArrays.from_machines(machines)
+    column = {m.machine_id: j for j, m in enumerate(machines)}
+
+    history = np.zeros((len(lots), len(machines)), dtype=int)
+    for i, lot_history in enumerate(_load_history(db, [(lot.part_id, lot.drawing_number) for lot in lots])):
+        for machine_id, times in lot_history.items():
+            if machine_id in column:
+                history[i, column[machine_id]] = times
+
+    related_by_drawing: Dict[Optional[str], Dict[int, QueuedLot]] = {}
+    related = np.zeros((len(lots), len(machines)), dtype=bool)
+    for i, lot in enumerate(lots):
+        if lot.drawing_number not in related_by_drawing:
+            related_by_drawing[lot.drawing_number] = _related_in_queue(machines, lot.drawing_number)
+        for machine_id in related_by_drawing[lot.drawing_number]:
+            related[i, column[machine_id]] = True
+
+    scores, fits = score_lots(
+        arrays,
+        np.array([lot.diameter for lot in lots], dtype=float),
+        np.array([lot.part_length if lot.part_length else np.nan for lot in lots], dtype=float),
+        history,
+        related,
+    )
+
+    results = []
+    for i, (lot, top) in enumerate(zip(lots, rank(scores, fits, top_n))):
+        forecast = _forecast(lot)
+        lot_related = related_by_drawing[lot.drawing_number]
+        recommendations = []
+        for j in top:
+            m = machines[j]
+            recommendations.append(MachineRecommendation(
+                machine_id=m.machine_id,
+                machine_name=m.name,
+                score=int(scores[i, j]),
+                reasons=_reasons(m, lot, int(history[i, j]), lot_related.get(m.machine_id), forecast),
+                forecast=forecast,
+                current_diameter=m.current_diameter,
+                queue_hours=m.queue_hours
+            ))
+        results.append(recommendations)
+    return results
+
+
 # ============ ENDPOINT ============
 
 @router.get("/recommend-machines", response_model=RecommendationsResponse)
@@ -114,357 +313,66 @@ async def recommend_machines(
     4. Учитывает текущую загрузку станка
     5. Возвращает топ рекомендации с прогнозом
     """
-    
-    # 1. Получаем все активные станки с их параметрами
-    machines_query = text("""
-        SELECT 
-            m.id,
-            m.name,
-            m.min_diameter,
-            m.max_diameter,
-            m.max_bar_length,
-            m.max_part_length,
-            m.is_jbs,
-            m.supports_no_guidebush
-        FROM machines m
-        WHERE m.is_active = true
-          AND COALESCE(m.is_operational, true) = true
-        ORDER BY m.name
-    """)
-    
-    machines_result = db.execute(machines_query).fetchall()
-    
-    if not machines_result:
+    # Станки, текущие диаметры и загрузка очередей (работа + переналадки) — из общего снимка
+    machines = get_machine_queue_snapshot(db).operational()
+    if not machines:
         raise HTTPException(status_code=404, detail="Нет активных станков")
-    
-    # 2. Получаем текущий диаметр на каждом станке (из активных наладок)
-    current_setup_query = text("""
-        SELECT 
-            sj.machine_id,
-            l.actual_diameter as current_diameter
-        FROM setup_jobs sj
-        JOIN lots l ON sj.lot_id = l.id
-        WHERE sj.status IN ('created', 'pending_qc', 'allowed', 'started')
-          AND sj.end_time IS NULL
-    """)
-    
-    current_setups = {row.machine_id: row.current_diameter 
-                      for row in db.execute(current_setup_query).fetchall()}
-    
-    # 3. Получаем загрузку станков (часы в очереди)
-    # ВАЖНО: 
-    # - Используем COALESCE для total_planned_quantity
-    # - Для in_production берём machine_id из setup_jobs
-    # - actual_produced берётся из machine_readings (последний reading)
-    queue_query = text("""
-        WITH latest_readings AS (
-            -- Последний reading для каждого setup_job
-            SELECT DISTINCT ON (setup_job_id)
-                setup_job_id,
-                reading as actual_produced
-            FROM machine_readings
-            ORDER BY setup_job_id, id DESC
-        ),
-        lot_machines AS (
-            -- assigned лоты: машина из lots.assigned_machine_id, produced = 0
-            SELECT 
-                l.id as lot_id,
-                l.assigned_machine_id as machine_id,
-                COALESCE(l.total_planned_quantity, l.initial_planned_quantity) as quantity,
-                0 as produced,
-                p.avg_cycle_time
-            FROM lots l
-            JOIN parts p ON l.part_id = p.id
-            WHERE l.status = 'assigned'
-              AND l.assigned_machine_id IS NOT NULL
-            
-            UNION ALL
-            
-            -- in_production лоты: машина из setup_jobs, produced из readings
-            SELECT 
-                l.id as lot_id,
-                sj.machine_id,
-                COALESCE(l.total_planned_quantity, l.initial_planned_quantity) as quantity,
-                COALESCE(lr.actual_produced, 0) as produced,
-                p.avg_cycle_time
-            FROM lots l
-            JOIN parts p ON l.part_id = p.id
-            JOIN setup_jobs sj ON sj.lot_id = l.id
-            LEFT JOIN latest_readings lr ON lr.setup_job_id = sj.id
-            WHERE l.status = 'in_production'
-              AND sj.status IN ('created', 'pending_qc', 'allowed', 'started')
-              AND sj.end_time IS NULL
-        )
-        SELECT 
-            machine_id,
-            SUM(
-                CASE 
-                    WHEN avg_cycle_time IS NOT NULL AND quantity IS NOT NULL
-                    THEN (avg_cycle_time * GREATEST(quantity - produced, 0)) / 3600.0
-                    ELSE 0
-                END
-            ) as queue_hours
-        FROM lot_machines
-        WHERE machine_id IS NOT NULL
-        GROUP BY machine_id
-    """)
-    
-    queue_work_hours = {row.machine_id: float(row.queue_hours or 0) 
-                        for row in db.execute(queue_query).fetchall()}
-    
-    # 3b. Считаем время переналадок между лотами в очередях
-    setup_time_query = text("""
-        WITH queue_lots AS (
-            -- assigned лоты с чертежами
-            SELECT 
-                l.assigned_machine_id as machine_id,
-                l.assigned_order as position,
-                p.drawing_number
-            FROM lots l
-            JOIN parts p ON l.part_id = p.id
-            WHERE l.status = 'assigned'
-              AND l.assigned_machine_id IS NOT NULL
-            ORDER BY l.assigned_machine_id, l.assigned_order
-        )
-        SELECT machine_id, array_agg(drawing_number ORDER BY position) as drawings
-        FROM queue_lots
-        GROUP BY machine_id
-    """)
-    
-    setup_times = {}  # machine_id -> setup_hours
-    for row in db.execute(setup_time_query).fetchall():
-        drawings = row.drawings or []
-        setup_hours = 0.0
-        
-        for i in range(1, len(drawings)):
-            prev_drawing = drawings[i-1] or ""
-            curr_drawing = drawings[i] or ""
-            
-            # Определяем родственные чертежи (одинаковая база)
-            def get_base(d):
-                parts = d.rsplit('-', 1)
-                return parts[0] if len(parts) == 2 and parts[1].isdigit() else d
-            
-            if get_base(prev_drawing) == get_base(curr_drawing) and get_base(prev_drawing):
-                setup_hours += SETUP_TIME_RELATED  # Родственная переналадка
-            else:
-                setup_hours += SETUP_TIME_NORMAL   # Обычная переналадка
-        
-        setup_times[row.machine_id] = setup_hours
-    
-    # Итоговая загрузка = работа + переналадки
-    queue_hours = {
-        mid: queue_work_hours.get(mid, 0) + setup_times.get(mid, 0)
-        for mid in set(queue_work_hours.keys()) | set(setup_times.keys())
-    }
-    
-    # 4. Получаем историю: на каких станках делали эту деталь
-    history = {}
-    if part_id or drawing_number:
-        history_query = text("""
-            SELECT 
-                sj.machine_id,
-                COUNT(*) as times_made
-            FROM setup_jobs sj
-            JOIN lots l ON sj.lot_id = l.id
-            JOIN parts p ON l.part_id = p.id
-            WHERE sj.status = 'completed'
-              AND (
-                  (:part_id IS NOT NULL AND p.id = :part_id)
-                  OR (:drawing_number IS NOT NULL AND p.drawing_number = :drawing_number)
-              )
-            GROUP BY sj.machine_id
-        """)
-        
-        history_result = db.execute(history_query, {
-            "part_id": part_id,
-            "drawing_number": drawing_number
-        }).fetchall()
-        
-        history = {row.machine_id: row.times_made for row in history_result}
-    
-    # 5. Ищем родственные чертежи в очередях (для группировки похожих деталей)
-    # Родственный чертёж = тот же базовый номер (например 1409-04-1 и 1409-04-2 → база 1409-04)
-    # ВАЖНО: суффикс только ОДНА цифра! 577-42 это база, не 577!
-    related_in_queue = {}  # machine_id -> {lot_number, drawing, position}
-    if drawing_number:
-        # Извлекаем базу чертежа: "1409-04-1" → "1409-04", но "577-42" остаётся "577-42"
-        # Суффикс только если заканчивается на -N где N = одна цифра (1-9)
-        suffix_match = re.match(r'^(.+)-(\d)$', drawing_number)
-        if suffix_match:
-            # Есть суффикс: 1409-04-1 → база = 1409-04
-            base_drawing = suffix_match.group(1)
-        else:
-            # Нет суффикса: 577-42 сам является базой
-            base_drawing = drawing_number
-        
-        if base_drawing:
-            # Ищем родственные: саму базу ИЛИ с суффиксом -N (одна цифра)
-            # Например для 577-42-1: ищем 577-42 или 577-42-2, 577-42-3...
-            # Для 577-42: ищем 577-42-1, 577-42-2...
-            related_query = text("""
-                SELECT 
-                    l.assigned_machine_id as machine_id,
-                    l.lot_number,
-                    p.drawing_number,
-                    l.assigned_order as position,
-                    l.actual_diameter
-                FROM lots l
-                JOIN parts p ON l.part_id = p.id
-                WHERE l.status = 'assigned'
-                  AND l.assigned_machine_id IS NOT NULL
-                  AND p.drawing_number != :exact_drawing
-                  AND (
-                      p.drawing_number = :base_drawing
-                      OR p.drawing_number ~ :base_regex
-                  )
-                ORDER BY l.assigned_machine_id, l.assigned_order DESC
-            """)
-            
-            # Regex для базы + одна цифра: ^577-42-\d$
-            base_regex = f"^{re.escape(base_drawing)}-\\d$"
-            
-            related_result = db.execute(related_query, {
-                "base_drawing": base_drawing,
-                "base_regex": base_regex,
-                "exact_drawing": drawing_number
-            }).fetchall()
-            
-            # Берём последний (по позиции) родственный лот на каждом станке
-            for row in related_result:
-                if row.machine_id not in related_in_queue:
-                    related_in_queue[row.machine_id] = {
-                        "lot_number": row.lot_number,
-                        "drawing": row.drawing_number,
-                        "position": row.position,
-                        "diameter": row.actual_diameter
-                    }
-    
-    # 6. Оцениваем каждый станок
-    recommendations = []
-    
-    for m in machines_result:
-        reasons = []
-        score = 50  # базовый score
-        
-        # --- ЖЁСТКИЕ ОГРАНИЧЕНИЯ ---
-        
-        # Проверка диаметра
-        if m.min_diameter and diameter < m.min_diameter:
-            continue  # станок не подходит
-        if m.max_diameter and diameter > m.max_diameter:
-            continue  # станок не подходит
-        
-        reasons.append(f"✅ Диаметр {diameter}мм подходит ({m.min_diameter or '?'}-{m.max_diameter or '?'})")
-        
-        # Проверка длины детали
-        if part_length and m.max_part_length:
-            if part_length > m.max_part_length:
-                continue  # деталь слишком длинная
-            reasons.append(f"✅ Длина детали {part_length}мм ≤ {m.max_part_length}мм")
-        elif part_length and not m.max_part_length:
-            reasons.append(f"✅ Без ограничения длины детали")
-        
-        # --- МЯГКИЕ КРИТЕРИИ (score) ---
-        
-        # История
-        if m.id in history:
-            times = history[m.id]
-            bonus = min(W_HISTORY, times * 10)  # макс 30 баллов
-            score += bonus
-            reasons.append(f"✅ Делали раньше ({times} раз)")
-        else:
-            reasons.append("🆕 Раньше не делали")
-        
-        # Загрузка очереди (ОЦЕНИВАЕМ ПЕРВОЙ, т.к. влияет на бонус за переналадку)
-        hours = queue_hours.get(m.id, 0)
-        queue_penalty = 0
-        if hours == 0:
-            score += W_FREE_QUEUE
-            reasons.append("✅ Свободен")
-        elif hours < 24:
-            score += int(W_FREE_QUEUE * 0.7)
-            reasons.append(f"⚡ Очередь: {hours:.0f}ч")
-        elif hours < 72:
-            score += int(W_FREE_QUEUE * 0.3)
-            reasons.append(f"⏳ Очередь: {hours:.0f}ч")
-        elif hours < 200:
-            # Большая очередь (3-8 дней) - небольшой штраф
-            queue_penalty = 10
-            score -= queue_penalty
-            reasons.append(f"⚠️ Большая очередь: {hours:.0f}ч (-{queue_penalty})")
-        else:
-            # Очень большая очередь (>8 дней) - серьёзный штраф
-            queue_penalty = 20
-            score -= queue_penalty
-            reasons.append(f"🔴 Огромная очередь: {hours:.0f}ч (-{queue_penalty})")
-        
-        # Тот же диаметр (без переналадки)
-        # Бонус уменьшается при большой очереди!
-        current_d = current_setups.get(m.id)
-        if current_d:
-            if abs(current_d - diameter) < 0.5:  # тот же диаметр (±0.5мм)
-                # При очереди >200ч бонус за переналадку уменьшается вдвое
-                same_d_bonus = W_SAME_DIAMETER if hours < 200 else W_SAME_DIAMETER // 2
-                score += same_d_bonus
-                if hours >= 200:
-                    reasons.append(f"✅ Без переналадки (сейчас {current_d}мм, но очередь!)")
-                else:
-                    reasons.append(f"✅ Без переналадки (сейчас {current_d}мм)")
-            else:
-                reasons.append(f"⚠️ Переналадка {current_d}мм → {diameter}мм")
-        
-        # Родственный чертёж в очереди (группировка похожих деталей)
-        related = related_in_queue.get(m.id)
-        if related:
-            score += W_RELATED_DRAWING
-            reasons.append(f"🔗 Родственный чертёж: после лота {related['lot_number']} ({related['drawing']})")
-        
-        # Специальные возможности (JBS)
-        if m.is_jbs:
-            score += 5
-            reasons.append("🔧 JBS (неидеальный диаметр)")
-        
-        # --- ПРОГНОЗ ---
-        forecast = None
-        if cycle_time_sec and cycle_time_sec > 0:
-            available_seconds = due_days * 24 * 3600
-            can_make = available_seconds // cycle_time_sec
-            completion_rate = min(int(can_make * 100 / quantity), 100)
-            
-            total_seconds = quantity * cycle_time_sec
-            days_for_full = total_seconds / (24 * 3600)
-            
-            forecast = MachineForecast(
-                can_make_by_deadline=min(can_make, quantity),
-                completion_rate=completion_rate,
-                days_for_full=round(days_for_full, 1)
-            )
-            
-            if completion_rate < 100:
-                reasons.append(f"⚠️ Частичная поставка: {completion_rate}% к сроку")
-        
-        recommendations.append(MachineRecommendation(
-            machine_id=m.id,
-            machine_name=m.name,
-            score=min(score, 100),
-            reasons=reasons,
-            forecast=forecast,
-            current_diameter=current_d,
-            queue_hours=hours
-        ))
-    
-    # Сортируем по score (лучшие первые)
-    recommendations.sort(key=lambda x: x.score, reverse=True)
-    
-    # Возвращаем топ-5
+
+    lot = LotCandidate(
+        diameter=diameter,
+        quantity=quantity,
+        due_days=due_days,
+        cycle_time_sec=cycle_time_sec,
+        part_length=part_length,
+        part_id=part_id,
+        drawing_number=drawing_number,
+    )
+    recommendations = _recommend_lots(db, machines, [lot], RECOMMEND_TOP_N)[0]
+
     return RecommendationsResponse(
         part_id=part_id,
         drawing_number=drawing_number,
         diameter=diameter,
         quantity=quantity,
         due_days=due_days,
-        recommendations=recommendations[:5]
+        recommendations=recommendations
+    )
+
+
+@router.post("/recommend-batch", response_model=BatchRecommendationsResponse)
+async def recommend_batch(
+    payload: BatchRecommendRequest,
+    db: Session = Depends(get_db_session)
+):
+    """
+    Рекомендации станков сразу для пачки новых лотов (планирование недели).
+
+    Каждый лот оценивается так же, как в /recommend-machines, и независимо
+    от остальных лотов пачки: загрузка станков — текущая, без учёта того,
+    что другие лоты пачки тоже будут на них поставлены.
+    Результаты — в порядке лотов запроса.
+    """
+    machines = get_machine_queue_snapshot(db).operational()
+    if not machines:
+        raise HTTPException(status_code=404, detail="Нет активных станков")
+
+    ranked = _recommend_lots(db, machines, payload.lots, payload.top_n)
+
+    return BatchRecommendationsResponse(
+        machines_considered=len(machines),
+        results=[
+            BatchLotRecommendations(
+                index=i,
+                key=lot.key,
+                part_id=lot.part_id,
+                drawing_number=lot.drawing_number,
+                diameter=lot.diameter,
+                quantity=lot.quantity,
+                due_days=lot.due_days,
+                recommendations=recommendations
+            )
+            for i, (lot, recommendations) in enumerate(zip(payload.lots, ranked))
+        ]
     )
 
 
@@ -588,47 +496,18 @@ async def recommend_with_queue_analysis(
             pinned_machine_id = pinned_result.pinned_machine_id
             warnings.append(f"📌 Деталь закреплена за станком (ID: {pinned_machine_id})")
     
-    # 1. Получаем подходящие станки
+    # 1. Подходящие станки и их очереди — из общего снимка
+    snapshot = get_machine_queue_snapshot(db)
     if pinned_machine_id:
         # Только закреплённый станок
-        machines_query = text("""
-            SELECT 
-                m.id, m.name, m.min_diameter, m.max_diameter,
-                m.max_part_length, m.is_jbs, m.location_id
-            FROM machines m
-            WHERE m.id = :pinned_id AND m.is_active = true
-              AND COALESCE(m.is_operational, true) = true
-        """)
-        machines = db.execute(machines_query, {"pinned_id": pinned_machine_id}).fetchall()
+        pinned = snapshot.get(pinned_machine_id)
+        machines = [pinned] if pinned else []
     else:
         # Все подходящие по диаметру (+ фильтр по участкам если указан)
-        if parsed_area_ids:
-            machines_query = text("""
-                SELECT 
-                    m.id, m.name, m.min_diameter, m.max_diameter,
-                    m.max_part_length, m.is_jbs, m.location_id
-                FROM machines m
-                WHERE m.is_active = true
-                  AND COALESCE(m.is_operational, true) = true
-                  AND (m.min_diameter IS NULL OR m.min_diameter <= :diameter)
-                  AND (m.max_diameter IS NULL OR m.max_diameter >= :diameter)
-                  AND m.location_id = ANY(:area_ids)
-                ORDER BY m.name
-            """)
-            machines = db.execute(machines_query, {"diameter": diameter, "area_ids": parsed_area_ids}).fetchall()
-        else:
-            machines_query = text("""
-                SELECT 
-                    m.id, m.name, m.min_diameter, m.max_diameter,
-                    m.max_part_length, m.is_jbs, m.location_id
-                FROM machines m
-                WHERE m.is_active = true
-                  AND COALESCE(m.is_operational, true) = true
-                  AND (m.min_diameter IS NULL OR m.min_diameter <= :diameter)
-                  AND (m.max_diameter IS NULL OR m.max_diameter >= :diameter)
-                ORDER BY m.name
-            """)
-            machines = db.execute(machines_query, {"diameter": diameter}).fetchall()
+        machines = [
+            m for m in snapshot.operational()
+            if m.fits(diameter) and (not parsed_area_ids or m.location_id in parsed_area_ids)
+        ]
     
     if not machines:
         if parsed_area_ids:
@@ -636,212 +515,56 @@ async def recommend_with_queue_analysis(
         raise HTTPException(status_code=404, detail="Нет подходящих станков для данного диаметра")
     
     # 1.1 Получаем историю изготовления детали (на каких станках делали раньше)
-    history = {}
-    if part_id or drawing_number:
-        history_query = text("""
-            SELECT 
-                sj.machine_id,
-                COUNT(*) as times_made
-            FROM setup_jobs sj
-            JOIN lots l ON sj.lot_id = l.id
-            JOIN parts p ON l.part_id = p.id
-            WHERE sj.status = 'completed'
-              AND (
-                  (:part_id IS NOT NULL AND p.id = :part_id)
-                  OR (:drawing_number IS NOT NULL AND p.drawing_number = :drawing_number)
-              )
-            GROUP BY sj.machine_id
-        """)
-        history_result = db.execute(history_query, {
-            "part_id": part_id,
-            "drawing_number": drawing_number
-        }).fetchall()
-        history = {row.machine_id: row.times_made for row in history_result}
-    
-    # 2. Получаем текущие диаметры на станках
-    current_setup_query = text("""
-        SELECT sj.machine_id, l.actual_diameter as current_diameter
-        FROM setup_jobs sj
-        JOIN lots l ON sj.lot_id = l.id
-        WHERE sj.status IN ('created', 'pending_qc', 'allowed', 'started') AND sj.end_time IS NULL
-    """)
-    current_setups = {row.machine_id: row.current_diameter 
-                      for row in db.execute(current_setup_query).fetchall()}
-    
-    # 3. Получаем очереди всех станков с детальной информацией
-    # ВАЖНО: для in_production машина берётся из setup_jobs
-    # actual_produced берётся из machine_readings (последний reading)
-    queue_query = text("""
-        WITH latest_readings AS (
-            SELECT DISTINCT ON (setup_job_id)
-                setup_job_id,
-                reading as actual_produced
-            FROM machine_readings
-            ORDER BY setup_job_id, id DESC
-        )
-        -- assigned лоты
-        SELECT 
-            l.id as lot_id,
-            l.lot_number,
-            l.assigned_machine_id as machine_id,
-            l.assigned_order as position,
-            l.due_date,
-            l.status,
-            l.actual_diameter,
-            COALESCE(l.total_planned_quantity, l.initial_planned_quantity) as quantity,
-            0 as actual_produced,
-            p.drawing_number,
-            p.avg_cycle_time,
-            p.recommended_diameter
-        FROM lots l
-        JOIN parts p ON l.part_id = p.id
-        WHERE l.status = 'assigned'
-          AND l.assigned_machine_id IS NOT NULL
-        
-        UNION ALL
-        
-        -- in_production лоты (машина из setup_jobs, produced из readings)
-        SELECT 
-            l.id as lot_id,
-            l.lot_number,
-            sj.machine_id,
-            0 as position,  -- in_production всегда первые
-            l.due_date,
-            l.status,
-            l.actual_diameter,
-            COALESCE(l.total_planned_quantity, l.initial_planned_quantity) as quantity,
-            COALESCE(lr.actual_produced, 0) as actual_produced,
-            p.drawing_number,
-            p.avg_cycle_time,
-            p.recommended_diameter
-        FROM lots l
-        JOIN parts p ON l.part_id = p.id
-        JOIN setup_jobs sj ON sj.lot_id = l.id
-        LEFT JOIN latest_readings lr ON lr.setup_job_id = sj.id
-        WHERE l.status = 'in_production'
-          AND sj.status IN ('created', 'pending_qc', 'allowed', 'started')
-          AND sj.end_time IS NULL
-        
-        ORDER BY machine_id, position
-    """)
-    
-    queue_rows = db.execute(queue_query).fetchall()
-    
-    # Группируем лоты по станкам
-    machine_queues = {}
-    for row in queue_rows:
-        mid = row.machine_id
-        if mid not in machine_queues:
-            machine_queues[mid] = []
-        
-        # Рассчитываем ОСТАТОЧНОЕ время работы (учитываем actual_produced)
-        work_hours = 0
-        if row.avg_cycle_time and row.quantity:
-            remaining_qty = max(0, row.quantity - (row.actual_produced or 0))
-            work_hours = (row.avg_cycle_time * remaining_qty) / 3600.0
-        
-        machine_queues[mid].append({
-            "lot_id": row.lot_id,
-            "lot_number": row.lot_number,
-            "position": row.position or 999,
-            "drawing_number": row.drawing_number,
-            "quantity": row.quantity or 0,
-            "actual_produced": row.actual_produced or 0,
-            "cycle_time_sec": row.avg_cycle_time,
-            "work_hours": work_hours,
-            "due_date": row.due_date,
-            "diameter": row.actual_diameter or row.recommended_diameter,
-            "status": row.status
-        })
-    
-    # Вспомогательная функция для определения базы чертежа
-    # ВАЖНО: суффикс только ОДНА цифра! 577-42 это база, не 577!
-    def get_drawing_base(d):
-        if not d:
-            return ""
-        # Суффикс только если заканчивается на -N где N = одна цифра (1-9)
-        suffix_match = re.match(r'^(.+)-(\d)$', d)
-        return suffix_match.group(1) if suffix_match else d
+    history = _load_history(db, [(part_id, drawing_number)])[0]
     
     # 4. Анализируем каждый станок
     recommendations = []
     
     for m in machines:
-        queue = machine_queues.get(m.id, [])
-        queue.sort(key=lambda x: x["position"])
-        
         # Диаметр для проверки переналадки:
-        # Новый лот идёт В КОНЕЦ очереди!
-        # 1. Если есть assigned лоты → берём диаметр последнего assigned
-        # 2. Если assigned нет, но есть in_production → берём его диаметр
-        # 3. Если очередь пустая — переналадка неизвестна (станок свободен)
-        queue = machine_queues.get(m.id, [])
-        current_d = None
-        
-        # Разделяем на assigned и in_production
-        assigned_lots = [l for l in queue if l.get("status") == "assigned"]
-        in_production_lots = [l for l in queue if l.get("status") == "in_production"]
-        
-        if assigned_lots:
-            # Есть assigned → берём последний по position
-            sorted_assigned = sorted(assigned_lots, key=lambda x: x["position"])
-            current_d = sorted_assigned[-1].get("diameter")
-        elif in_production_lots:
-            # Только in_production → берём его диаметр
-            current_d = in_production_lots[0].get("diameter")
-        # Если очередь пустая — current_d остаётся None (станок свободен)
-        
+        # Новый лот идёт В КОНЕЦ очереди — берём диаметр последнего лота
+        # (последний assigned, иначе in_production). Очередь пустая — станок свободен.
+        current_d = m.tail_diameter
         needs_setup = current_d is not None and abs(current_d - diameter) >= 0.5
         
         # Рассчитываем ETA и slack для каждого лота в очереди
         # Учитываем время переналадки между лотами!
         cumulative_hours = 0
         queue_lots = []
-        prev_drawing = None
         
-        for i, lot in enumerate(queue):
-            # Добавляем время переналадки (кроме первого лота)
-            if i > 0 and prev_drawing:
-                curr_base = get_drawing_base(lot["drawing_number"])
-                prev_base = get_drawing_base(prev_drawing)
-                
-                if curr_base and prev_base and curr_base == prev_base:
-                    cumulative_hours += SETUP_TIME_RELATED  # Родственная
-                else:
-                    cumulative_hours += SETUP_TIME_NORMAL   # Обычная
-            
-            prev_drawing = lot["drawing_number"]
+        for lot in m.lots:
+            cumulative_hours += lot.changeover_hours  # 0 для первого лота
             
             # ETA = сейчас + накопленные часы + время этого лота
             lot_eta = None
             lot_slack = None
             
-            if lot["work_hours"] > 0:
-                eta_datetime = now_utc + timedelta(hours=cumulative_hours + lot["work_hours"])
+            if lot.work_hours > 0:
+                eta_datetime = now_utc + timedelta(hours=cumulative_hours + lot.work_hours)
                 lot_eta = eta_datetime
                 
-                if lot["due_date"]:
+                if lot.due_date:
                     # Приводим due_date к UTC если он timezone-naive
-                    lot_due = lot["due_date"]
+                    lot_due = lot.due_date
                     if lot_due.tzinfo is None:
                         lot_due = lot_due.replace(tzinfo=timezone.utc)
                     lot_slack = (lot_due - eta_datetime).total_seconds() / 86400  # в днях
             
-            cumulative_hours += lot["work_hours"]
+            cumulative_hours += lot.work_hours
             
             queue_lots.append(QueueLot(
-                lot_id=lot["lot_id"],
-                lot_number=lot["lot_number"],
-                position=lot["position"],
-                drawing_number=lot["drawing_number"],
-                quantity=lot["quantity"],
-                cycle_time_sec=lot["cycle_time_sec"],
-                work_hours=round(lot["work_hours"], 1),
-                due_date=lot["due_date"],
+                lot_id=lot.lot_id,
+                lot_number=lot.lot_number,
+                position=lot.position,
+                drawing_number=lot.drawing_number,
+                quantity=lot.quantity,
+                cycle_time_sec=lot.cycle_time_sec,
+                work_hours=round(lot.work_hours, 1),
+                due_date=lot.due_date,
                 eta=lot_eta,
                 slack_days=round(lot_slack, 1) if lot_slack is not None else None,
-                diameter=lot["diameter"],
-                status=lot["status"]
+                diameter=lot.diameter,
+                status=lot.status
             ))
         
         # Определяем оптимальную позицию для нового лота
@@ -917,8 +640,8 @@ async def recommend_with_queue_analysis(
         reasons.append(f"✅ Диаметр {diameter}мм подходит ({m.min_diameter or '?'}-{m.max_diameter or '?'})")
         
         # История изготовления (бонус до +30 баллов)
-        if m.id in history:
-            times = history[m.id]
+        if m.machine_id in history:
+            times = history[m.machine_id]
             bonus = min(30, times * 10)  # макс 30 баллов (3+ раза = максимум)
             score += bonus
             reasons.append(f"✅ Делали раньше ({times} раз, +{bonus})")
@@ -956,17 +679,16 @@ async def recommend_with_queue_analysis(
         
         # Родственный чертёж
         if drawing_number:
-            new_base = get_drawing_base(drawing_number)
-            for qlot in queue_lots:
+            new_base = drawing_base(drawing_number)
+            for qlot, lot in zip(queue_lots, m.lots):
                 if qlot.drawing_number:
-                    lot_base = get_drawing_base(qlot.drawing_number)
-                    if lot_base == new_base and qlot.drawing_number != drawing_number:
+                    if lot.base_drawing == new_base and qlot.drawing_number != drawing_number:
                         score += 20
                         reasons.append(f"🔗 Родственный чертёж: после {qlot.drawing_number}")
                         break
         
         recommendations.append(MachineQueueAnalysis(
-            machine_id=m.id,
+            machine_id=m.machine_id,
             machine_name=m.name,
             score=min(score, 100),
             reasons=reasons,
@@ -980,8 +702,6 @@ async def recommend_with_queue_analysis(
     
     # 5. Анализ переносов на другие станки (suggest_transfer)
     # Для станков с высокой загрузкой ищем лоты для переноса
-    machine_name_map = {m.id: m.name for m in machines}
-    
     for rec in recommendations:
         if rec.queue_hours < 48:  # Только для загруженных станков (>48ч)
             continue
@@ -1008,12 +728,9 @@ async def recommend_with_queue_analysis(
                 # Проверяем совместимость диаметра
                 if lot.diameter:
                     # Станок должен поддерживать этот диаметр
-                    alt_machine = next((m for m in machines if m.id == alt_rec.machine_id), None)
-                    if alt_machine:
-                        if alt_machine.min_diameter and lot.diameter < alt_machine.min_diameter:
-                            continue
-                        if alt_machine.max_diameter and lot.diameter > alt_machine.max_diameter:
-                            continue
+                    alt_machine = snapshot.get(alt_rec.machine_id)
+                    if alt_machine and not alt_machine.fits(lot.diameter):
+                        continue
                 
                 if alt_rec.queue_hours < best_alt_hours:
                     best_alt = alt_rec
@@ -1057,3 +774,136 @@ async def recommend_with_queue_analysis(
         warnings=warnings
     )
 
+
+
+# ============ СИМУЛЯЦИЯ РАСПРЕДЕЛЕНИЯ НОВЫХ ЛОТОВ ============
+
+SIMULATION_MAX_LOTS = 1000
+
+class SimulateQueueRequest(BaseModel):
+    lot_ids: Optional[List[int]] = Field(None, max_length=SIMULATION_MAX_LOTS, description="Лоты в статусе new (по умолчанию все)")
+    area_ids: Optional[List[int]] = Field(None, description="Только станки этих участков")
+    respect_pinned: bool = Field(True, description="Ставить закреплённые детали только на их станок")
+
+class SimulatedLot(BaseModel):
+    lot_id: int
+    lot_number: str
+    drawing_number: Optional[str]
+    diameter: Optional[float]
+    quantity: int
+    position: int
+    changeover_hours: float
+    work_hours: float
+    start_at: datetime
+    finish_at: datetime
+    due_date: Optional[datetime]
+    slack_days: Optional[float]
+    made_before: bool
+
+class SimulatedMachine(BaseModel):
+    machine_id: int
+    machine_name: str
+    existing_queue_hours: float
+    queue_hours: float            # с учётом запланированных лотов
+    finish_at: datetime           # прогноз окончания всей очереди
+    planned_lots: List[SimulatedLot]
+
+class UnplacedLotInfo(BaseModel):
+    lot_id: int
+    lot_number: str
+    reason: str
+
+class QueueSimulationResponse(BaseModel):
+    started_at: datetime
+    lots_total: int
+    lots_planned: int
+    lots_late: int
+    finish_at: Optional[datetime]  # окончание последнего запланированного лота
+    machines: List[SimulatedMachine]
+    unplaced: List[UnplacedLotInfo]
+    warnings: List[str]
+
+
+_NEW_LOTS_SQL = text("""
+    SELECT
+        l.id AS lot_id, l.lot_number, l.part_id, l.due_date,
+        COALESCE(l.total_planned_quantity, l.initial_planned_quantity) AS quantity,
+        COALESCE(l.actual_diameter, p.recommended_diameter) AS diameter,
+        p.drawing_number, p.avg_cycle_time, p.part_length, p.pinned_machine_id
+    FROM lots l
+    JOIN parts p ON l.part_id = p.id
+    WHERE l.status = 'new'
+      AND (CAST(:lot_ids AS integer[]) IS NULL OR l.id = ANY(CAST(:lot_ids AS integer[])))
+    ORDER BY l.due_date NULLS LAST, l.id
+    LIMIT :limit
+""")
+
+
+@router.post("/simulate-queue", response_model=QueueSimulationResponse)
+async def simulate_queue(
+    payload: SimulateQueueRequest,
+    db: Session = Depends(get_db_session)
+):
+    """
+    What-if: жадно распределить новые лоты по станкам с учётом накопленной загрузки.
+
+    Лоты ставятся по сроку поставки; каждый — на станок, где он раньше
+    закончится (с учётом уже поставленных в симуляции лотов и переналадок),
+    с предпочтением станков, где деталь уже делали.
+    Ничего не сохраняет — возвращает план и прогноз окончания по станкам.
+    """
+    rows = db.execute(_NEW_LOTS_SQL, {
+        "lot_ids": payload.lot_ids,
+        "limit": SIMULATION_MAX_LOTS,
+    }).fetchall()
+
+    lots = [
+        SimLot(
+            lot_id=row.lot_id,
+            lot_number=row.lot_number,
+            part_id=row.part_id,
+            drawing_number=row.drawing_number,
+            diameter=float(row.diameter) if row.diameter else None,
+            quantity=row.quantity or 0,
+            cycle_time_sec=row.avg_cycle_time,
+            part_length=row.part_length,
+            due_date=row.due_date,
+            pinned_machine_id=row.pinned_machine_id if payload.respect_pinned else None,
+        )
+        for row in rows
+    ]
+
+    machines = [
+        m for m in get_machine_queue_snapshot(db).operational()
+        if not payload.area_ids or m.location_id in payload.area_ids
+    ]
+    if not machines:
+        raise HTTPException(status_code=404, detail="Нет активных станков в выбранных участках")
+
+    lot_history = _load_history(db, [(lot.part_id, lot.drawing_number) for lot in lots])
+    result = simulate_assignment(
+        machines,
+        lots,
+        history={lot.lot_id: h for lot, h in zip(lots, lot_history)},
+    )
+
+    return QueueSimulationResponse(
+        started_at=result.started_at,
+        lots_total=len(lots),
+        lots_planned=result.planned_count,
+        lots_late=result.late_count,
+        finish_at=result.finish_at,
+        machines=[
+            SimulatedMachine(
+                machine_id=plan.machine_id,
+                machine_name=plan.machine_name,
+                existing_queue_hours=plan.existing_queue_hours,
+                queue_hours=plan.queue_hours,
+                finish_at=plan.finish_at,
+                planned_lots=[SimulatedLot(**vars(lot)) for lot in plan.planned]
+            )
+            for plan in result.machines
+        ],
+        unplaced=[UnplacedLotInfo(**vars(lot)) for lot in result.unplaced],
+        warnings=result.warnings
+    )
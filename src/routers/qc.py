@@ -5,14 +5,18 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import text, desc
 
+from src import database
 from src.database import get_db_session
+from src.utils.sync_db_offload import SyncDBOffloadRoute
 from src.models.models import LotDB, PartDB, SetupDB, EmployeeDB, MachineDB
 from pydantic import BaseModel
 from src.services.telegram_client import send_telegram_message
 from src.services.whatsapp_client import send_whatsapp_to_all_enabled_roles, WHATSAPP_ENABLED
+from src.services import outbox
+from src.services.outbox import OutboxPermanentError, register_outbox_handler
 
 logger = logging.getLogger(__name__)
-router = APIRouter(tags=["Quality Control"])
+router = APIRouter(tags=["Quality Control"], route_class=SyncDBOffloadRoute)
 
 
 class LotInfoItem(BaseModel):
@@ -143,64 +147,55 @@ async def get_lots_pending_qc(
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера при получении лотов для ОТК")
 
 
-@router.post("/setups/notify-allowed", summary="Отправить уведомление о разрешении наладки")
-async def notify_setup_allowed(
-    request: NotifyRequest,
-    db: Session = Depends(get_db_session)
-):
+def _load_setup_allowed_info(db: Session, setup_id: int):
+    from sqlalchemy.orm import aliased
+    QaEmployee = aliased(EmployeeDB)
+
+    return db.query(
+        SetupDB.id,
+        SetupDB.status,
+        EmployeeDB.telegram_id,
+        EmployeeDB.full_name.label("machinist_name"),
+        MachineDB.name.label("machine_name"),
+        PartDB.drawing_number,
+        QaEmployee.full_name.label("qa_name")
+    ).select_from(SetupDB)\
+     .join(EmployeeDB, SetupDB.employee_id == EmployeeDB.id)\
+     .join(MachineDB, SetupDB.machine_id == MachineDB.id)\
+     .join(LotDB, SetupDB.lot_id == LotDB.id)\
+     .join(PartDB, LotDB.part_id == PartDB.id)\
+     .join(QaEmployee, SetupDB.qa_id == QaEmployee.id)\
+     .filter(SetupDB.id == setup_id)\
+     .first()
+
+
+async def _deliver_setup_allowed(payload: dict) -> None:
     """
-    Принимает ID наладки и отправляет уведомление наладчику о том,
-    что его наладка разрешена ОТК и можно начинать работу.
+    Outbox: уведомление наладчику, операторам и админам о том, что наладка
+    разрешена ОТК и можно начинать работу (+ WhatsApp группы).
     """
-    setup_id = request.setup_id
-    logger.info(f"Получен запрос на уведомление о разрешении для наладки ID: {setup_id}")
-    
+    setup_id = payload["setup_id"]
+    db = database.SessionLocal()
     try:
-        # 1. Найти наладку и связанную информацию
-        from sqlalchemy.orm import aliased
-        QaEmployee = aliased(EmployeeDB)
-        
-        setup_info = db.query(
-            SetupDB.id,
-            SetupDB.status,
-            EmployeeDB.telegram_id,
-            EmployeeDB.full_name.label("machinist_name"),
-            MachineDB.name.label("machine_name"),
-            PartDB.drawing_number,
-            QaEmployee.full_name.label("qa_name")
-        ).select_from(SetupDB)\
-         .join(EmployeeDB, SetupDB.employee_id == EmployeeDB.id)\
-         .join(MachineDB, SetupDB.machine_id == MachineDB.id)\
-         .join(LotDB, SetupDB.lot_id == LotDB.id)\
-         .join(PartDB, LotDB.part_id == PartDB.id)\
-         .join(QaEmployee, SetupDB.qa_id == QaEmployee.id)\
-         .filter(SetupDB.id == setup_id)\
-         .first()
-
+        setup_info = _load_setup_allowed_info(db, setup_id)
         if not setup_info:
-            logger.error(f"Наладка с ID {setup_id} не найдена для отправки уведомления.")
-            raise HTTPException(status_code=404, detail="Наладка не найдена")
-
-        # 2. Проверить статус
+            raise OutboxPermanentError(f"setup {setup_id} not found")
         if setup_info.status != 'allowed':
-            logger.warning(f"Попытка уведомить о наладке в статусе '{setup_info.status}', а не 'allowed'. Уведомление не отправлено.")
-            return {"message": "Уведомление не отправлено, так как статус наладки не 'allowed'."}
+            logger.warning(f"Наладка {setup_id} в статусе '{setup_info.status}', а не 'allowed'. Уведомление не отправлено.")
+            return
 
-        # 3. Получить всех получателей (наладчик, админы, операторы)
+        # Получатели: наладчик, админы, операторы
         other_recipients = db.query(EmployeeDB.telegram_id).filter(
             EmployeeDB.role_id.in_([1, 3]),  # 1=Оператор, 3=Админ
             EmployeeDB.is_active == True,
             EmployeeDB.telegram_id.isnot(None)
         ).all()
-        
+
         ids_to_notify = {recipient.telegram_id for recipient in other_recipients}
         machinist_telegram_id = setup_info.telegram_id
         if machinist_telegram_id:
             ids_to_notify.add(machinist_telegram_id)
 
-        logger.info(f"Всего получателей уведомления: {len(ids_to_notify)}")
-
-        # 4. Сформировать сообщения
         machinist_message = (
             f"✅ **Ваша** наладка на станке <b>{setup_info.machine_name}</b> для детали <b>{setup_info.drawing_number}</b> одобрена ОТК ({setup_info.qa_name}).\n\n"
             f"Можно начинать работу!"
@@ -210,24 +205,19 @@ async def notify_setup_allowed(
             f"Операторы могут начинать работу."
         )
 
-        # 5. Отправить уведомления
         successful_sends = 0
         for user_id in ids_to_notify:
-            try:
-                message_to_send = machinist_message if user_id == machinist_telegram_id else general_message
-                await send_telegram_message(
-                    chat_id=user_id,
-                    text=message_to_send
-                )
-                logger.info(f"Уведомление успешно отправлено пользователю ID: {user_id}")
+            message_to_send = machinist_message if user_id == machinist_telegram_id else general_message
+            if await send_telegram_message(chat_id=user_id, text=message_to_send):
                 successful_sends += 1
-            except Exception as send_error:
-                logger.error(f"Не удалось отправить уведомление пользователю {user_id}: {send_error}")
 
-        # 6. Отправить в WhatsApp группы
+        # Ничего не ушло — повтор безопасен (дублей не будет), WhatsApp отправим вместе с ним
+        if ids_to_notify and not successful_sends:
+            raise RuntimeError(f"Telegram недоступен: 0 из {len(ids_to_notify)} уведомлений о наладке {setup_id}")
+        logger.info(f"Уведомления о разрешении наладки {setup_id} отправлены {successful_sends} из {len(ids_to_notify)} получателей")
+
         if WHATSAPP_ENABLED:
             try:
-                # Формируем сообщение для WhatsApp (без HTML)
                 wa_message = (
                     f"✅ Наладка разрешена ОТК!\n\n"
                     f"🔧 Станок: {setup_info.machine_name}\n"
@@ -236,20 +226,68 @@ async def notify_setup_allowed(
                     f"✔️ ОТК: {setup_info.qa_name}\n\n"
                     f"Операторы могут начинать работу!"
                 )
-                
-                # Отправляем всем включённым ролям
                 wa_sent = await send_whatsapp_to_all_enabled_roles(db, wa_message, "setup_allowed")
                 logger.info(f"WhatsApp уведомления о разрешении наладки {setup_id} отправлены ({wa_sent})")
             except Exception as wa_err:
                 logger.warning(f"WhatsApp уведомление не отправлено (non-critical): {wa_err}")
+    finally:
+        db.close()
+
+
+async def _deliver_machine_free_whatsapp(payload: dict) -> None:
+    """Outbox: WhatsApp «станок освободился» (основные TG уведомления отправляет сам бот)."""
+    setup_id = payload["setup_id"]
+    wa_message = (
+        f"🟢 Станок освободился!\n\n"
+        f"🔧 Станок: {payload.get('machine_name')}\n"
+        f"📝 Чертёж: {payload.get('drawing_number')}\n"
+        f"🔢 Партия: {payload.get('lot_number')}\n\n"
+        f"Станок готов для новой наладки 🛠"
+    )
+    db = database.SessionLocal()
+    try:
+        wa_sent = await send_whatsapp_to_all_enabled_roles(db, wa_message, "machine_free")
+        logger.info(f"WhatsApp уведомления о завершении наладки {setup_id} отправлены (wa_sent={wa_sent})")
+    finally:
+        db.close()
+
+
+register_outbox_handler("qc_setup_allowed", "telegram", _deliver_setup_allowed)
+register_outbox_handler("qc_machine_free_whatsapp", "whatsapp", _deliver_machine_free_whatsapp)
 
-        return {"success": True, "message": f"Уведомления отправлены {successful_sends} из {len(ids_to_notify)} получателей."}
+
+@router.post("/setups/notify-allowed", summary="Отправить уведомление о разрешении наладки")
+async def notify_setup_allowed(
+    request: NotifyRequest,
+    db: Session = Depends(get_db_session)
+):
+    """
+    Ставит в outbox уведомление наладчику о том, что его наладка разрешена ОТК
+    и можно начинать работу. Отправка — после ответа, с повторами.
+    """
+    setup_id = request.setup_id
+    logger.info(f"Получен запрос на уведомление о разрешении для наладки ID: {setup_id}")
+
+    try:
+        setup_info = _load_setup_allowed_info(db, setup_id)
+        if not setup_info:
+            logger.error(f"Наладка с ID {setup_id} не найдена для отправки уведомления.")
+            raise HTTPException(status_code=404, detail="Наладка не найдена")
+
+        if setup_info.status != 'allowed':
+            logger.warning(f"Попытка уведомить о наладке в статусе '{setup_info.status}', а не 'allowed'. Уведомление не отправлено.")
+            return {"message": "Уведомление не отправлено, так как статус наладки не 'allowed'."}
+
+        outbox_id = outbox.enqueue(db, "qc_setup_allowed", {"setup_id": setup_id})
+        db.commit()
+        return {"success": True, "message": "Уведомление поставлено в очередь отправки", "outbox_id": outbox_id}
 
     except HTTPException as e:
         # Перебрасываем HTTP исключения
         raise e
     except Exception as e:
-        logger.error(f"Ошибка при отправке уведомления для наладки {setup_id}: {e}", exc_info=True)
+        db.rollback()
+        logger.error(f"Ошибка при постановке уведомления для наладки {setup_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера при отправке уведомления")
 
 
@@ -259,27 +297,23 @@ async def notify_setup_completion(
     db: Session = Depends(get_db_session)
 ):
     """
-    Отправляет WhatsApp уведомление о завершении наладки и освободившемся станке.
+    Ставит в outbox WhatsApp уведомление о завершении наладки и освободившемся станке.
     Вызывается из TG бота при завершении работы оператором.
     Основные TG уведомления отправляет сам бот - здесь только WhatsApp для Viewer.
     """
     setup_id = request.setup_id
     logger.info(f"Получен запрос на уведомление о завершении для наладки ID: {setup_id}")
-    
+
     try:
-        # 1. Найти наладку и связанную информацию
         setup_info = db.query(
             SetupDB.id,
-            SetupDB.status,
             MachineDB.name.label("machine_name"),
             PartDB.drawing_number,
             LotDB.lot_number,
-            EmployeeDB.full_name.label("operator_name")
         ).select_from(SetupDB)\
          .join(MachineDB, SetupDB.machine_id == MachineDB.id)\
          .join(LotDB, SetupDB.lot_id == LotDB.id)\
          .join(PartDB, LotDB.part_id == PartDB.id)\
-         .outerjoin(EmployeeDB, SetupDB.employee_id == EmployeeDB.id)\
          .filter(SetupDB.id == setup_id)\
          .first()
 
@@ -287,35 +321,22 @@ async def notify_setup_completion(
             logger.warning(f"Наладка с ID {setup_id} не найдена для уведомления о завершении.")
             return {"success": False, "message": "Наладка не найдена"}
 
-        # 2. Отправить в WhatsApp (machine_free уведомление)
-        logger.info(f"=== notify-completion called for setup {setup_id} ===")
-        logger.info(f"WHATSAPP_ENABLED = {WHATSAPP_ENABLED}")
-        
-        if WHATSAPP_ENABLED:
-            try:
-                wa_message = (
-                    f"🟢 Станок освободился!\n\n"
-                    f"🔧 Станок: {setup_info.machine_name}\n"
-                    f"📝 Чертёж: {setup_info.drawing_number}\n"
-                    f"🔢 Партия: {setup_info.lot_number}\n\n"
-                    f"Станок готов для новой наладки 🛠"
-                )
-                
-                logger.info(f"Calling send_whatsapp_to_all_enabled_roles for machine_free...")
-                # Отправляем всем включённым ролям для machine_free
-                wa_sent = await send_whatsapp_to_all_enabled_roles(db, wa_message, "machine_free")
-                logger.info(f"WhatsApp уведомления о завершении наладки {setup_id} отправлены (wa_sent={wa_sent})")
-                
-                return {"success": True, "message": f"WhatsApp уведомления отправлены", "wa_sent": wa_sent}
-            except Exception as wa_err:
-                logger.warning(f"WhatsApp уведомление не отправлено: {wa_err}")
-                return {"success": False, "message": f"WhatsApp error: {str(wa_err)}"}
-        else:
+        if not WHATSAPP_ENABLED:
             logger.info("WhatsApp отключен, уведомление не отправлено")
             return {"success": True, "message": "WhatsApp отключен"}
 
+        outbox_id = outbox.enqueue(db, "qc_machine_free_whatsapp", {
+            "setup_id": setup_id,
+            "machine_name": setup_info.machine_name,
+            "drawing_number": setup_info.drawing_number,
+            "lot_number": setup_info.lot_number,
+        })
+        db.commit()
+        return {"success": True, "message": "WhatsApp уведомление поставлено в очередь", "outbox_id": outbox_id}
+
     except Exception as e:
-        logger.error(f"Ошибка при отправке уведомления о завершении для наладки {setup_id}: {e}", exc_info=True)
+        db.rollback()
+        logger.error(f"Ошибка при постановке уведомления о завершении для наладки {setup_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Внутренняя ошибка сервера при отправке уведомления")
 
 
@@ -0,0 +1,224 @@
+"""
+Пакетная запись показаний счётчиков: POST /readings/batch.
+
+Одиночное показание — POST /readings в src/main.py; общие правила записи —
+src/services/reading_service.py.
+"""
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database import get_async_db_session
+from src.models.models import EmployeeDB, MachineDB, ReadingDB, SetupDB
+from src.services import reading_idempotency
+from src.services.cache_invalidation import notify_change_async
+from src.services.mtconnect_client import get_counter_sync_queue
+from src.services.reading_service import (
+    READING_ACTIVE_SETUP_STATUSES,
+    apply_reading,
+    load_last_readings,
+    load_prev_reading,
+    validate_reading_value,
+)
+from src.utils.sheets_handler import get_sheets_writer
+from src.utils.sync_db_offload import SyncDBOffloadRoute
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/readings", tags=["Readings"], route_class=SyncDBOffloadRoute)
+
+READINGS_BATCH_MAX_ITEMS = int(os.getenv('READINGS_BATCH_MAX_ITEMS', '500'))
+
+
+class ReadingBatchItem(BaseModel):
+    machine_id: int
+    operator_id: int
+    value: int
+    client_timestamp: Optional[datetime] = Field(None, description="Время снятия показания на терминале (по умолчанию — время приёма)")
+    idempotency_key: Optional[str] = Field(None, max_length=128, description="Ключ клиента для защиты от повторной отправки")
+
+
+class ReadingBatchInput(BaseModel):
+    items: List[ReadingBatchItem] = Field(..., min_length=1, max_length=READINGS_BATCH_MAX_ITEMS)
+
+
+@router.post("/batch")
+async def save_readings_batch(payload: ReadingBatchInput, db: AsyncSession = Depends(get_async_db_session)):
+    """
+    Пакетная запись показаний (офлайн-терминалы после восстановления связи, дозагрузка из MTConnect).
+
+    Показания каждого станка обрабатываются по времени client_timestamp по тем же правилам,
+    что и POST /readings, но в одной транзакции: активные наладки — одним запросом,
+    предыдущее показание — один запрос на станок, вставки — пачкой при flush.
+    Элементы с уже использованным idempotency_key возвращаются как duplicate с исходным результатом.
+    Ответ — результат по каждому элементу в исходном порядке.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)  # naive UTC, как в machine_readings
+    logger.info(f"Received readings batch: {len(payload.items)} items")
+
+    def item_time(item: ReadingBatchItem) -> datetime:
+        ts = item.client_timestamp
+        if ts is None:
+            return now
+        if ts.tzinfo is not None:
+            ts = ts.astimezone(timezone.utc).replace(tzinfo=None)  # naive — считаем UTC, как и в БД
+        return min(ts, now)  # время из будущего не принимаем
+
+    results: List[Optional[dict]] = [None] * len(payload.items)
+    ordered = sorted(
+        range(len(payload.items)),
+        key=lambda i: (payload.items[i].machine_id, item_time(payload.items[i]), i),
+    )
+
+    try:
+        # 1. Активные наладки всех станков пакета — одним запросом
+        machine_ids = sorted({item.machine_id for item in payload.items})
+        setups_by_machine: Dict[int, SetupDB] = {}
+        for setup in (await db.scalars(
+            select(SetupDB)
+            .where(SetupDB.machine_id.in_(machine_ids))
+            .where(SetupDB.status.in_(READING_ACTIVE_SETUP_STATUSES))
+            .where(SetupDB.end_time.is_(None))
+            .order_by(SetupDB.machine_id, SetupDB.created_at.desc())
+        )).all():
+            setups_by_machine.setdefault(setup.machine_id, setup)
+
+        # 2. Предыдущее показание: из БД один раз на станок, дальше — из самого пакета
+        last_readings = await load_last_readings(db, machine_ids)
+        last_value: Dict[int, Optional[int]] = {}
+
+        def prev_reading_loader(machine_id: int, before: datetime) -> Callable[[], Awaitable[Optional[int]]]:
+            async def load() -> Optional[int]:
+                if machine_id not in last_value:
+                    with db.no_autoflush:  # показания пакета вставляются одним flush в конце
+                        last_value[machine_id] = await load_prev_reading(
+                            db, machine_id, before, last_readings.get(machine_id)
+                        )
+                return last_value[machine_id]
+            return load
+
+        # 3. Ключи идемпотентности: LRU, затем занимаем все новые одним запросом
+        replays: Dict[str, dict] = {}
+        to_claim: Dict[str, int] = {}
+        for item in payload.items:
+            key = item.idempotency_key
+            if not key or key in replays or key in to_claim:
+                continue
+            cached_response = reading_idempotency.lookup_cached(key)
+            if cached_response is not None:
+                replays[key] = cached_response
+            else:
+                to_claim[key] = item.machine_id
+        replays.update(await reading_idempotency.claim_keys(db, to_claim.items()))
+
+        seen_keys = set()
+        failed_keys: List[str] = []
+        saved: List[tuple] = []  # (index, reading_db)
+        touched_setups: Dict[int, SetupDB] = {}
+        for i in ordered:
+            item = payload.items[i]
+            result = {"index": i, "machine_id": item.machine_id, "idempotency_key": item.idempotency_key}
+            results[i] = result
+
+            key = item.idempotency_key
+            if key:
+                if key in replays:
+                    result.update(status="duplicate", original=replays[key])
+                    continue
+                if key in seen_keys:
+                    result.update(status="duplicate", detail="Повтор элемента в пакете")
+                    continue
+                seen_keys.add(key)
+
+            setup = setups_by_machine.get(item.machine_id)
+            if not setup:
+                result.update(status="error", status_code=404, detail="Активная наладка не найдена для этого станка")
+                if key:
+                    failed_keys.append(key)
+                continue
+            try:
+                validate_reading_value(setup.status, item.value)
+            except HTTPException as e:
+                result.update(status="error", status_code=e.status_code, detail=e.detail)
+                if key:
+                    failed_keys.append(key)
+                continue
+
+            created_at = item_time(item)
+            reading_db = ReadingDB(
+                employee_id=item.operator_id,
+                machine_id=item.machine_id,
+                reading=item.value,
+                setup_job_id=setup.id,
+                created_at=created_at,
+            )
+            db.add(reading_db)
+            new_setup_status, batch_message = await apply_reading(
+                db, setup, reading_db, prev_reading_loader(item.machine_id, created_at)
+            )
+            last_value[item.machine_id] = item.value
+            touched_setups[setup.id] = setup
+            saved.append((i, reading_db))
+            result.update(
+                status="ok",
+                new_status=new_setup_status,
+                message=batch_message if batch_message else "Показания успешно сохранены",
+            )
+
+        # 4. Вставка показаний и батчей пачкой + события инвалидации, один commit
+        await db.flush()
+        for i, reading_db in saved:
+            results[i]["reading_id"] = reading_db.id
+        for setup in touched_setups.values():
+            await notify_change_async(db, "reading", machine_id=setup.machine_id, lot_id=setup.lot_id, setup_id=setup.id)
+        keyed = [(payload.items[i].idempotency_key, reading_db.id, results[i])
+                 for i, reading_db in saved if payload.items[i].idempotency_key]
+        await reading_idempotency.store_responses(db, keyed)
+        # Отклонённые элементы не сохранены — их ключи можно отправить повторно
+        await reading_idempotency.release_keys(db, failed_keys)
+        await db.commit()
+        for key, _, result in keyed:
+            reading_idempotency.remember(key, result)
+        logger.info(f"Readings batch committed: {len(saved)} saved, {len(payload.items) - len(saved)} rejected")
+
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error in save_readings_batch: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal server error while saving readings batch")
+
+    # 5. Побочные эффекты вне транзакции: Google Sheets — по каждому показанию,
+    #    MTConnect — только последнее значение станка
+    if saved:
+        try:
+            operator_ids = {reading_db.employee_id for _, reading_db in saved}
+            operator_names = dict((await db.execute(
+                select(EmployeeDB.id, EmployeeDB.full_name).where(EmployeeDB.id.in_(operator_ids))
+            )).all())
+            machine_names = dict((await db.execute(
+                select(MachineDB.id, MachineDB.name).where(MachineDB.id.in_({r.machine_id for _, r in saved}))
+            )).all())
+            latest_by_machine: Dict[int, int] = {}
+            for _, reading_db in sorted(saved, key=lambda s: s[1].created_at):
+                get_sheets_writer().enqueue(
+                    operator=operator_names.get(reading_db.employee_id) or "Unknown",
+                    machine=machine_names.get(reading_db.machine_id) or "Unknown",
+                    reading=reading_db.reading
+                )
+                latest_by_machine[reading_db.machine_id] = reading_db.reading
+            for machine_id, value in latest_by_machine.items():
+                if machine_names.get(machine_id):
+                    get_counter_sync_queue().request(machine_names[machine_id], value)
+        except Exception as side_error:
+            logger.error(f"Error in readings batch side effects: {side_error}", exc_info=True)
+
+    return {
+        "success": all(r["status"] in ("ok", "duplicate") for r in results),
+        "saved": len(saved),
+        "results": results,
+    }
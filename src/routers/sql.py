@@ -10,8 +10,9 @@ from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 
 from src.database import get_db_session
+from src.utils.sync_db_offload import SyncDBOffloadRoute
 
-router = APIRouter(prefix="/sql", tags=["SQL"])
+router = APIRouter(prefix="/sql", tags=["SQL"], route_class=SyncDBOffloadRoute)
 
 
 class SQLExecuteRequest(BaseModel):
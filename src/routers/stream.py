@@ -7,15 +7,21 @@ SSE (Server-Sent Events) Router
 Использование:
     const eventSource = new EventSource('/api/stream/dashboard');
     eventSource.onmessage = (e) => console.log(JSON.parse(e.data));
+
+Delta-режим (для планшетов на слабом Wi-Fi), см. src/services/sse_delta.py:
+    const es = new EventSource('/api/stream/dashboard?mode=delta');
+    es.addEventListener('snapshot', (e) => { state = JSON.parse(e.data).data; });
+    es.addEventListener('delta', (e) => applyOps(state, JSON.parse(e.data).ops));
+При переподключении браузер сам шлёт Last-Event-ID — сервер досылает
+пропущенные delta или полный snapshot.
 """
 
 import asyncio
-import json
 import logging
 import time
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional
 
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Query, Request
 from fastapi.responses import StreamingResponse
 
 from src.services.dashboard_collector import get_dashboard_state
@@ -32,61 +38,109 @@ HEARTBEAT_INTERVAL_SEC = 30  # Keep-alive каждые 30 сек
 
 # ========== SSE GENERATOR ==========
 
-async def dashboard_event_generator(request: Request) -> AsyncGenerator[str, None]:
+async def dashboard_event_generator(request: Request) -> AsyncGenerator[bytes, None]:
     """
     Генератор SSE событий для дашборда.
     
+    Клиент подписывается на broadcast коллектора и спит на своей очереди:
+    данные сериализуются коллектором один раз, здесь только отправляются.
+    Отключение клиента Starlette обрабатывает сам (отменяет генератор).
+    
     Отправляет:
     - data: JSON с данными при каждом обновлении
     - :heartbeat при отсутствии данных (keep-alive)
     """
     state = get_dashboard_state()
-    last_sent_timestamp = 0
-    last_heartbeat = time.time()
-    
     client_ip = request.client.host if request.client else "unknown"
-    logger.info(f"🔌 SSE client connected: {client_ip}")
-    
-    # Отправляем retry интервал
-    yield f"retry: {SSE_RETRY_MS}\n\n"
+    subscriber = state.broadcaster.subscribe(client_ip)
+    logger.info(f"🔌 SSE client connected: {client_ip} (subscribers: {state.broadcaster.subscriber_count})")
     
     try:
+        # Отправляем retry интервал и текущий снимок
+        yield f"retry: {SSE_RETRY_MS}\n\n".encode()
+        if state.event_bytes:
+            yield state.event_bytes
+        
         while True:
-            # Проверяем отключение клиента
-            if await request.is_disconnected():
-                logger.info(f"🔌 SSE client disconnected: {client_ip}")
-                break
-            
-            current_data = state.get_data()
-            current_timestamp = state.last_update
-            
-            # Отправляем данные если они обновились
-            if current_timestamp > last_sent_timestamp and current_data:
-                data_json = json.dumps(current_data, ensure_ascii=False)
-                yield f"data: {data_json}\n\n"
-                last_sent_timestamp = current_timestamp
-                last_heartbeat = time.time()
+            try:
+                item = await asyncio.wait_for(subscriber.queue.get(), timeout=HEARTBEAT_INTERVAL_SEC)
+            except asyncio.TimeoutError:
+                # Heartbeat для keep-alive
+                yield b": heartbeat\n\n"
+                continue
             
-            # Heartbeat для keep-alive
-            elif time.time() - last_heartbeat > HEARTBEAT_INTERVAL_SEC:
-                yield ": heartbeat\n\n"
-                last_heartbeat = time.time()
+            if item is None:
+                # Клиент не успевал забирать события — отключаем, он переподключится сам
+                break
             
-            # Ждём перед следующей проверкой
-            await asyncio.sleep(1)
+            payload, published_at, _version = item
+            yield payload
+            subscriber.mark_sent(published_at)
             
     except asyncio.CancelledError:
         logger.info(f"🔌 SSE connection cancelled: {client_ip}")
+        raise
     except Exception as e:
         logger.error(f"❌ SSE error for {client_ip}: {e}")
     finally:
+        state.broadcaster.unsubscribe(subscriber)
         logger.debug(f"🔌 SSE generator cleanup: {client_ip}")
 
 
+async def dashboard_delta_event_generator(request: Request, last_event_id: Optional[str]) -> AsyncGenerator[bytes, None]:
+    """
+    Генератор SSE событий в delta-режиме.
+    
+    При подключении отправляет snapshot (или пропущенные delta по Last-Event-ID),
+    дальше — только delta с изменившимися станками.
+    """
+    stream = get_dashboard_state().delta
+    client_ip = request.client.host if request.client else "unknown"
+    # Подписываемся ДО чтения буфера, чтобы не потерять события между ними
+    subscriber = stream.broadcaster.subscribe(client_ip)
+    logger.info(f"🔌 SSE delta client connected: {client_ip} (last_event_id={last_event_id})")
+    
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n".encode()
+        initial_events, synced_version = stream.resume_events(last_event_id)
+        for payload in initial_events:
+            yield payload
+        
+        while True:
+            try:
+                item = await asyncio.wait_for(subscriber.queue.get(), timeout=HEARTBEAT_INTERVAL_SEC)
+            except asyncio.TimeoutError:
+                yield b": heartbeat\n\n"
+                continue
+            
+            if item is None:
+                break
+            
+            payload, published_at, version = item
+            if version <= synced_version:
+                # Уже отправлено в составе snapshot/буфера при подключении
+                continue
+            yield payload
+            synced_version = version
+            subscriber.mark_sent(published_at)
+            
+    except asyncio.CancelledError:
+        logger.info(f"🔌 SSE delta connection cancelled: {client_ip}")
+        raise
+    except Exception as e:
+        logger.error(f"❌ SSE delta error for {client_ip}: {e}")
+    finally:
+        stream.broadcaster.unsubscribe(subscriber)
+
+
 # ========== ENDPOINTS ==========
 
 @router.get("/dashboard")
-async def stream_dashboard(request: Request):
+async def stream_dashboard(
+    request: Request,
+    mode: str = Query("full", pattern="^(full|delta)$", description="full — полный JSON на каждое обновление, delta — snapshot + изменения"),
+    last_event_id: Optional[str] = Query(None, description="Альтернатива заголовку Last-Event-ID"),
+):
     """
     SSE endpoint для дашборда.
     
@@ -101,8 +155,14 @@ async def stream_dashboard(request: Request):
     };
     ```
     """
+    if mode == "delta":
+        resume_from = request.headers.get("last-event-id") or last_event_id
+        generator = dashboard_delta_event_generator(request, resume_from)
+    else:
+        generator = dashboard_event_generator(request)
+
     return StreamingResponse(
-        dashboard_event_generator(request),
+        generator,
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache, no-store, must-revalidate",
@@ -128,4 +188,7 @@ async def stream_status():
         "last_update_ago_sec": round(time.time() - state.last_update, 1) if state.last_update else None,
         "error": state.error,
         "machines_count": len(state.data.get("machines", [])) if state.data else 0,
+        "snapshot_bytes": len(state.event_bytes),
+        "broadcast": state.broadcaster.status(),
+        "delta": state.delta.status(),
     }
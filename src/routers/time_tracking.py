@@ -9,6 +9,7 @@ from typing import List, Optional
 from datetime import datetime, date, timedelta, timezone
 from zoneinfo import ZoneInfo
 from src.database import get_db_session
+from src.utils.sync_db_offload import SyncDBOffloadRoute
 from src.models.time_tracking import TimeEntryDB, WorkShiftDB, TerminalDB, FaceEmbeddingDB
 from src.models.models import EmployeeDB
 import logging
@@ -16,7 +17,7 @@ import os
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/time-tracking", tags=["Time Tracking"])
+router = APIRouter(prefix="/time-tracking", tags=["Time Tracking"], route_class=SyncDBOffloadRoute)
 
 
 # ==================== Pydantic модели ====================
@@ -23,6 +23,7 @@ from sqlalchemy import text
 from sqlalchemy.orm import Session
 
 from src.database import get_db_session
+from src.utils.sync_db_offload import SyncDBOffloadRoute
 from src.services.whatsapp_client import (
     WHATSAPP_GROUP_AI_MANAGER,
     WHATSAPP_GROUP_OPERATORS_A,
@@ -37,7 +38,7 @@ for _jid in (WHATSAPP_GROUP_OPERATORS_A, WHATSAPP_GROUP_OPERATORS_B, WHATSAPP_GR
         _ALLOWED_GROUPS.add(_jid.split('@')[0])
 
 logger = logging.getLogger(__name__)
-router = APIRouter(prefix="/webhooks", tags=["Webhooks"])
+router = APIRouter(prefix="/webhooks", tags=["Webhooks"], route_class=SyncDBOffloadRoute)
 
 # machine_name → True if we're waiting for a 0/1 follow-up response
 _awaiting_followup: Dict[str, bool] = {}
@@ -208,22 +209,11 @@ async def _generate_followup_message(
 
 async def _check_machine_idle(machine_name: str) -> Optional[int]:
     """Returns idle_minutes if still idle, None if working."""
-    import os, httpx
-    try:
-        mtc_url = os.getenv('MTCONNECT_API_URL', 'https://mtconnect-core-production.up.railway.app')
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(f"{mtc_url}/api/machines")
-            resp.raise_for_status()
-            data = resp.json()
-            machines = data.get('machines', {}).get('mtconnect', []) + \
-                       data.get('machines', {}).get('adam', [])
-        for m in machines:
-            if m.get('name') == machine_name:
-                if m.get('data', {}).get('uiMode') == 'idle':
-                    return int(m.get('data', {}).get('idleTimeMinutes', 0) or 0)
-                return None
-    except Exception as e:
-        logger.warning(f"[Followup] MTConnect error: {e}")
+    from src.services.mtconnect_snapshot import get_mtconnect_snapshot
+    snapshot = await get_mtconnect_snapshot().get()
+    m = snapshot.by_name.get(machine_name)
+    if m is not None and m.get('data', {}).get('uiMode') == 'idle':
+        return int(m.get('data', {}).get('idleTimeMinutes', 0) or 0)
     return None
 
 
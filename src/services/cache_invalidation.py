@@ -0,0 +1,158 @@
+"""
+Инвалидация кэшей по событиям через Postgres LISTEN/NOTIFY.
+
+Пишущие эндпоинты (save_reading, create_setup, approve_setup, complete_setup,
+move_batch) вызывают notify_change() внутри своей транзакции — pg_notify
+доставляется подписчикам только после commit, откатанные изменения событий
+не порождают.
+
+В каждом uvicorn worker работает cache_invalidation_listener_task(): держит
+одно asyncpg-соединение с LISTEN и передаёт пачки событий зарегистрированным
+обработчикам (register_invalidation_handler), которые сбрасывают только
+затронутые записи кэша. Пока слушатель подключён (is_listening()), кэши
+могут жить минутами; при обрыве — возвращаются короткие TTL.
+
+Формат события: {"kind": "reading", "machine_id": 1, "lot_id": 2, ...}.
+kind == "resync" — слушатель переподключился и мог пропустить события,
+сбросить нужно всё.
+"""
+import asyncio
+import inspect
+import json
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from src import database
+
+logger = logging.getLogger(__name__)
+
+CACHE_INVALIDATION_ENABLED = os.getenv("CACHE_INVALIDATION_ENABLED", "1").lower() in {"1", "true", "yes"}
+CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "mls_cache_invalidation")
+DEBOUNCE_SEC = float(os.getenv("CACHE_INVALIDATION_DEBOUNCE_SEC", "0.2"))  # склейка всплеска событий
+HEALTHCHECK_SEC = 30
+RECONNECT_DELAY_SEC = 5
+
+InvalidationHandler = Callable[[List[Dict[str, Any]]], Union[None, Awaitable[None]]]
+
+_handlers: List[InvalidationHandler] = []
+_pending: List[Dict[str, Any]] = []
+_flush_task: Optional[asyncio.Task] = None
+_listening = False
+
+_NOTIFY_SQL = text("SELECT pg_notify(:channel, :payload)")
+
+
+def _build_payload(kind: str, **ids: Optional[int]) -> Dict[str, Any]:
+    payload: Dict[str, Any] = {"kind": kind}
+    payload.update({k: v for k, v in ids.items() if v is not None})
+    return {"channel": CACHE_INVALIDATION_CHANNEL, "payload": json.dumps(payload)}
+
+
+def notify_change(db: Session, kind: str, **ids: Optional[int]) -> None:
+    """Ставит pg_notify в текущую транзакцию (sync Session). Вызывать до commit."""
+    if not CACHE_INVALIDATION_ENABLED:
+        return
+    db.execute(_NOTIFY_SQL, _build_payload(kind, **ids))
+
+
+async def notify_change_async(db: AsyncSession, kind: str, **ids: Optional[int]) -> None:
+    """То же для AsyncSession."""
+    if not CACHE_INVALIDATION_ENABLED:
+        return
+    await db.execute(_NOTIFY_SQL, _build_payload(kind, **ids))
+
+
+async def publish_event(kind: str, **ids: Optional[int]) -> None:
+    """Отправляет событие вне пользовательской транзакции (фоновые задачи)."""
+    if not CACHE_INVALIDATION_ENABLED or database.async_engine is None:
+        return
+    async with database.async_engine.begin() as conn:
+        await conn.execute(_NOTIFY_SQL, _build_payload(kind, **ids))
+
+
+def register_invalidation_handler(handler: InvalidationHandler) -> None:
+    if handler not in _handlers:
+        _handlers.append(handler)
+
+
+def is_listening() -> bool:
+    return _listening
+
+
+async def _dispatch(events: List[Dict[str, Any]]) -> None:
+    for handler in list(_handlers):
+        try:
+            result = handler(events)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.error(f"Cache invalidation handler {getattr(handler, '__name__', handler)} failed: {e}", exc_info=True)
+
+
+async def _flush_later() -> None:
+    global _flush_task
+    try:
+        await asyncio.sleep(DEBOUNCE_SEC)
+    finally:
+        _flush_task = None
+    events = _pending[:]
+    _pending.clear()
+    if events:
+        await _dispatch(events)
+
+
+def _on_notify(connection, pid, channel, payload) -> None:
+    """Callback asyncpg (вызывается в event loop)."""
+    global _flush_task
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        logger.warning(f"Bad cache invalidation payload: {payload!r}")
+        return
+    _pending.append(event)
+    if _flush_task is None:
+        _flush_task = asyncio.get_running_loop().create_task(_flush_later())
+
+
+async def cache_invalidation_listener_task() -> None:
+    """Фоновая задача воркера: LISTEN с автоматическим переподключением."""
+    global _listening
+    if not CACHE_INVALIDATION_ENABLED:
+        logger.info("Cache invalidation listener disabled by CACHE_INVALIDATION_ENABLED")
+        return
+
+    while True:
+        try:
+            if database.async_engine is None:
+                raise RuntimeError("async engine not initialized")
+            async with database.async_engine.connect() as sa_conn:
+                raw = await sa_conn.get_raw_connection()
+                pg = raw.driver_connection  # asyncpg.Connection
+                await pg.add_listener(CACHE_INVALIDATION_CHANNEL, _on_notify)
+                _listening = True
+                logger.info(f"Cache invalidation listener subscribed to '{CACHE_INVALIDATION_CHANNEL}'")
+                # Пока не слушали, события могли потеряться
+                await _dispatch([{"kind": "resync"}])
+                try:
+                    while True:
+                        await asyncio.sleep(HEALTHCHECK_SEC)
+                        await pg.execute("SELECT 1")
+                finally:
+                    _listening = False
+                    try:
+                        await pg.remove_listener(CACHE_INVALIDATION_CHANNEL, _on_notify)
+                    except Exception:
+                        pass
+        except asyncio.CancelledError:
+            _listening = False
+            logger.info("Cache invalidation listener stopped")
+            raise
+        except Exception as e:
+            _listening = False
+            logger.warning(f"Cache invalidation listener error: {e}; reconnect in {RECONNECT_DELAY_SEC}s")
+            await asyncio.sleep(RECONNECT_DELAY_SEC)
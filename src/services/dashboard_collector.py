@@ -4,9 +4,11 @@ Dashboard Data Collector Service
 Фоновый сервис для сбора данных дашборда.
 Собирает данные один раз в N секунд и хранит в памяти.
 Все клиенты получают одни и те же данные без нагрузки на БД.
+Запросы к БД выполняет только worker-лидер, остальные читают его снимок.
 """
 
 import asyncio
+import json
 import logging
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, List
@@ -16,11 +18,24 @@ import os
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
+from src.services.sse_broadcast import Broadcaster
+from src.services.sse_delta import DeltaStream
+from src.services import shared_cache
+from src.services.cache_invalidation import publish_event
+from src.services.leader_election import get_leader
+
 logger = logging.getLogger(__name__)
 
 # ========== КОНФИГУРАЦИЯ ==========
 
 COLLECT_INTERVAL_SEC = 5  # Как часто собирать данные
+# Если работает LISTEN/NOTIFY (src/services/cache_invalidation.py), сбор запускается
+# сразу после изменений, а по таймеру — редко (смена смены и изменения без событий)
+COLLECT_INTERVAL_LISTENING_SEC = int(os.getenv("DASHBOARD_COLLECT_INTERVAL_LISTENING", "60"))
+# Собирает только worker-лидер (src/services/leader_election.py) и кладёт снимок в общий кэш,
+# остальные workers читают его оттуда. Если снимок старше этого — собираем сами (лидера нет)
+SNAPSHOT_CACHE_KEY = "dashboard_snapshot"
+SNAPSHOT_MAX_AGE_SEC = COLLECT_INTERVAL_LISTENING_SEC * 2 + 10
 TIMEZONE_NAME = os.getenv("TIMEZONE") or os.getenv("BOT_TIMEZONE") or "Asia/Jerusalem"
 
 try:
@@ -39,6 +54,12 @@ class DashboardState:
         self.last_update: float = 0
         self.is_collecting: bool = False
         self.error: Optional[str] = None
+        self._refresh_event: Optional[asyncio.Event] = None
+        # Снимок, сериализованный один раз в готовое SSE-событие
+        self.event_bytes: bytes = b""
+        self.broadcaster = Broadcaster("dashboard")
+        # Версионированный поток snapshot/delta (GET /api/stream/dashboard?mode=delta)
+        self.delta = DeltaStream("dashboard")
     
     def get_data(self) -> Dict[str, Any]:
         return self.data
@@ -48,10 +69,32 @@ class DashboardState:
         self.data = data
         self.last_update = time.time()
         self.error = None
+        # Сериализуем один раз для всех SSE-клиентов
+        self.event_bytes = f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+        self.broadcaster.publish(self.event_bytes)
+        self.delta.publish(data)
     
     def set_error(self, error: str):
         self.error = error
 
+    def _get_refresh_event(self) -> asyncio.Event:
+        if self._refresh_event is None:
+            self._refresh_event = asyncio.Event()
+        return self._refresh_event
+
+    def request_refresh(self):
+        """Запросить внеочередной сбор данных (например, по событию из БД)"""
+        self._get_refresh_event().set()
+
+    async def wait_for_refresh(self, timeout: float):
+        """Ждёт запроса на обновление или истечения timeout"""
+        event = self._get_refresh_event()
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        event.clear()
+
 
 # Глобальный экземпляр состояния
 _state = DashboardState()
@@ -216,6 +259,41 @@ async def collect_all_dashboard_data(db: Session) -> Dict[str, Any]:
 
 # ========== BACKGROUND TASK ==========
 
+def _next_interval() -> float:
+    from src.services.cache_invalidation import is_listening
+    return COLLECT_INTERVAL_LISTENING_SEC if is_listening() else COLLECT_INTERVAL_SEC
+
+
+async def _publish_leader_snapshot(data: Dict[str, Any]) -> None:
+    """Лидер: сохранить снимок в общий кэш и уведомить остальных workers."""
+    try:
+        await shared_cache.get_shared_cache().set(SNAPSHOT_CACHE_KEY, data)
+        await publish_event("dashboard_snapshot")
+    except Exception as e:
+        logger.warning(f"📊 Failed to publish dashboard snapshot: {e}")
+
+
+async def _load_leader_snapshot(state: DashboardState) -> bool:
+    """
+    Follower: взять снимок лидера из общего кэша.
+    False — снимка нет или он устарел (лидер не работает), нужно собрать самим.
+    """
+    backend = shared_cache.get_shared_cache()
+    if backend.name == "memory":
+        return False  # кэш не общий — каждый worker собирает сам
+    try:
+        hit = await backend.get(SNAPSHOT_CACHE_KEY)
+    except Exception as e:
+        logger.warning(f"📊 Failed to read dashboard snapshot: {e}")
+        return False
+    if hit is None or hit[1] > SNAPSHOT_MAX_AGE_SEC:
+        return False
+    data = hit[0]
+    if data.get("timestamp") != state.data.get("timestamp"):
+        state.set_data(data)
+    return True
+
+
 async def dashboard_collector_task(get_db_func):
     """
     Фоновая задача сбора данных.
@@ -231,6 +309,11 @@ async def dashboard_collector_task(get_db_func):
     
     while state.is_collecting:
         try:
+            # Не лидер — берём снимок лидера из общего кэша
+            if not get_leader().is_leader and await _load_leader_snapshot(state):
+                await state.wait_for_refresh(_next_interval())
+                continue
+            
             # Получаем сессию БД
             db_gen = get_db_func()
             db = next(db_gen)
@@ -239,6 +322,8 @@ async def dashboard_collector_task(get_db_func):
                 # Собираем данные
                 data = await collect_all_dashboard_data(db)
                 state.set_data(data)
+                if get_leader().is_leader:
+                    await _publish_leader_snapshot(data)
                 
                 machine_count = len(data.get("machines", []))
                 logger.debug(f"📊 Dashboard data collected: {machine_count} machines, {data['collection_time_ms']}ms")
@@ -254,7 +339,7 @@ async def dashboard_collector_task(get_db_func):
             logger.error(f"❌ Dashboard collector error: {e}", exc_info=True)
             state.set_error(str(e))
         
-        await asyncio.sleep(COLLECT_INTERVAL_SEC)
+        await state.wait_for_refresh(_next_interval())
     
     logger.info("📊 Dashboard collector stopped")
 
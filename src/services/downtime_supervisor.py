@@ -26,15 +26,15 @@ import os
 from datetime import datetime, timezone
 from typing import Dict, List, Optional, Tuple
 
-import httpx
 import pytz
 
+from src.services.mtconnect_snapshot import get_mtconnect_snapshot
+
 _IL_TZ = pytz.timezone("Asia/Jerusalem")
 SHIFT_A_DAY_WEEK = int(os.getenv("SHIFT_A_DAY_WEEK", "13"))
 
 logger = logging.getLogger(__name__)
 
-MTCONNECT_API_URL = os.getenv('MTCONNECT_API_URL', 'https://mtconnect-core-production.up.railway.app')
 DRY_RUN = os.getenv('DOWNTIME_SUPERVISOR_DRY_RUN', '1').lower() not in ('0', 'false', 'no')
 IDLE_THRESHOLD_MIN = float(os.getenv('DOWNTIME_SUPERVISOR_THRESHOLD_MIN', '10'))
 ALERT_COOLDOWN_MIN = float(os.getenv('DOWNTIME_SUPERVISOR_COOLDOWN_MIN', '30'))
@@ -52,19 +52,13 @@ MAX_UNANSWERED_ALERTS = int(os.getenv('DOWNTIME_MAX_UNANSWERED_ALERTS', '3'))
 
 
 async def _fetch_machines() -> list:
-    """Получить все станки из MTConnect API."""
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(f"{MTCONNECT_API_URL}/api/machines")
-            response.raise_for_status()
-            data = response.json()
-            machines = []
-            machines.extend(data.get('machines', {}).get('mtconnect', []))
-            machines.extend(data.get('machines', {}).get('adam', []))
-            return machines
-    except Exception as e:
-        logger.error(f"[DowntimeSupervisor] Failed to fetch machines: {e}")
+    """Получить все станки из MTConnect (общий снимок поллера, см. mtconnect_snapshot)."""
+    snapshot = await get_mtconnect_snapshot().get()
+    # Устаревший снимок (MTConnect недоступен) get() не отдаёт — приходит пустой
+    if not snapshot.fetched_at:
+        logger.error("[DowntimeSupervisor] Failed to fetch machines: MTConnect snapshot unavailable")
         return []
+    return snapshot.machines
 
 
 def _should_alert(machine_name: str, idle_minutes: float) -> bool:
@@ -515,20 +509,14 @@ async def _check_once(get_db_session) -> None:
 
 
 async def downtime_supervisor_task(get_db_session) -> None:
-    """Фоновая задача супервизора простоев. Запускается при старте приложения."""
-    import os
-    import tempfile
-
-    # Используем файл-лок чтобы гарантировать запуск только в одном воркере
-    lock_path = os.path.join(tempfile.gettempdir(), "downtime_supervisor.lock")
-    try:
-        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
-        os.write(fd, str(os.getpid()).encode())
-        os.close(fd)
-    except FileExistsError:
-        print(f"[DowntimeSupervisor] PID={os.getpid()} — супервизор уже запущен в другом воркере, пропускаем")
-        return
+    """
+    Фоновая задача супервизора простоев. Запускается при старте приложения в каждом воркере,
+    но проверки выполняет только лидер (src/services/leader_election.py).
+    При падении лидера его advisory lock снимается Postgres и проверки подхватывает другой воркер.
+    """
+    from src.services.leader_election import get_leader
 
+    leader = get_leader()
     mode = "DRY RUN (сообщения не отправляются)" if DRY_RUN else "LIVE"
     print(
         f"[DowntimeSupervisor] Запущен [{mode}] | "
@@ -541,16 +529,26 @@ async def downtime_supervisor_task(get_db_session) -> None:
     # Первая проверка — через 30 сек после старта
     await asyncio.sleep(30)
 
-    try:
-        while True:
-            try:
-                await _check_once(get_db_session)
-            except Exception as e:
-                logger.error(f"[DowntimeSupervisor] Ошибка в цикле проверки: {e}", exc_info=True)
-
+    was_leader = False
+    while True:
+        if not leader.is_leader:
+            if was_leader:
+                # Лидерство потеряно — состояние станет неактуальным, новый лидер начнёт с нуля
+                _last_alert_sent.clear()
+                _first_seen_idle.clear()
+                _alert_count.clear()
+                logger.warning("[DowntimeSupervisor] Лидерство потеряно — проверки приостановлены")
+            was_leader = False
             await asyncio.sleep(CHECK_INTERVAL_SEC)
-    finally:
+            continue
+
+        if not was_leader:
+            logger.info(f"[DowntimeSupervisor] {leader.identity}: проверки выполняет этот воркер (лидер)")
+        was_leader = True
+
         try:
-            os.unlink(lock_path)
-        except OSError:
-            pass
+            await _check_once(get_db_session)
+        except Exception as e:
+            logger.error(f"[DowntimeSupervisor] Ошибка в цикле проверки: {e}", exc_info=True)
+
+        await asyncio.sleep(CHECK_INTERVAL_SEC)
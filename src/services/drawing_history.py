@@ -0,0 +1,197 @@
+"""
+Индекс истории изготовления деталей по чертежам.
+
+Рекомендации планирования (бонус «делали раньше») на каждый запрос
+агрегировали завершённые наладки JOIN setup_jobs × lots × parts. Здесь та же
+история один раз собирается в память воркера:
+
+    базовый чертёж → чертёж → станок → сколько раз делали,
+                                       когда последний раз,
+                                       лучшее время цикла
+
+Статистика времени цикла по детали — в таблице part_cycle_stats (миграция 061).
+
+Источник — завершённые наладки (status = 'completed'). Индекс обновляется
+инкрементально: событие "setup_completed" (complete_setup, перенос наладки
+в админке; через LISTEN/NOTIFY — на всех воркерах) ставит setup_id в очередь,
+и следующее чтение дочитывает только эти наладки. Полная перестройка — при
+"resync" и не реже раза в DRAWING_HISTORY_TTL_SEC (наладки, завершённые
+Telegram-ботом или вручную, событий не шлют).
+
+Использование:
+    index = get_drawing_history(db)
+    index.times_made(part_id, drawing_number)   # {machine_id: раз}
+"""
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from src.services.machine_queue_snapshot import drawing_base
+
+logger = logging.getLogger(__name__)
+
+DRAWING_HISTORY_TTL_SEC = float(os.getenv("DRAWING_HISTORY_TTL_SEC", "3600"))
+
+
+@dataclass(frozen=True)
+class MachineHistory:
+    machine_id: int
+    times_made: int = 0
+    last_made_at: Optional[datetime] = None
+    best_cycle_time: Optional[int] = None
+
+
+class DrawingHistoryIndex:
+    """История завершённых наладок в памяти воркера; безопасна для чтения из пула потоков."""
+
+    def __init__(self):
+        self._by_base: Dict[str, Dict[str, Dict[int, MachineHistory]]] = {}
+        self._part_drawing: Dict[int, str] = {}
+        self._setup_ids: Set[int] = set()
+        self._lock = threading.Lock()
+        self.built_at = time.time()
+
+    @classmethod
+    def build(cls, rows) -> "DrawingHistoryIndex":
+        index = cls()
+        index.add(rows)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._setup_ids)
+
+    def add(self, rows) -> int:
+        """Добавить завершённые наладки (строки _COMPLETED_SETUPS_SQL); уже учтённые пропускаются."""
+        added = 0
+        with self._lock:
+            for row in rows:
+                if row.setup_id in self._setup_ids or not row.drawing_number:
+                    continue
+                self._setup_ids.add(row.setup_id)
+                self._add_row(row)
+                added += 1
+        return added
+
+    def _add_row(self, row) -> None:
+        drawings = self._by_base.setdefault(drawing_base(row.drawing_number), {})
+        machines = drawings.setdefault(row.drawing_number, {})
+        if row.part_id is not None:
+            self._part_drawing[row.part_id] = row.drawing_number
+
+        cycle = row.cycle_time if row.cycle_time and row.cycle_time > 0 else None
+        if row.machine_id is not None:
+            prev = machines.get(row.machine_id) or MachineHistory(machine_id=row.machine_id)
+            machines[row.machine_id] = replace(
+                prev,
+                times_made=prev.times_made + 1,
+                last_made_at=max(filter(None, (prev.last_made_at, row.end_time)), default=None),
+                best_cycle_time=min(filter(None, (prev.best_cycle_time, cycle)), default=None),
+            )
+
+    def machines(self, drawing_number: Optional[str]) -> Dict[int, MachineHistory]:
+        """История чертежа по станкам."""
+        if not drawing_number:
+            return {}
+        with self._lock:
+            return dict(self._by_base.get(drawing_base(drawing_number), {}).get(drawing_number, {}))
+
+    def times_made(self, part_id: Optional[int], drawing_number: Optional[str]) -> Dict[int, int]:
+        """machine_id → сколько раз делали деталь (по id детали ИЛИ по номеру чертежа)."""
+        with self._lock:
+            part_drawing = self._part_drawing.get(part_id) if part_id is not None else None
+        drawings = {d for d in (part_drawing, drawing_number) if d}
+        result: Dict[int, int] = {}
+        for drawing in drawings:
+            for machine_id, history in self.machines(drawing).items():
+                result[machine_id] = result.get(machine_id, 0) + history.times_made
+        return result
+
+
+_COMPLETED_SETUPS_SQL = """
+    SELECT
+        sj.id AS setup_id, sj.machine_id, sj.cycle_time, sj.end_time,
+        l.part_id, p.drawing_number
+    FROM setup_jobs sj
+    JOIN lots l ON sj.lot_id = l.id
+    JOIN parts p ON l.part_id = p.id
+    WHERE sj.status = 'completed'
+      {filter}
+    ORDER BY sj.id
+"""
+_ALL_COMPLETED_SQL = text(_COMPLETED_SETUPS_SQL.format(filter=""))
+_COMPLETED_BY_ID_SQL = text(_COMPLETED_SETUPS_SQL.format(filter="AND sj.id = ANY(CAST(:setup_ids AS integer[]))"))
+
+
+_index: Optional[DrawingHistoryIndex] = None
+_index_lock = threading.Lock()
+_stale = True
+_pending_setup_ids: Set[int] = set()
+
+
+def invalidate_drawing_history() -> None:
+    """Полностью перестроить индекс при следующем чтении."""
+    global _stale
+    _stale = True
+
+
+def note_completed_setups(setup_ids: Iterable[Optional[int]]) -> None:
+    """Дочитать эти наладки в индекс при следующем чтении (событие "setup_completed")."""
+    _pending_setup_ids.update(setup_id for setup_id in setup_ids if setup_id is not None)
+
+
+def _needs_rebuild(index: Optional[DrawingHistoryIndex]) -> bool:
+    return index is None or _stale or time.time() - index.built_at >= DRAWING_HISTORY_TTL_SEC
+
+
+def get_drawing_history(db: Session) -> DrawingHistoryIndex:
+    """Текущий индекс; перестраивает его или дочитывает новые завершённые наладки через db."""
+    global _index, _stale
+    index = _index
+    if not _needs_rebuild(index) and not _pending_setup_ids:
+        return index
+    with _index_lock:
+        index = _index
+        if _needs_rebuild(index):
+            _stale = False
+            _pending_setup_ids.clear()
+            try:
+                index = DrawingHistoryIndex.build(db.execute(_ALL_COMPLETED_SQL).fetchall())
+            except Exception:
+                _stale = True
+                if _index is not None:
+                    logger.warning("Drawing history index rebuild failed, using previous index", exc_info=True)
+                    return _index
+                raise
+            _index = index
+            logger.info(f"Drawing history index built: {len(index)} completed setups")
+            return index
+
+        if _pending_setup_ids:
+            setup_ids: List[int] = sorted(_pending_setup_ids)
+            _pending_setup_ids.difference_update(setup_ids)
+            try:
+                added = index.add(db.execute(_COMPLETED_BY_ID_SQL, {"setup_ids": setup_ids}).fetchall())
+            except Exception:
+                _pending_setup_ids.update(setup_ids)
+                logger.warning("Drawing history index update failed, will retry", exc_info=True)
+                return index
+            logger.debug(f"Drawing history index: +{added} completed setups")
+        return index
+
+
+def warm_drawing_history(session_factory) -> None:
+    """Построить индекс при старте воркера (вызывать в потоке: полная агрегация истории)."""
+    db = session_factory()
+    try:
+        get_drawing_history(db)
+    except Exception:
+        logger.warning("Drawing history index warm-up failed, will build on first request", exc_info=True)
+    finally:
+        db.close()
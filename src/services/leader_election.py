@@ -0,0 +1,158 @@
+"""
+Выбор лидера среди uvicorn workers (и инстансов) через Postgres advisory lock.
+
+Фоновые singleton-задачи (сбор данных дашборда, супервизор простоев, задачи
+APScheduler) должны выполняться ровно в одном процессе. Раньше каждая задача
+решала это сама (файл-лок в /tmp, который оставался после крэша) или не
+решала вовсе (коллектор работал во всех 8 воркерах).
+
+Как работает:
+  * каждый worker держит фоновую задачу leader_election_task();
+  * задача берёт отдельное соединение и пытается pg_try_advisory_lock(key);
+  * лидер раз в LEADER_HEARTBEAT_SEC проверяет соединение (heartbeat, с тем же
+    таймаутом). Если соединение потеряно или не ответило — лидерство снимается
+    локально, а Postgres сам освобождает lock при завершении сессии (в т.ч. при
+    крэше процесса);
+  * остальные раз в LEADER_RETRY_SEC пытаются взять lock — так происходит
+    автоматический failover.
+
+Использование:
+    if get_leader().is_leader: ...
+    @leader_only  — для задач APScheduler
+"""
+import asyncio
+import functools
+import logging
+import os
+import socket
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from src import database
+
+logger = logging.getLogger(__name__)
+
+LEADER_LOCK_NAME = os.getenv("LEADER_LOCK_NAME", "machine-logic-service:background")
+LEADER_HEARTBEAT_SEC = float(os.getenv("LEADER_HEARTBEAT_SEC", "10"))
+LEADER_RETRY_SEC = float(os.getenv("LEADER_RETRY_SEC", "15"))
+
+
+class LeaderElection:
+    def __init__(self, name: str):
+        self.name = name
+        # Стабильный между процессами ключ (hash() в Python рандомизирован)
+        self.lock_key = zlib.crc32(name.encode("utf-8"))
+        self.is_leader = False
+        self.elected_at: Optional[float] = None
+        self.last_heartbeat_at: Optional[float] = None
+        self.identity = f"{socket.gethostname()}:{os.getpid()}"
+        self._stopped = False
+
+    async def run(self) -> None:
+        """Цикл выборов. Никогда не завершается сам (кроме stop())."""
+        logger.info(f"[Leader] {self.identity}: election '{self.name}' started (key={self.lock_key})")
+        while not self._stopped:
+            try:
+                if database.async_engine is None:
+                    raise RuntimeError("async engine not initialized")
+                async with database.async_engine.connect() as sa_conn:
+                    raw = await sa_conn.get_raw_connection()
+                    pg = raw.driver_connection  # asyncpg: без неявной транзакции
+                    while not self._stopped:
+                        acquired = await pg.fetchval("SELECT pg_try_advisory_lock($1)", self.lock_key)
+                        if acquired:
+                            break
+                        await asyncio.sleep(LEADER_RETRY_SEC)
+                    if self._stopped:
+                        return
+
+                    self._set_leader(True)
+                    try:
+                        while not self._stopped:
+                            await asyncio.sleep(LEADER_HEARTBEAT_SEC)
+                            try:
+                                await pg.execute("SELECT 1", timeout=LEADER_HEARTBEAT_SEC)
+                            except asyncio.TimeoutError:
+                                # Соединение зависло: lock, возможно, уже не наш. Закрываем
+                                # сессию — сервер снимет lock, когда её обнаружит
+                                logger.warning(f"[Leader] {self.identity}: heartbeat timed out after {LEADER_HEARTBEAT_SEC}s")
+                                pg.terminate()
+                                raise
+                            self.last_heartbeat_at = time.time()
+                    finally:
+                        self._set_leader(False)
+                        try:
+                            await pg.execute("SELECT pg_advisory_unlock($1)", self.lock_key, timeout=LEADER_HEARTBEAT_SEC)
+                        except Exception:
+                            pass  # соединение уже потеряно — lock снят сервером
+            except asyncio.CancelledError:
+                self._set_leader(False)
+                raise
+            except Exception as e:
+                self._set_leader(False)
+                logger.warning(f"[Leader] {self.identity}: election error: {e}; retry in {LEADER_RETRY_SEC}s")
+                await asyncio.sleep(LEADER_RETRY_SEC)
+
+    def _set_leader(self, value: bool) -> None:
+        if value == self.is_leader:
+            return
+        self.is_leader = value
+        if value:
+            self.elected_at = self.last_heartbeat_at = time.time()
+            logger.info(f"[Leader] {self.identity}: became leader for '{self.name}'")
+        else:
+            self.elected_at = None
+            logger.warning(f"[Leader] {self.identity}: lost leadership for '{self.name}'")
+
+    def stop(self) -> None:
+        self._stopped = True
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "identity": self.identity,
+            "is_leader": self.is_leader,
+            "elected_at": self.elected_at,
+            "last_heartbeat_ago_sec": round(time.time() - self.last_heartbeat_at, 1) if self.last_heartbeat_at else None,
+        }
+
+
+_leader = LeaderElection(LEADER_LOCK_NAME)
+_leader_task: Optional[asyncio.Task] = None
+
+
+def get_leader() -> LeaderElection:
+    return _leader
+
+
+def start_leader_election() -> None:
+    global _leader_task
+    if _leader_task is None:
+        _leader_task = asyncio.create_task(_leader.run())
+
+
+async def stop_leader_election() -> None:
+    """Снимает лидерство при остановке worker, чтобы failover произошёл сразу."""
+    global _leader_task
+    _leader.stop()
+    if _leader_task is not None:
+        _leader_task.cancel()
+        try:
+            await _leader_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _leader_task = None
+
+
+def leader_only(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Декоратор для задач APScheduler: выполняется только в процессе-лидере."""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if not _leader.is_leader:
+            logger.debug(f"[Leader] skip {func.__name__}: not a leader")
+            return None
+        return await func(*args, **kwargs)
+
+    return wrapper
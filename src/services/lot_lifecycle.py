@@ -0,0 +1,108 @@
+"""
+Автоматические переходы статуса лота.
+
+    in_production   → post_production  все наладки лота завершены
+    post_production → closed           все батчи лота в финальных статусах ОТК
+
+Раньше main.py проверял каждый лот ORM-запросами после commit, коммитил
+статус ещё раз и «синхронизировал» его с Telegram-ботом тем же UPDATE lots
+через новый create_engine() на каждый вызов (пул соединений, который никто
+не закрывал). Бот читает ту же БД — достаточно одного UPDATE.
+
+Здесь переход — один UPDATE ... WHERE id = ANY(:lot_ids) AND <условие>
+RETURNING в транзакции вызывающего эндпоинта (до его commit): изменение
+наладки/батча и статус лота фиксируются вместе, лоты проверяются пачкой.
+На каждый изменённый лот ставится событие notify_change("lot_status_changed").
+"""
+import logging
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from src.services.cache_invalidation import notify_change
+
+logger = logging.getLogger(__name__)
+
+LOT_STATUS_EVENT = "lot_status_changed"
+
+ACTIVE_SETUP_STATUSES = ("created", "pending_qc", "allowed", "started", "queued")
+# rework_repair — промежуточный статус, лот с ним не закрывается
+FINAL_QC_LOCATIONS = ("good", "defect", "archived")
+
+
+@dataclass(frozen=True)
+class LotTransition:
+    lot_id: int
+    from_status: str
+    to_status: str
+
+
+_TO_POST_PRODUCTION_SQL = text("""
+    UPDATE lots l
+    SET status = 'post_production'
+    WHERE l.id = ANY(CAST(:lot_ids AS integer[]))
+      AND l.status = 'in_production'
+      AND NOT EXISTS (
+          SELECT 1 FROM setup_jobs sj
+          WHERE sj.lot_id = l.id
+            AND sj.status = ANY(CAST(:active_statuses AS text[]))
+            AND sj.end_time IS NULL
+      )
+    RETURNING l.id
+""")
+
+_TO_CLOSED_SQL = text("""
+    UPDATE lots l
+    SET status = 'closed'
+    WHERE l.id = ANY(CAST(:lot_ids AS integer[]))
+      AND l.status = 'post_production'
+      AND EXISTS (SELECT 1 FROM batches b WHERE b.lot_id = l.id)
+      AND NOT EXISTS (
+          SELECT 1 FROM batches b
+          WHERE b.lot_id = l.id
+            AND (b.current_location IS NULL
+                 OR b.current_location <> ALL(CAST(:final_locations AS text[])))
+      )
+    RETURNING l.id
+""")
+
+
+def _lot_ids(lot_ids: Iterable[Optional[int]]) -> List[int]:
+    return sorted({lot_id for lot_id in lot_ids if lot_id is not None})
+
+
+def record_transition(db: Session, lot_id: int, from_status: str, to_status: str) -> LotTransition:
+    """Ставит событие о смене статуса лота в текущую транзакцию (ручные переходы)."""
+    notify_change(db, LOT_STATUS_EVENT, lot_id=lot_id)
+    logger.info(f"Lot {lot_id}: {from_status} → {to_status}")
+    return LotTransition(lot_id, from_status, to_status)
+
+
+def _apply(db: Session, sql, params: dict, from_status: str, to_status: str) -> List[LotTransition]:
+    db.flush()  # UPDATE должен видеть несохранённые ORM-изменения этой транзакции
+    changed = sorted(row.id for row in db.execute(sql, params))
+    return [record_transition(db, lot_id, from_status, to_status) for lot_id in changed]
+
+
+def complete_finished_lots(db: Session, lot_ids: Iterable[Optional[int]]) -> List[LotTransition]:
+    """in_production → post_production для лотов без активных наладок. Вызывать до commit."""
+    ids = _lot_ids(lot_ids)
+    if not ids:
+        return []
+    return _apply(db, _TO_POST_PRODUCTION_SQL, {
+        "lot_ids": ids,
+        "active_statuses": list(ACTIVE_SETUP_STATUSES),
+    }, "in_production", "post_production")
+
+
+def close_inspected_lots(db: Session, lot_ids: Iterable[Optional[int]]) -> List[LotTransition]:
+    """post_production → closed для лотов, все батчи которых прошли ОТК. Вызывать до commit."""
+    ids = _lot_ids(lot_ids)
+    if not ids:
+        return []
+    return _apply(db, _TO_CLOSED_SQL, {
+        "lot_ids": ids,
+        "final_locations": list(FINAL_QC_LOCATIONS),
+    }, "post_production", "closed")
@@ -0,0 +1,287 @@
+"""
+Снимок очередей станков для рекомендаций планирования.
+
+/planning/recommend-machines и /planning/recommend-with-queue на каждый клик
+планировщика заново читали весь цех (станки, текущие диаметры, лоты в
+очередях, чертежи очереди) и пересчитывали переналадки в Python. Теперь это
+один неизменяемый MachineQueueSnapshot на worker:
+
+    станок → параметры, текущий диаметр, упорядоченная очередь лотов
+             (in_production первым, затем assigned по assigned_order),
+             часы работы, часы переналадок, список чертежей
+
+Эндпоинты добавляют к нему только зависящее от запроса (история детали,
+ETA относительно текущего момента, score).
+
+Снимок перестраивается по событию "planning_queue_changed" (триггеры на
+lots / setup_jobs / parts / machines, миграция 060, через LISTEN/NOTIFY —
+см. invalidate_machine_queue_snapshot) и не реже раза в
+PLANNING_SNAPSHOT_TTL_SEC: остаток лотов в работе считается по последнему
+показанию станка, которое меняется постоянно.
+
+Использование:
+    snapshot = get_machine_queue_snapshot(db)
+    for machine in snapshot.operational(): machine.queue_hours ...
+"""
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+PLANNING_SNAPSHOT_TTL_SEC = float(os.getenv("PLANNING_SNAPSHOT_TTL_SEC", "120"))
+
+# Время переналадки (часы)
+SETUP_TIME_NORMAL = 12.0   # на другую деталь
+SETUP_TIME_RELATED = 6.0   # на родственную деталь (тот же базовый чертёж)
+
+# Суффикс родственного чертежа — только ОДНА цифра: 1409-04-1 → 1409-04, но 577-42 — сама база
+_DRAWING_SUFFIX_RE = re.compile(r"^(.+)-(\d)$")
+
+
+def drawing_base(drawing_number: Optional[str]) -> str:
+    """Базовый чертёж: "1409-04-1" → "1409-04", "577-42" → "577-42"."""
+    if not drawing_number:
+        return ""
+    match = _DRAWING_SUFFIX_RE.match(drawing_number)
+    return match.group(1) if match else drawing_number
+
+
+def changeover_hours(prev_drawing: Optional[str], next_drawing: Optional[str]) -> float:
+    """Переналадка между соседними лотами очереди."""
+    prev_base = drawing_base(prev_drawing)
+    if prev_base and prev_base == drawing_base(next_drawing):
+        return SETUP_TIME_RELATED
+    return SETUP_TIME_NORMAL
+
+
+@dataclass(frozen=True)
+class QueuedLot:
+    lot_id: int
+    lot_number: str
+    status: str                       # 'in_production' | 'assigned'
+    position: int                     # assigned_order; 0 — в работе
+    drawing_number: Optional[str]
+    base_drawing: str                 # drawing_base(drawing_number) — для поиска родственных
+    quantity: int
+    produced: int
+    cycle_time_sec: Optional[int]
+    work_hours: float                 # остаток работы
+    changeover_hours: float           # переналадка перед этим лотом (0 для первого)
+    due_date: Optional[datetime]
+    diameter: Optional[float]
+
+
+@dataclass(frozen=True)
+class MachineQueue:
+    machine_id: int
+    name: str
+    min_diameter: Optional[float]
+    max_diameter: Optional[float]
+    max_bar_length: Optional[float]
+    max_part_length: Optional[float]
+    is_jbs: bool
+    supports_no_guidebush: bool
+    location_id: Optional[int]
+    current_diameter: Optional[float]          # диаметр активной наладки
+    lots: Tuple[QueuedLot, ...] = ()
+    work_hours: float = 0.0
+    changeover_hours: float = 0.0
+
+    @property
+    def queue_hours(self) -> float:
+        return self.work_hours + self.changeover_hours
+
+    @property
+    def drawings(self) -> List[Optional[str]]:
+        return [lot.drawing_number for lot in self.lots]
+
+    @property
+    def tail_diameter(self) -> Optional[float]:
+        """Диаметр, после которого встанет новый лот (последний в очереди); None — очередь пуста."""
+        return self.lots[-1].diameter if self.lots else None
+
+    def fits(self, diameter: float) -> bool:
+        return (not self.min_diameter or diameter >= self.min_diameter) and \
+               (not self.max_diameter or diameter <= self.max_diameter)
+
+
+@dataclass(frozen=True)
+class MachineQueueSnapshot:
+    """Неизменяемый снимок очередей активных станков (по имени станка)."""
+
+    machines: Dict[int, MachineQueue] = field(default_factory=dict)
+    built_at: float = 0.0
+
+    @classmethod
+    def build(cls, machine_rows, diameter_rows, lot_rows) -> "MachineQueueSnapshot":
+        current_diameters = {row.machine_id: row.current_diameter for row in diameter_rows}
+
+        lots_by_machine: Dict[int, List] = {}
+        for row in lot_rows:
+            lots_by_machine.setdefault(row.machine_id, []).append(row)
+
+        machines: Dict[int, MachineQueue] = {}
+        for m in machine_rows:
+            rows = sorted(
+                lots_by_machine.get(m.id, []),
+                key=lambda r: (r.status != "in_production", r.position if r.position is not None else 999, r.lot_id),
+            )
+            lots: List[QueuedLot] = []
+            work_total = changeover_total = 0.0
+            prev_drawing = None
+            for i, row in enumerate(rows):
+                quantity = row.quantity or 0
+                produced = row.produced or 0
+                work = 0.0
+                if row.avg_cycle_time and quantity:
+                    work = row.avg_cycle_time * max(0, quantity - produced) / 3600.0
+                changeover = changeover_hours(prev_drawing, row.drawing_number) if i > 0 else 0.0
+                prev_drawing = row.drawing_number
+                work_total += work
+                changeover_total += changeover
+                lots.append(QueuedLot(
+                    lot_id=row.lot_id,
+                    lot_number=row.lot_number,
+                    status=row.status,
+                    position=0 if row.status == "in_production" else (row.position if row.position is not None else 999),
+                    drawing_number=row.drawing_number,
+                    base_drawing=drawing_base(row.drawing_number),
+                    quantity=quantity,
+                    produced=produced,
+                    cycle_time_sec=row.avg_cycle_time,
+                    work_hours=work,
+                    changeover_hours=changeover,
+                    due_date=row.due_date,
+                    diameter=row.actual_diameter or row.recommended_diameter,
+                ))
+            machines[m.id] = MachineQueue(
+                machine_id=m.id,
+                name=m.name,
+                min_diameter=m.min_diameter,
+                max_diameter=m.max_diameter,
+                max_bar_length=m.max_bar_length,
+                max_part_length=m.max_part_length,
+                is_jbs=bool(m.is_jbs),
+                supports_no_guidebush=bool(m.supports_no_guidebush),
+                location_id=m.location_id,
+                current_diameter=current_diameters.get(m.id),
+                lots=tuple(lots),
+                work_hours=work_total,
+                changeover_hours=changeover_total,
+            )
+        return cls(machines=machines, built_at=time.time())
+
+    def operational(self) -> List[MachineQueue]:
+        """Активные исправные станки в порядке имени."""
+        return list(self.machines.values())
+
+    def get(self, machine_id: Optional[int]) -> Optional[MachineQueue]:
+        return self.machines.get(machine_id) if machine_id is not None else None
+
+
+_MACHINES_SQL = text("""
+    SELECT
+        m.id, m.name, m.min_diameter, m.max_diameter, m.max_bar_length,
+        m.max_part_length, m.is_jbs, m.supports_no_guidebush, m.location_id
+    FROM machines m
+    WHERE m.is_active = true
+      AND COALESCE(m.is_operational, true) = true
+    ORDER BY m.name
+""")
+
+_CURRENT_DIAMETERS_SQL = text("""
+    SELECT sj.machine_id, l.actual_diameter AS current_diameter
+    FROM setup_jobs sj
+    JOIN lots l ON sj.lot_id = l.id
+    WHERE sj.status IN ('created', 'pending_qc', 'allowed', 'started')
+      AND sj.end_time IS NULL
+""")
+
+# assigned: станок из lots.assigned_machine_id, произведено 0;
+# in_production: станок из активной наладки, произведено — последнее показание
+# станка (machine_last_reading), если оно этой наладки
+_QUEUE_LOTS_SQL = text("""
+    SELECT
+        l.id AS lot_id, l.lot_number, l.assigned_machine_id AS machine_id,
+        l.assigned_order AS position, l.due_date, l.status, l.actual_diameter,
+        COALESCE(l.total_planned_quantity, l.initial_planned_quantity) AS quantity,
+        0 AS produced,
+        p.drawing_number, p.avg_cycle_time, p.recommended_diameter
+    FROM lots l
+    JOIN parts p ON l.part_id = p.id
+    WHERE l.status = 'assigned'
+      AND l.assigned_machine_id IS NOT NULL
+
+    UNION ALL
+
+    SELECT
+        l.id AS lot_id, l.lot_number, sj.machine_id,
+        0 AS position, l.due_date, l.status, l.actual_diameter,
+        COALESCE(l.total_planned_quantity, l.initial_planned_quantity) AS quantity,
+        COALESCE(lr.reading, 0) AS produced,
+        p.drawing_number, p.avg_cycle_time, p.recommended_diameter
+    FROM lots l
+    JOIN parts p ON l.part_id = p.id
+    JOIN setup_jobs sj ON sj.lot_id = l.id
+    LEFT JOIN machine_last_reading lr ON lr.machine_id = sj.machine_id AND lr.setup_job_id = sj.id
+    WHERE l.status = 'in_production'
+      AND sj.status IN ('created', 'pending_qc', 'allowed', 'started')
+      AND sj.end_time IS NULL
+""")
+
+
+_snapshot: Optional[MachineQueueSnapshot] = None
+# Блокирующий Lock: вызывается только из роутера /planning, который объявлен с
+# route_class=SyncDBOffloadRoute — эндпоинты выполняются в пуле потоков, не в event loop
+_snapshot_lock = threading.Lock()
+_stale = True
+
+
+def invalidate_machine_queue_snapshot() -> None:
+    """Пометить снимок устаревшим: следующий get_machine_queue_snapshot() перестроит его."""
+    global _stale
+    _stale = True
+
+
+def _is_fresh(snapshot: Optional[MachineQueueSnapshot]) -> bool:
+    return snapshot is not None and not _stale and time.time() - snapshot.built_at < PLANNING_SNAPSHOT_TTL_SEC
+
+
+def get_machine_queue_snapshot(db: Session) -> MachineQueueSnapshot:
+    """Текущий снимок; при необходимости перестраивает его тремя запросами через db."""
+    global _snapshot, _stale
+    snapshot = _snapshot
+    if _is_fresh(snapshot):
+        return snapshot
+    with _snapshot_lock:
+        snapshot = _snapshot
+        if _is_fresh(snapshot):
+            return snapshot
+        _stale = False
+        try:
+            snapshot = MachineQueueSnapshot.build(
+                db.execute(_MACHINES_SQL).fetchall(),
+                db.execute(_CURRENT_DIAMETERS_SQL).fetchall(),
+                db.execute(_QUEUE_LOTS_SQL).fetchall(),
+            )
+        except Exception:
+            _stale = True
+            if _snapshot is not None:
+                logger.warning("Machine queue snapshot refresh failed, using previous snapshot", exc_info=True)
+                return _snapshot
+            raise
+        _snapshot = snapshot
+        logger.info(
+            f"Machine queue snapshot built: {len(snapshot.machines)} machines, "
+            f"{sum(len(m.lots) for m in snapshot.machines.values())} queued lots"
+        )
+        return snapshot
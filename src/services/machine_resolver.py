@@ -0,0 +1,162 @@
+"""
+Единый резолвер имён станков: alias → machine_id за O(1).
+
+Одно и то же имя станка приходит в разных формах:
+    MLS:        SR-32, D-26, K-16-2
+    MTConnect:  M_5_SR_32, DT-26, K-162
+    ввод людей: sr32, "SR 32", sr_32
+
+machine_key() приводит любую форму к одному ключу (sr32, d26, k162), а
+индекс строится один раз из таблицы machines и хранится в памяти воркера.
+Раньше каждый эндпоинт нормализовал имя по-своему и делал по запросу
+lower(name) = lower(:x) на каждый вариант.
+
+Индекс перечитывается при изменении каталога станков (событие
+"machines_changed" через LISTEN/NOTIFY, см. invalidate_machine_index) и,
+на случай пропущенного события, не реже раза в MACHINE_INDEX_TTL_SEC.
+
+Использование:
+    index = get_machine_index(db)
+    machine_id = index.resolve("M_5_DT_26")
+"""
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+MACHINE_INDEX_TTL_SEC = float(os.getenv("MACHINE_INDEX_TTL_SEC", "600"))
+
+_MTCONNECT_PREFIX_RE = re.compile(r"^m_[a-z0-9]+_")  # M_5_SR_32 → SR_32
+_SEPARATORS_RE = re.compile(r"[^a-z0-9]+")
+_DT_BT_RE = re.compile(r"^([db])t(?=\d)")  # DT26 → D26, BT38 → B38
+
+
+def machine_key(name: Optional[str]) -> str:
+    """
+    Канонический ключ имени станка.
+    M_5_SR_32 / SR-32 / sr 32 → sr32; DT-26 → d26; K-162 / K-16-2 → k162.
+    """
+    s = (name or "").strip().lower()
+    s = _MTCONNECT_PREFIX_RE.sub("", s)
+    s = _SEPARATORS_RE.sub("", s)
+    return _DT_BT_RE.sub(r"\1", s)
+
+
+@dataclass(frozen=True)
+class MachineEntry:
+    id: int
+    name: str
+    is_active: bool
+    key: str
+
+
+@dataclass(frozen=True)
+class MachineIndex:
+    """Неизменяемый снимок таблицы machines с индексами по имени."""
+
+    machines: List[MachineEntry] = field(default_factory=list)
+    by_id: Dict[int, MachineEntry] = field(default_factory=dict)
+    by_lower_name: Dict[str, int] = field(default_factory=dict)
+    by_key: Dict[str, int] = field(default_factory=dict)
+    built_at: float = 0.0
+
+    @classmethod
+    def build(cls, rows) -> "MachineIndex":
+        machines: List[MachineEntry] = []
+        by_id: Dict[int, MachineEntry] = {}
+        by_lower_name: Dict[str, int] = {}
+        by_key: Dict[str, int] = {}
+        # Активные станки первыми: при совпадении ключей выигрывает активный
+        for row in sorted(rows, key=lambda r: (not r.is_active, r.id)):
+            if not row.name:
+                continue
+            entry = MachineEntry(id=row.id, name=row.name, is_active=bool(row.is_active), key=machine_key(row.name))
+            machines.append(entry)
+            by_id[entry.id] = entry
+            by_lower_name.setdefault(entry.name.strip().lower(), entry.id)
+            if entry.key in by_key:
+                logger.warning(
+                    f"Machine alias collision: '{entry.name}' and '{by_id[by_key[entry.key]].name}' → '{entry.key}'"
+                )
+                continue
+            by_key[entry.key] = entry.id
+        return cls(machines=machines, by_id=by_id, by_lower_name=by_lower_name, by_key=by_key, built_at=time.time())
+
+    def resolve(self, name: Optional[str]) -> Optional[int]:
+        """machine_id по любой форме имени или None."""
+        if not name:
+            return None
+        machine_id = self.by_lower_name.get(name.strip().lower())
+        if machine_id is not None:
+            return machine_id
+        return self.by_key.get(machine_key(name))
+
+    def resolve_fuzzy(self, code: Optional[str]) -> Optional[int]:
+        """
+        resolve() + поиск по вхождению ключа (для кодов с карточек вида
+        "SR-32 Main"). Работает по индексу в памяти, без запросов к БД.
+        """
+        machine_id = self.resolve(code)
+        if machine_id is not None:
+            return machine_id
+        key = machine_key(code)
+        if not key:
+            return None
+        for entry in self.machines:
+            if entry.key and (key in entry.key or entry.key in key):
+                return entry.id
+        return None
+
+    def name_of(self, machine_id: Optional[int]) -> Optional[str]:
+        entry = self.by_id.get(machine_id) if machine_id is not None else None
+        return entry.name if entry else None
+
+    def canonical_name(self, name: Optional[str]) -> Optional[str]:
+        """MLS-имя станка по любой форме (M_5_DT_26 → D-26)."""
+        return self.name_of(self.resolve(name))
+
+    def active(self) -> List[MachineEntry]:
+        return [m for m in self.machines if m.is_active]
+
+
+_index: Optional[MachineIndex] = None
+_index_lock = threading.Lock()  # индекс читают из основного loop, пула offload и threadpool
+_stale = True
+
+
+def invalidate_machine_index() -> None:
+    """Пометить индекс устаревшим: следующий get_machine_index() перечитает machines."""
+    global _stale
+    _stale = True
+
+
+def get_machine_index(db: Session) -> MachineIndex:
+    """Текущий индекс; при необходимости перестраивает его одним запросом через db."""
+    global _index, _stale
+    index = _index
+    if index is not None and not _stale and time.time() - index.built_at < MACHINE_INDEX_TTL_SEC:
+        return index
+    with _index_lock:
+        index = _index
+        if index is not None and not _stale and time.time() - index.built_at < MACHINE_INDEX_TTL_SEC:
+            return index
+        _stale = False
+        try:
+            rows = db.execute(text("SELECT id, name, COALESCE(is_active, TRUE) AS is_active FROM machines")).fetchall()
+        except Exception:
+            _stale = True
+            if index is not None:
+                logger.warning("Machine index refresh failed, using previous index", exc_info=True)
+                return index
+            raise
+        _index = MachineIndex.build(rows)
+        logger.info(f"Machine index built: {len(_index.machines)} machines, {len(_index.by_key)} aliases")
+        return _index
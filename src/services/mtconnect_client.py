@@ -3,79 +3,289 @@
 
 Отвечает за корректировку счётчика деталей в MTConnect
 при записи показаний оператором или событиях ОТК.
+
+Запросы идут через очередь CounterSyncQueue (одна на worker):
+  * для каждого станка хранится только последнее желаемое значение —
+    серия показаний подряд превращается в один POST /api/counters/set;
+  * отправка через общий keep-alive клиент снимка MTConnect
+    (src/services/mtconnect_snapshot.py), не больше
+    MTCONNECT_SYNC_CONCURRENCY запросов одновременно и не больше одного
+    на станок (значения не обгоняют друг друга);
+  * при недоступности API — повтор с экспоненциальной задержкой,
+    4xx (например, неизвестный станок) не повторяется;
+  * состояние по станкам — GET /health/mtconnect/counter-sync.
+
+Сброс счётчика при разрешении ОТК — разовое событие, а не «последнее
+значение», поэтому идёт через outbox (src/services/outbox.py) и не теряется
+при перезапуске worker.
 """
 
+import asyncio
 import os
 import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Set
+
 import httpx
+from sqlalchemy import text
+
+from src import database
+from src.services.mtconnect_snapshot import get_mtconnect_snapshot
+from src.services.outbox import OutboxPermanentError, register_outbox_handler
 
 logger = logging.getLogger(__name__)
 
 # URL MTConnect API - определяем в зависимости от окружения
 # Production: https://mtconnect-core-production.up.railway.app
 MTCONNECT_API_URL = os.getenv('MTCONNECT_API_URL', 'https://mtconnect-core-production.up.railway.app')
+MTCONNECT_SYNC_CONCURRENCY = int(os.getenv('MTCONNECT_SYNC_CONCURRENCY', '4'))
+MTCONNECT_SYNC_DEBOUNCE_SEC = float(os.getenv('MTCONNECT_SYNC_DEBOUNCE_SEC', '1'))
+MTCONNECT_SYNC_BACKOFF_BASE_SEC = float(os.getenv('MTCONNECT_SYNC_BACKOFF_BASE_SEC', '2'))
+MTCONNECT_SYNC_BACKOFF_MAX_SEC = float(os.getenv('MTCONNECT_SYNC_BACKOFF_MAX_SEC', '120'))
 
 logger.info(f"MTConnect API URL: {MTCONNECT_API_URL}")
 
 
+class CounterSyncRejected(Exception):
+    """MTConnect ответил 4xx — повтор не поможет."""
+
+
+async def _post_counter(client: httpx.AsyncClient, machine_name: str, desired_production: int) -> None:
+    """
+    POST /api/counters/set: MTConnect cloud-api корректирует basePartCount так,
+    чтобы productionPartCount стал равен desired_production.
+    Исключение — при любой неудаче (CounterSyncRejected для 4xx).
+    """
+    response = await client.post(
+        f"{MTCONNECT_API_URL}/api/counters/set",
+        json={"machineId": machine_name, "desiredProduction": desired_production},
+    )
+    if 400 <= response.status_code < 500:
+        raise CounterSyncRejected(f"status={response.status_code}, response={response.text[:200]}")
+    response.raise_for_status()
+
+
+@dataclass
+class MachineSyncState:
+    desired: Optional[int] = None       # ещё не отправленное значение
+    requested_at: float = 0.0           # первый запрос в текущем окне (debounce)
+    in_flight: bool = False
+    failures: int = 0
+    retry_at: float = 0.0
+    last_sent_value: Optional[int] = None
+    last_success_at: Optional[float] = None
+    last_error: Optional[str] = None
+    requests: int = 0
+    sends: int = 0
+
+
+class CounterSyncQueue:
+    def __init__(self):
+        self._machines: Dict[str, MachineSyncState] = {}
+        self._lock = threading.Lock()  # request() вызывается и из потоков пула offload
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._senders: Set[asyncio.Task] = set()
+
+    def request(self, machine_name: str, desired_production: int) -> None:
+        """Поставить желаемое значение счётчика станка (неблокирующе, из любого потока)."""
+        if not machine_name:
+            return
+        with self._lock:
+            state = self._machines.setdefault(machine_name, MachineSyncState())
+            if state.desired is None:
+                state.requested_at = time.time()
+            state.desired = int(desired_production)
+            state.requests += 1
+        self._wake()
+
+    def _wake(self) -> None:
+        loop = self._loop
+        if loop is None or self._wakeup is None:
+            return
+        try:
+            if loop is asyncio.get_running_loop():
+                self._wakeup.set()
+                return
+        except RuntimeError:
+            pass
+        loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _due(self, now: float) -> Dict[str, int]:
+        """Станки, которые пора отправить: {имя: значение}. Помечает их in_flight."""
+        due: Dict[str, int] = {}
+        with self._lock:
+            for name, state in self._machines.items():
+                if state.desired is None or state.in_flight:
+                    continue
+                if now < state.retry_at or now < state.requested_at + MTCONNECT_SYNC_DEBOUNCE_SEC:
+                    continue
+                due[name] = state.desired
+                state.desired = None
+                state.in_flight = True
+        return due
+
+    def _next_wakeup(self, now: float) -> Optional[float]:
+        with self._lock:
+            times = [
+                max(state.retry_at, state.requested_at + MTCONNECT_SYNC_DEBOUNCE_SEC)
+                for state in self._machines.values()
+                if state.desired is not None and not state.in_flight
+            ]
+        return max(0.0, min(times) - now) if times else None
+
+    async def _send(self, machine_name: str, value: int) -> None:
+        retry = False
+        try:
+            async with self._semaphore:
+                logger.info(f"🔄 MTConnect sync: machine={machine_name}, desiredProduction={value}")
+                await _post_counter(get_mtconnect_snapshot().get_client(), machine_name, value)
+            error = None
+        except CounterSyncRejected as e:
+            error = str(e)
+            logger.warning(f"⚠️ MTConnect sync rejected: machine={machine_name}, {e}")
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            retry = True
+            logger.warning(f"⚠️ MTConnect API not available: machine={machine_name}, {error}")
+
+        with self._lock:
+            state = self._machines[machine_name]
+            state.in_flight = False
+            state.sends += 1
+            if error is None:
+                state.failures = 0
+                state.retry_at = 0.0
+                state.last_sent_value = value
+                state.last_success_at = time.time()
+                state.last_error = None
+            else:
+                state.last_error = error
+                if retry:
+                    state.failures += 1
+                    delay = min(MTCONNECT_SYNC_BACKOFF_MAX_SEC,
+                                MTCONNECT_SYNC_BACKOFF_BASE_SEC * 2 ** (state.failures - 1))
+                    state.retry_at = time.time() + delay * random.uniform(0.8, 1.2)
+                    if state.desired is None:  # более новое значение не затираем
+                        state.desired = value
+                        state.requested_at = 0.0
+        self._wake()
+
+    async def _run_forever(self) -> None:
+        logger.info(f"MTConnect counter sync queue started (concurrency: {MTCONNECT_SYNC_CONCURRENCY})")
+        while True:
+            now = time.time()
+            for name, value in self._due(now).items():
+                task = asyncio.create_task(self._send(name, value))
+                self._senders.add(task)
+                task.add_done_callback(self._senders.discard)
+            timeout = self._next_wakeup(time.time())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._semaphore = asyncio.Semaphore(MTCONNECT_SYNC_CONCURRENCY)
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        if self._senders:
+            await asyncio.gather(*self._senders, return_exceptions=True)
+        pending = [name for name, state in self._machines.items() if state.desired is not None]
+        if pending:
+            logger.warning(f"MTConnect counter sync: {len(pending)} machines not synced on shutdown: {pending}")
+
+    def status(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            machines = {
+                name: {
+                    "pending_value": state.desired,
+                    "in_flight": state.in_flight,
+                    "last_sent_value": state.last_sent_value,
+                    "last_success_ago_sec": round(now - state.last_success_at, 1) if state.last_success_at else None,
+                    "failures": state.failures,
+                    "retry_in_sec": round(max(0.0, state.retry_at - now), 1),
+                    "last_error": state.last_error,
+                    "requests": state.requests,
+                    "sends": state.sends,
+                }
+                for name, state in sorted(self._machines.items())
+            }
+        return {
+            "queue_depth": sum(1 for m in machines.values() if m["pending_value"] is not None),
+            "in_flight": sum(1 for m in machines.values() if m["in_flight"]),
+            "machines": machines,
+        }
+
+
+_queue = CounterSyncQueue()
+
+
+def get_counter_sync_queue() -> CounterSyncQueue:
+    return _queue
+
+
 async def sync_counter_to_mtconnect(machine_name: str, desired_production: int) -> bool:
     """
-    Синхронизирует счётчик деталей в MTConnect с указанным значением.
-    
-    Вызывает POST /api/counters/set на MTConnect cloud-api,
-    который корректирует basePartCount так, чтобы productionPartCount
-    стал равен desired_production.
-    
+    Ставит синхронизацию счётчика деталей станка в очередь.
+
     Args:
         machine_name: Имя станка (machineId в MTConnect), например "SR-26"
         desired_production: Желаемое значение счётчика деталей
-        
+
     Returns:
-        True если синхронизация успешна, False в противном случае
+        True — значение принято в очередь (отправка асинхронно, с повторами)
     """
-    url = f"{MTCONNECT_API_URL}/api/counters/set"
-    payload = {
-        "machineId": machine_name,
-        "desiredProduction": desired_production
-    }
-    
+    get_counter_sync_queue().request(machine_name, desired_production)
+    return True
+
+
+def _setup_has_readings(setup_id: int) -> bool:
+    db = database.SessionLocal()
     try:
-        logger.info(f"🔄 MTConnect sync: machine={machine_name}, desiredProduction={desired_production}")
-        
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(url, json=payload)
-            
-            if response.status_code == 200 or response.status_code == 201:
-                result = response.json()
-                logger.info(f"✅ MTConnect sync success: {result}")
-                return True
-            else:
-                logger.warning(f"⚠️ MTConnect sync failed: status={response.status_code}, response={response.text}")
-                return False
-                
-    except httpx.ConnectError as e:
-        logger.warning(f"⚠️ MTConnect API not available: {e}")
-        return False
-    except httpx.TimeoutException as e:
-        logger.warning(f"⚠️ MTConnect API timeout: {e}")
-        return False
-    except Exception as e:
-        logger.error(f"❌ MTConnect sync error: {e}", exc_info=True)
-        return False
-
-
-async def reset_counter_on_qa_approval(machine_name: str) -> bool:
+        return db.execute(
+            text("SELECT 1 FROM machine_readings WHERE setup_job_id = :setup_id LIMIT 1"),
+            {"setup_id": setup_id},
+        ).first() is not None
+    finally:
+        db.close()
+
+
+async def _deliver_counter_reset(payload: dict) -> None:
     """
-    Сбрасывает счётчик деталей в MTConnect на 0 при разрешении ОТК.
-    
-    Вызывается когда статус наладки меняется на 'allowed'.
-    
-    Args:
-        machine_name: Имя станка (machineId в MTConnect)
-        
-    Returns:
-        True если сброс успешен, False в противном случае
+    Outbox: сброс счётчика деталей в MTConnect на 0 при разрешении ОТК.
+
+    Если по наладке уже есть показания, сброс устарел (счётчик выставлен
+    синхронизацией показаний) — пропускаем, чтобы не обнулить его задним числом.
     """
+    machine_name = payload["machine_name"]
+    setup_id = payload.get("setup_id")
+    if setup_id and await asyncio.to_thread(_setup_has_readings, setup_id):
+        logger.info(f"MTConnect counter reset for {machine_name} skipped: setup {setup_id} already has readings")
+        return
     logger.info(f"🔄 Resetting MTConnect counter to 0 for machine {machine_name} (QA approval)")
-    return await sync_counter_to_mtconnect(machine_name, 0)
+    try:
+        await _post_counter(get_mtconnect_snapshot().get_client(), machine_name, 0)
+    except CounterSyncRejected as e:
+        raise OutboxPermanentError(str(e)) from e
+
 
+register_outbox_handler("mtconnect_counter_reset", "mtconnect", _deliver_counter_reset)
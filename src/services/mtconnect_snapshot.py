@@ -0,0 +1,222 @@
+"""
+MTConnect snapshot — единый источник данных GET {MTCONNECT_API_URL}/api/machines.
+
+Раньше список станков запрашивали по отдельности супервизор простоев,
+materials, notification_service, /lots/{id}/produced и whatsapp webhook —
+каждый раз с новым HTTP-клиентом (новое TCP/TLS соединение), а в sync-роутах
+ещё и блокирующим httpx.Client.
+
+Теперь в каждом worker работает один поллер с долгоживущим httpx.AsyncClient
+(keep-alive). Он раз в MTCONNECT_POLL_INTERVAL_SEC обновляет снимок:
+список станков + индексы по исходному имени и machine_key().
+
+API:
+    snap = await get_mtconnect_snapshot().get()         # async, из любого event loop
+    snap = get_mtconnect_snapshot().get_sync()          # sync-код (threadpool)
+    snap.find("SR-32") / snap.part_counts()
+
+Если MTConnect недоступен и снимок старше MTCONNECT_SNAPSHOT_STALE_FACTOR × max_age,
+get()/get_sync() отдают пустой снимок (fetched_at = None): станки «не найдены»,
+и вызывающий уходит в свой fallback, а не работает со старыми счётчиками.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from src.services.machine_resolver import machine_key
+
+logger = logging.getLogger(__name__)
+
+MTCONNECT_API_URL = os.getenv('MTCONNECT_API_URL', 'https://mtconnect-core-production.up.railway.app')
+MTCONNECT_POLL_INTERVAL_SEC = float(os.getenv('MTCONNECT_POLL_INTERVAL_SEC', '10'))
+MTCONNECT_SNAPSHOT_MAX_AGE_SEC = float(os.getenv('MTCONNECT_SNAPSHOT_MAX_AGE_SEC', '30'))
+MTCONNECT_HTTP_TIMEOUT_SEC = float(os.getenv('MTCONNECT_HTTP_TIMEOUT_SEC', '10'))
+# Жёсткий предел: снимок старше max_age × factor не отдаётся вовсе
+MTCONNECT_SNAPSHOT_STALE_FACTOR = float(os.getenv('MTCONNECT_SNAPSHOT_STALE_FACTOR', '2'))
+
+
+@dataclass(frozen=True)
+class MachinesSnapshot:
+    """Неизменяемый снимок /api/machines (mtconnect + adam)."""
+
+    machines: List[Dict[str, Any]] = field(default_factory=list)
+    by_name: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    by_key: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    fetched_at: Optional[float] = None
+
+    @classmethod
+    def from_response(cls, data: Dict[str, Any]) -> "MachinesSnapshot":
+        machines: List[Dict[str, Any]] = []
+        machines.extend(data.get('machines', {}).get('mtconnect') or [])
+        machines.extend(data.get('machines', {}).get('adam') or [])
+        by_name: Dict[str, Dict[str, Any]] = {}
+        by_key: Dict[str, Dict[str, Any]] = {}
+        for m in machines:
+            name = m.get('name', '')
+            by_name[name] = m
+            by_key[machine_key(name)] = m
+        return cls(machines=machines, by_name=by_name, by_key=by_key, fetched_at=time.time())
+
+    @property
+    def age_sec(self) -> Optional[float]:
+        return time.time() - self.fetched_at if self.fetched_at else None
+
+    def find(self, name: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Станок по имени MTConnect или по имени MLS (SR-32, D-26, K-16-2)."""
+        if not name:
+            return None
+        return self.by_name.get(name) or self.by_key.get(machine_key(name))
+
+    def part_counts(self) -> Dict[str, Optional[int]]:
+        """{machine_key(имя): displayPartCount}"""
+        return {key: m.get('data', {}).get('displayPartCount') for key, m in self.by_key.items()}
+
+
+_EMPTY = MachinesSnapshot()
+
+
+def _within_limit(snap: MachinesSnapshot, max_age: float) -> MachinesSnapshot:
+    """Снимок, если он не старше жёсткого предела, иначе пустой."""
+    if snap.fetched_at and snap.age_sec <= max_age * MTCONNECT_SNAPSHOT_STALE_FACTOR:
+        return snap
+    if snap.fetched_at:
+        logger.warning(f"MTConnect snapshot is stale ({snap.age_sec:.0f}s old), not using it")
+    return _EMPTY
+
+
+class MTConnectSnapshotService:
+    def __init__(self, base_url: str = MTCONNECT_API_URL):
+        self.base_url = base_url
+        self._snapshot: MachinesSnapshot = _EMPTY
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._refresh_lock: Optional[asyncio.Lock] = None
+        self._poller: Optional[asyncio.Task] = None
+        self.last_error: Optional[str] = None
+        self.fetch_count = 0
+
+    @property
+    def current(self) -> MachinesSnapshot:
+        return self._snapshot
+
+    def _bind_loop(self) -> None:
+        # Клиент и lock принадлежат основному event loop воркера
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._refresh_lock = asyncio.Lock()
+
+    def get_client(self) -> httpx.AsyncClient:
+        """Долгоживущий клиент (keep-alive). Использовать только из основного event loop."""
+        self._bind_loop()
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=MTCONNECT_HTTP_TIMEOUT_SEC,
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=60),
+            )
+        return self._client
+
+    async def refresh(self) -> MachinesSnapshot:
+        """Запрашивает /api/machines. При ошибке оставляет предыдущий снимок."""
+        client = self.get_client()
+        try:
+            response = await client.get(f"{self.base_url}/api/machines")
+            response.raise_for_status()
+            self._snapshot = MachinesSnapshot.from_response(response.json())
+            self.fetch_count += 1
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            logger.warning(f"MTConnect API unavailable: {e}")
+        return self._snapshot
+
+    async def _get_on_own_loop(self, max_age: float) -> MachinesSnapshot:
+        self._bind_loop()
+        snap = self._snapshot
+        if snap.fetched_at and snap.age_sec <= max_age:
+            return snap
+        async with self._refresh_lock:
+            snap = self._snapshot
+            if snap.fetched_at and snap.age_sec <= max_age:
+                return snap
+            return await self.refresh()
+
+    async def get(self, max_age: float = MTCONNECT_SNAPSHOT_MAX_AGE_SEC) -> MachinesSnapshot:
+        """
+        Снимок не старше max_age (при необходимости обновляет).
+        Можно вызывать из другого event loop (пул sync-DB эндпоинтов) —
+        обновление выполнится в основном loop, где живёт HTTP-клиент.
+        Если обновить не удалось — предыдущий снимок, пока он в пределах
+        жёсткого лимита, потом пустой.
+        """
+        snap = self._snapshot
+        if snap.fetched_at and snap.age_sec <= max_age:
+            return snap
+        loop = asyncio.get_running_loop()
+        if self._loop is None or self._loop is loop:
+            return _within_limit(await self._get_on_own_loop(max_age), max_age)
+        future = asyncio.run_coroutine_threadsafe(self._get_on_own_loop(max_age), self._loop)
+        return _within_limit(await asyncio.wrap_future(future), max_age)
+
+    def get_sync(self, max_age: float = MTCONNECT_SNAPSHOT_MAX_AGE_SEC) -> MachinesSnapshot:
+        """
+        Для sync-кода. Из потока threadpool — дожидается обновления в основном loop;
+        из самого основного loop (sync-функция внутри async) блокировать нельзя —
+        отдаёт последний снимок (в пределах жёсткого лимита, как и get()).
+        """
+        snap = self._snapshot
+        if snap.fetched_at and snap.age_sec <= max_age:
+            return snap
+        loop = self._loop
+        if loop is None or not loop.is_running() or threading.current_thread() is threading.main_thread():
+            return _within_limit(snap, max_age)
+        try:
+            future = asyncio.run_coroutine_threadsafe(self._get_on_own_loop(max_age), loop)
+            return _within_limit(future.result(timeout=MTCONNECT_HTTP_TIMEOUT_SEC + 1), max_age)
+        except Exception as e:
+            logger.warning(f"MTConnect snapshot refresh from thread failed: {e}")
+            return _within_limit(self._snapshot, max_age)
+
+    async def _poll_forever(self) -> None:
+        logger.info(f"MTConnect snapshot poller started (interval: {MTCONNECT_POLL_INTERVAL_SEC}s)")
+        while True:
+            await self._get_on_own_loop(MTCONNECT_POLL_INTERVAL_SEC / 2)
+            await asyncio.sleep(MTCONNECT_POLL_INTERVAL_SEC)
+
+    def start_poller(self) -> None:
+        self._bind_loop()
+        if self._poller is None:
+            self._poller = asyncio.create_task(self._poll_forever())
+
+    async def close(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._poller = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def status(self) -> Dict[str, Any]:
+        snap = self._snapshot
+        return {
+            "machines": len(snap.machines),
+            "age_sec": round(snap.age_sec, 1) if snap.fetched_at else None,
+            "fetch_count": self.fetch_count,
+            "last_error": self.last_error,
+        }
+
+
+_service = MTConnectSnapshotService()
+
+
+def get_mtconnect_snapshot() -> MTConnectSnapshotService:
+    return _service
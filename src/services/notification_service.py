@@ -1,7 +1,6 @@
 import logging
 import math
 import os
-import httpx
 from datetime import datetime, timezone, timedelta
 from sqlalchemy import text
 from sqlalchemy.orm import Session, aliased
@@ -10,7 +9,10 @@ from .whatsapp_client import send_whatsapp_to_role, send_whatsapp_to_role_person
 # Убираем RoleDB из импорта
 from src.models.models import SetupDB, EmployeeDB, MachineDB, LotDB, PartDB, LotMaterialDB
 from src.routers.notification_settings import is_notification_enabled
+from src.services.machine_resolver import machine_key
+from src.services.mtconnect_snapshot import get_mtconnect_snapshot
 from src import database  # Для создания своей сессии в background tasks (импортируем модуль, а не переменную)
+from src.services.outbox import register_outbox_handler
 
 logger = logging.getLogger(__name__)
 
@@ -94,28 +96,8 @@ async def check_low_materials_and_notify():
             .all()
         )
 
-        mtconnect_counts = {}
-        try:
-            mtconnect_api_url = os.getenv('MTCONNECT_API_URL', 'https://mtconnect-core-production.up.railway.app')
-            with httpx.Client(timeout=5.0) as client:
-                response = client.get(f"{mtconnect_api_url}/api/machines")
-                if response.status_code == 200:
-                    data = response.json()
-                    all_machines = []
-                    if data.get('machines', {}).get('mtconnect'):
-                        all_machines.extend(data['machines']['mtconnect'])
-                    if data.get('machines', {}).get('adam'):
-                        all_machines.extend(data['machines']['adam'])
-                    for m in all_machines:
-                        name = m.get('name', '')
-                        normalized = name.replace('_', '-').upper()
-                        if normalized.startswith('M-'):
-                            parts = normalized.split('-', 2)
-                            if len(parts) >= 3:
-                                normalized = parts[2]
-                        mtconnect_counts[normalized] = m.get('data', {}).get('displayPartCount')
-        except Exception as e:
-            logger.warning(f"MTConnect API unavailable: {e}")
+        # Общий снимок MTConnect: {machine_key(имя): displayPartCount}
+        mtconnect_counts = (await get_mtconnect_snapshot().get()).part_counts()
 
         for lot_material, lot, machine, part in items:
             net_issued = (lot_material.issued_bars or 0) - (lot_material.returned_bars or 0) - (lot_material.defect_bars or 0)
@@ -154,12 +136,7 @@ async def check_low_materials_and_notify():
             # produced parts (MTConnect -> fallback to machine_readings)
             produced = None
             if machine and machine.name:
-                normalized = machine.name.replace('_', '-').upper()
-                if normalized.startswith('M-'):
-                    parts = normalized.split('-', 2)
-                    if len(parts) >= 3:
-                        normalized = parts[2]
-                produced = mtconnect_counts.get(normalized)
+                produced = mtconnect_counts.get(machine_key(machine.name))
 
             if produced is None:
                 # MTConnect недоступен - пропускаем
@@ -532,4 +509,30 @@ async def send_batch_discrepancy_alert(db: Session, discrepancy_details: dict):
 
     except Exception as e:
         logger.error(f"Error sending discrepancy alert for Batch ID {discrepancy_details.get('batch_id')}: {e}", exc_info=True)
-        return False 
\ No newline at end of file
+        return False 
+
+
+# --- Обработчики outbox (src/services/outbox.py): доставка после commit ---
+
+async def _deliver_setup_notifications(payload: dict) -> None:
+    summary = await send_setup_approval_notifications(
+        db=None,
+        setup_id=payload["setup_id"],
+        notification_type=payload.get("notification_type", "approval"),
+    )
+    # Ничего не доставлено при наличии получателей — повтор безопасен (дублей не будет)
+    if summary["telegram_targets"] and not summary["telegram_sent"] and not summary["whatsapp_sent"]:
+        raise RuntimeError(f"no notification delivered: {summary}")
+
+
+async def _deliver_batch_discrepancy_alert(payload: dict) -> None:
+    own_db = database.SessionLocal()
+    try:
+        if not await send_batch_discrepancy_alert(own_db, payload):
+            raise RuntimeError("discrepancy alert failed")
+    finally:
+        own_db.close()
+
+
+register_outbox_handler("setup_notifications", "telegram", _deliver_setup_notifications)
+register_outbox_handler("batch_discrepancy_alert", "telegram", _deliver_batch_discrepancy_alert)
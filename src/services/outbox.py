@@ -0,0 +1,350 @@
+"""
+Transactional outbox: побочные эффекты после commit (таблица outbox, миграция 059).
+
+Эндпоинты раньше отправляли Telegram / WhatsApp / MTConnect прямо в запросе
+или через asyncio.create_task: ответ ждал сторонние API, а задачи терялись
+при перезапуске worker. Теперь эндпоинт вызывает enqueue() в своей
+транзакции (как notify_change) и отвечает сразу после commit; доставку
+выполняет OutboxDispatcher.
+
+Как работает:
+  * обработчики регистрируются по kind: register_outbox_handler(kind,
+    destination, handler); handler(payload) — async, исключение = повтор,
+    OutboxPermanentError = сразу в dead;
+  * enqueue() вставляет строку и ставит pg_notify (событие "outbox") —
+    после commit лидер просыпается без ожидания опроса;
+  * диспетчер работает во всех workers, но забирает строки только лидер
+    (src/services/leader_election.py): пачками до OUTBOX_BATCH_SIZE через
+    FOR UPDATE SKIP LOCKED, не больше OUTBOX_CONCURRENCY_<DESTINATION>
+    одновременных вызовов на назначение;
+  * неудача — повтор с экспоненциальной задержкой, после
+    OUTBOX_MAX_ATTEMPTS — status = 'dead' (строка остаётся для разбора);
+  * строки, зависшие в 'processing' (лидер упал посреди пачки), через
+    OUTBOX_PROCESSING_TIMEOUT_SEC возвращаются в 'pending' — доставка
+    at-least-once;
+  * состояние — GET /health/outbox.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from src import database
+from src.services.cache_invalidation import notify_change, register_invalidation_handler
+from src.services.leader_election import get_leader
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_SEC = float(os.getenv("OUTBOX_POLL_SEC", "5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE_SEC = float(os.getenv("OUTBOX_BACKOFF_BASE_SEC", "5"))
+OUTBOX_BACKOFF_MAX_SEC = float(os.getenv("OUTBOX_BACKOFF_MAX_SEC", "900"))
+OUTBOX_PROCESSING_TIMEOUT_SEC = int(os.getenv("OUTBOX_PROCESSING_TIMEOUT_SEC", "300"))
+OUTBOX_DONE_RETENTION_DAYS = int(os.getenv("OUTBOX_DONE_RETENTION_DAYS", "7"))
+OUTBOX_DEFAULT_CONCURRENCY = int(os.getenv("OUTBOX_DEFAULT_CONCURRENCY", "2"))
+
+OUTBOX_EVENT_KIND = "outbox"
+
+OutboxHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class OutboxPermanentError(Exception):
+    """Повтор не поможет (например, наладка удалена) — строка сразу уходит в dead."""
+
+
+@dataclass(frozen=True)
+class _Registration:
+    destination: str
+    handler: OutboxHandler
+
+
+_handlers: Dict[str, _Registration] = {}
+
+
+def register_outbox_handler(kind: str, destination: str, handler: OutboxHandler) -> None:
+    """Регистрирует обработчик события kind. destination — группа для лимита параллельности."""
+    _handlers[kind] = _Registration(destination, handler)
+
+
+def _destination_concurrency(destination: str) -> int:
+    return max(1, int(os.getenv(f"OUTBOX_CONCURRENCY_{destination.upper()}", str(OUTBOX_DEFAULT_CONCURRENCY))))
+
+
+_INSERT_SQL = text("""
+    INSERT INTO outbox (destination, kind, payload)
+    VALUES (:destination, :kind, CAST(:payload AS jsonb))
+    RETURNING id
+""")
+
+_RECLAIM_SQL = text("""
+    UPDATE outbox
+    SET status = 'pending', locked_at = NULL
+    WHERE status = 'processing'
+      AND locked_at < NOW() - make_interval(secs => :timeout)
+""")
+
+_CLAIM_SQL = text("""
+    UPDATE outbox o
+    SET status = 'processing', locked_at = NOW(), attempts = o.attempts + 1
+    FROM (
+        SELECT id FROM outbox
+        WHERE status = 'pending' AND available_at <= NOW()
+        ORDER BY available_at, id
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    ) due
+    WHERE o.id = due.id
+    RETURNING o.id, o.destination, o.kind, o.payload, o.attempts
+""")
+
+_DONE_SQL = text("""
+    UPDATE outbox
+    SET status = 'done', processed_at = NOW(), locked_at = NULL, last_error = NULL
+    WHERE id = ANY(CAST(:ids AS bigint[]))
+""")
+
+_RETRY_SQL = text("""
+    UPDATE outbox AS o
+    SET status = 'pending', locked_at = NULL, last_error = t.error,
+        available_at = NOW() + make_interval(secs => t.delay)
+    FROM unnest(CAST(:ids AS bigint[]), CAST(:errors AS text[]), CAST(:delays AS double precision[]))
+         AS t(id, error, delay)
+    WHERE o.id = t.id
+""")
+
+_DEAD_SQL = text("""
+    UPDATE outbox AS o
+    SET status = 'dead', processed_at = NOW(), locked_at = NULL, last_error = t.error
+    FROM unnest(CAST(:ids AS bigint[]), CAST(:errors AS text[])) AS t(id, error)
+    WHERE o.id = t.id
+""")
+
+
+def enqueue(db: Session, kind: str, payload: Dict[str, Any]) -> int:
+    """
+    Ставит побочный эффект в текущую транзакцию (sync Session). Вызывать до commit:
+    при rollback событие исчезнет вместе с изменением.
+    """
+    registration = _handlers.get(kind)
+    if registration is None:
+        raise ValueError(f"Unknown outbox event kind: {kind}")
+    outbox_id = db.execute(_INSERT_SQL, {
+        "destination": registration.destination,
+        "kind": kind,
+        "payload": json.dumps(payload, ensure_ascii=False, default=str),
+    }).scalar()
+    notify_change(db, OUTBOX_EVENT_KIND)
+    return outbox_id
+
+
+@dataclass
+class _Claimed:
+    id: int
+    destination: str
+    kind: str
+    payload: Dict[str, Any]
+    attempts: int
+
+
+def _retry_delay(attempts: int) -> float:
+    delay = min(OUTBOX_BACKOFF_MAX_SEC, OUTBOX_BACKOFF_BASE_SEC * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+class OutboxDispatcher:
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.delivered = 0
+        self.retried = 0
+        self.dead = 0
+        self.last_batch_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    # --- БД (выполняется в потоке, sync Session) ---
+
+    def _claim_blocking(self) -> List[_Claimed]:
+        db = database.SessionLocal()
+        try:
+            db.execute(_RECLAIM_SQL, {"timeout": OUTBOX_PROCESSING_TIMEOUT_SEC})
+            rows = db.execute(_CLAIM_SQL, {"limit": OUTBOX_BATCH_SIZE}).fetchall()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        claimed = []
+        for row in rows:
+            payload = row.payload
+            if isinstance(payload, str):
+                payload = json.loads(payload)
+            claimed.append(_Claimed(row.id, row.destination, row.kind, payload or {}, row.attempts))
+        return sorted(claimed, key=lambda item: item.id)
+
+    def _finish_blocking(self, done: List[int], retry: List[Tuple[int, str, float]],
+                         dead: List[Tuple[int, str]]) -> None:
+        db = database.SessionLocal()
+        try:
+            if done:
+                db.execute(_DONE_SQL, {"ids": done})
+            if retry:
+                db.execute(_RETRY_SQL, {
+                    "ids": [item_id for item_id, _, _ in retry],
+                    "errors": [error for _, error, _ in retry],
+                    "delays": [delay for _, _, delay in retry],
+                })
+            if dead:
+                db.execute(_DEAD_SQL, {
+                    "ids": [item_id for item_id, _ in dead],
+                    "errors": [error for _, error in dead],
+                })
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    # --- доставка ---
+
+    def _semaphore(self, destination: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(destination)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(_destination_concurrency(destination))
+            self._semaphores[destination] = semaphore
+        return semaphore
+
+    async def _deliver(self, item: _Claimed) -> Tuple[str, Optional[str]]:
+        """('done' | 'retry' | 'dead', ошибка)."""
+        registration = _handlers.get(item.kind)
+        if registration is None:
+            return "dead", f"no handler for kind '{item.kind}'"
+        try:
+            async with self._semaphore(item.destination):
+                await registration.handler(item.payload)
+            return "done", None
+        except OutboxPermanentError as e:
+            logger.warning(f"[Outbox] #{item.id} {item.kind}: permanent error: {e}")
+            return "dead", str(e)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            if item.attempts >= OUTBOX_MAX_ATTEMPTS:
+                logger.error(f"[Outbox] #{item.id} {item.kind}: giving up after {item.attempts} attempts: {error}")
+                return "dead", error
+            logger.warning(f"[Outbox] #{item.id} {item.kind}: attempt {item.attempts} failed: {error}")
+            return "retry", error
+
+    async def dispatch_once(self) -> int:
+        """Одна пачка: claim → доставка → отметка результатов. Возвращает размер пачки."""
+        batch = await asyncio.to_thread(self._claim_blocking)
+        if not batch:
+            return 0
+        results = await asyncio.gather(*(self._deliver(item) for item in batch))
+
+        done: List[int] = []
+        retry: List[Tuple[int, str, float]] = []
+        dead: List[Tuple[int, str]] = []
+        for item, (outcome, error) in zip(batch, results):
+            if outcome == "done":
+                done.append(item.id)
+            elif outcome == "retry":
+                retry.append((item.id, error, _retry_delay(item.attempts)))
+            else:
+                dead.append((item.id, error))
+        await asyncio.to_thread(self._finish_blocking, done, retry, dead)
+
+        self.delivered += len(done)
+        self.retried += len(retry)
+        self.dead += len(dead)
+        self.last_batch_at = time.time()
+        return len(batch)
+
+    async def _run_forever(self) -> None:
+        logger.info(f"[Outbox] dispatcher started (batch: {OUTBOX_BATCH_SIZE}, poll: {OUTBOX_POLL_SEC}s)")
+        while True:
+            claimed = 0
+            if get_leader().is_leader:
+                try:
+                    claimed = await self.dispatch_once()
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e) or type(e).__name__
+                    logger.error(f"[Outbox] dispatch failed: {self.last_error}", exc_info=True)
+            if claimed >= OUTBOX_BATCH_SIZE:
+                continue  # очередь не пуста — следующая пачка сразу
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=OUTBOX_POLL_SEC)
+            except asyncio.TimeoutError:
+                pass
+
+    def _on_events(self, events: List[Dict[str, Any]]) -> None:
+        """LISTEN/NOTIFY: новые строки закоммичены — будим диспетчер (в event loop)."""
+        if self._wakeup is None:
+            return
+        if any(event.get("kind") in (OUTBOX_EVENT_KIND, "resync") for event in events):
+            self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            register_invalidation_handler(self._on_events)
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    def status(self, db: Session) -> Dict[str, Any]:
+        rows = db.execute(text("""
+            SELECT status, destination, COUNT(*) AS cnt, MIN(created_at) AS oldest
+            FROM outbox
+            WHERE status IN ('pending', 'processing', 'dead')
+            GROUP BY status, destination
+        """)).fetchall()
+        queues: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            queues.setdefault(row.destination, {})[row.status] = {"count": row.cnt, "oldest": row.oldest}
+        return {
+            "is_leader": get_leader().is_leader,
+            "running": self._task is not None,
+            "delivered": self.delivered,
+            "retried": self.retried,
+            "dead": self.dead,
+            "last_batch_ago_sec": round(time.time() - self.last_batch_at, 1) if self.last_batch_at else None,
+            "last_error": self.last_error,
+            "handlers": sorted(_handlers),
+            "destinations": queues,
+        }
+
+
+_dispatcher = OutboxDispatcher()
+
+
+def get_outbox_dispatcher() -> OutboxDispatcher:
+    return _dispatcher
+
+
+def purge_delivered(db: Session) -> int:
+    """Удаляет доставленные строки старше OUTBOX_DONE_RETENTION_DAYS (ежедневная задача)."""
+    result = db.execute(
+        text("DELETE FROM outbox WHERE status = 'done' AND processed_at < NOW() - make_interval(days => :days)"),
+        {"days": OUTBOX_DONE_RETENTION_DAYS},
+    )
+    db.commit()
+    return result.rowcount or 0
@@ -0,0 +1,127 @@
+"""
+Оценка станков для новых лотов (score /planning/recommend-machines).
+
+Одна формула для одного лота и для пачки (/planning/recommend-batch):
+матрица лотов × станков считается массивами NumPy за один проход —
+жёсткие фильтры (диаметр, длина детали) и слагаемые score складываются
+поэлементно, ранжирование — argsort по строкам.
+
+    score = 50
+          + min(W_HISTORY, делали_раз * 10)
+          + бонус/штраф за очередь (по часам очереди станка)
+          + W_SAME_DIAMETER, если текущий диаметр ±0.5мм (половина при очереди ≥ 200ч)
+          + W_RELATED_DRAWING, если в очереди родственный чертёж
+          + 5 за JBS
+    score ≤ 100
+
+Объяснения (reasons) строит роутер только для попавших в топ станков.
+"""
+from dataclasses import dataclass
+from typing import List, Sequence
+
+import numpy as np
+
+from src.services.machine_queue_snapshot import MachineQueue
+
+# Веса score
+W_HISTORY = 30           # Бонус за историю (делали раньше)
+W_SAME_DIAMETER = 10     # Бонус за тот же диаметр (без переналадки)
+W_FREE_QUEUE = 25        # Бонус за свободную очередь
+W_CAPABILITIES = 20      # Бонус за специальные возможности (JBS, etc)
+W_RELATED_DRAWING = 20   # Бонус за родственный чертёж в очереди
+W_JBS = 5
+
+BASE_SCORE = 50
+MAX_SCORE = 100
+SAME_DIAMETER_TOLERANCE = 0.5   # мм
+HUGE_QUEUE_HOURS = 200          # при очереди больше бонус за диаметр уменьшается вдвое
+
+
+def queue_score(hours: np.ndarray) -> np.ndarray:
+    """Бонус/штраф за загрузку очереди (часы → баллы)."""
+    return np.select(
+        [hours == 0, hours < 24, hours < 72, hours < HUGE_QUEUE_HOURS],
+        [W_FREE_QUEUE, int(W_FREE_QUEUE * 0.7), int(W_FREE_QUEUE * 0.3), -10],
+        default=-20,
+    )
+
+
+def _limits(values) -> np.ndarray:
+    """None и 0 — «нет ограничения» (NaN)."""
+    return np.array([v if v else np.nan for v in values], dtype=float)
+
+
+@dataclass(frozen=True)
+class MachineArrays:
+    """Параметры станков снимка в виде массивов (порядок = порядок machines)."""
+
+    machines: Sequence[MachineQueue]
+    min_diameter: np.ndarray
+    max_diameter: np.ndarray
+    max_part_length: np.ndarray
+    current_diameter: np.ndarray
+    queue_hours: np.ndarray
+    queue_score: np.ndarray
+    is_jbs: np.ndarray
+
+    @classmethod
+    def from_machines(cls, machines: Sequence[MachineQueue]) -> "MachineArrays":
+        queue_hours = np.array([m.queue_hours for m in machines], dtype=float)
+        return cls(
+            machines=machines,
+            min_diameter=_limits(m.min_diameter for m in machines),
+            max_diameter=_limits(m.max_diameter for m in machines),
+            max_part_length=_limits(m.max_part_length for m in machines),
+            current_diameter=_limits(m.current_diameter for m in machines),
+            queue_hours=queue_hours,
+            queue_score=queue_score(queue_hours),
+            is_jbs=np.array([m.is_jbs for m in machines], dtype=bool),
+        )
+
+
+def fits_matrix(machines: MachineArrays, diameters: np.ndarray, part_lengths: np.ndarray) -> np.ndarray:
+    """Жёсткие ограничения (лоты × станки): диаметр в диапазоне станка, длина детали ≤ max_part_length."""
+    d = diameters[:, None]
+    with np.errstate(invalid="ignore"):
+        return (np.isnan(machines.min_diameter) | (d >= machines.min_diameter)) \
+            & (np.isnan(machines.max_diameter) | (d <= machines.max_diameter)) \
+            & ~(part_lengths[:, None] > machines.max_part_length)  # NaN с любой стороны — без ограничения
+
+
+def score_lots(
+    machines: MachineArrays,
+    diameters: np.ndarray,
+    part_lengths: np.ndarray,
+    history: np.ndarray,
+    related: np.ndarray,
+):
+    """
+    Score лотов (строки) на станках (столбцы).
+
+    diameters, part_lengths — по лоту (part_length NaN — не задана);
+    history — сколько раз делали (лоты × станки), related — родственный
+    чертёж в очереди станка (лоты × станки).
+    Возвращает (scores int, fits bool) формы лоты × станки.
+    """
+    fits = fits_matrix(machines, diameters, part_lengths)
+    with np.errstate(invalid="ignore"):
+        same_diameter = np.abs(machines.current_diameter - diameters[:, None]) < SAME_DIAMETER_TOLERANCE
+
+    same_d_bonus = np.where(machines.queue_hours < HUGE_QUEUE_HOURS, W_SAME_DIAMETER, W_SAME_DIAMETER // 2)
+
+    scores = (
+        BASE_SCORE
+        + np.minimum(W_HISTORY, history * 10)
+        + machines.queue_score
+        + np.where(same_diameter, same_d_bonus, 0)
+        + np.where(related, W_RELATED_DRAWING, 0)
+        + np.where(machines.is_jbs, W_JBS, 0)
+    )
+    return np.minimum(scores, MAX_SCORE).astype(int), fits
+
+
+def rank(scores: np.ndarray, fits: np.ndarray, top_n: int) -> List[List[int]]:
+    """Индексы лучших подходящих станков для каждого лота (score по убыванию, при равенстве — порядок станков)."""
+    keys = np.where(fits, -scores, np.iinfo(np.int64).max)
+    order = np.argsort(keys, axis=1, kind="stable")
+    return [[int(j) for j in row[fits[i, row]][:top_n]] for i, row in enumerate(order)]
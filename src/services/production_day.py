@@ -0,0 +1,107 @@
+"""
+Границы производственного дня и смен в UTC.
+
+Отчётная дата D (Asia/Jerusalem):
+    утренняя смена  D 06:00 – D 18:00
+    вечерняя смена  D 18:00 – D+1 06:00
+
+machine_readings.created_at хранится как naive UTC. Раньше отчёты
+классифицировали каждое показание в SQL через
+DATE(created_at AT TIME ZONE 'UTC' AT TIME ZONE 'Asia/Jerusalem') и
+EXTRACT(HOUR ...), что не использует индекс по created_at. Здесь окна
+считаются один раз в Python (с учётом перехода на летнее время), а в SQL
+остаются диапазоны created_at >= :start AND created_at < :end.
+
+Те же границы в SQL — production_shift_start() (миграция 058, триггер
+поздних правок); паритет проверяет tests/test_production_day.py.
+"""
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+PRODUCTION_TIMEZONE = os.getenv("TIMEZONE") or os.getenv("BOT_TIMEZONE") or "Asia/Jerusalem"
+SHIFT_START_HOUR = 6
+SHIFT_LENGTH_HOURS = 12
+
+try:
+    LOCAL_TZ = ZoneInfo(PRODUCTION_TIMEZONE)
+except Exception:
+    LOCAL_TZ = ZoneInfo("UTC")
+
+
+def local_to_utc_naive(value: datetime) -> datetime:
+    """Локальное naive-время → naive UTC (формат created_at в БД)."""
+    return value.replace(tzinfo=LOCAL_TZ).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+@dataclass(frozen=True)
+class ProductionDayWindow:
+    """Окна отчётной даты в naive UTC, все интервалы полуоткрытые [start, end)."""
+
+    report_date: date
+    day_start: datetime       # D 00:00 локального времени
+    morning_start: datetime   # D 06:00
+    evening_start: datetime   # D 18:00
+    day_end: datetime         # D+1 00:00
+    evening_end: datetime     # D+1 06:00
+
+    def as_params(self) -> dict:
+        return {
+            "target_date": self.report_date,
+            "day_start": self.day_start,
+            "morning_start": self.morning_start,
+            "evening_start": self.evening_start,
+            "day_end": self.day_end,
+            "evening_end": self.evening_end,
+        }
+
+    def is_closed(self, now_utc: Optional[datetime] = None) -> bool:
+        """Вечерняя смена закончилась — отчёт за дату больше не меняется (кроме поздних правок)."""
+        now_utc = now_utc or datetime.now(timezone.utc).replace(tzinfo=None)
+        return now_utc >= self.evening_end
+
+
+def production_day_window(report_date: date) -> ProductionDayWindow:
+    next_date = report_date + timedelta(days=1)
+    morning = time(SHIFT_START_HOUR)
+    evening = time(SHIFT_START_HOUR + SHIFT_LENGTH_HOURS)
+    return ProductionDayWindow(
+        report_date=report_date,
+        day_start=local_to_utc_naive(datetime.combine(report_date, time.min)),
+        morning_start=local_to_utc_naive(datetime.combine(report_date, morning)),
+        evening_start=local_to_utc_naive(datetime.combine(report_date, evening)),
+        day_end=local_to_utc_naive(datetime.combine(next_date, time.min)),
+        evening_end=local_to_utc_naive(datetime.combine(next_date, morning)),
+    )
+
+
+def report_date_of(created_at: datetime) -> date:
+    """Отчётная дата naive-UTC момента (ночь до 06:00 относится к предыдущему дню)."""
+    local = created_at.replace(tzinfo=timezone.utc).astimezone(LOCAL_TZ)
+    return (local - timedelta(hours=SHIFT_START_HOUR)).date()
+
+
+@dataclass(frozen=True)
+class ShiftWindow:
+    """Одна смена в naive UTC: [shift_start, shift_end)."""
+
+    shift_start: datetime
+    shift_end: datetime
+    report_date: date
+    shift_type: str  # 'morning' | 'evening'
+
+    def previous(self) -> "ShiftWindow":
+        return shift_window_at(self.shift_start - timedelta(seconds=1))
+
+    def next(self) -> "ShiftWindow":
+        return shift_window_at(self.shift_end)
+
+
+def shift_window_at(moment_utc: datetime) -> ShiftWindow:
+    """Смена, в которую попадает naive-UTC момент."""
+    day = production_day_window(report_date_of(moment_utc))
+    if moment_utc < day.evening_start:
+        return ShiftWindow(day.morning_start, day.evening_start, day.report_date, "morning")
+    return ShiftWindow(day.evening_start, day.evening_end, day.report_date, "evening")
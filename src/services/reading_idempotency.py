@@ -0,0 +1,183 @@
+"""
+Идемпотентность записи показаний (POST /readings, POST /readings/batch).
+
+Планшет может повторить запрос после обрыва Wi-Fi, не зная, дошёл ли первый.
+Клиент передаёт idempotency_key; повтор с тем же ключом возвращает исходный
+ответ и не трогает setup_jobs / batches.
+
+Как работает:
+  * горячий путь — LRU последних ключей этого worker (без обращения к БД);
+  * claim_key() первым делом вставляет ключ в reading_idempotency_keys
+    (INSERT ... ON CONFLICT DO NOTHING) в транзакции показания. Если ключ уже
+    есть — это повтор, отдаём сохранённый response. Параллельный дубль ждёт
+    на незакоммиченном ключе и после commit первого видит его ответ;
+    при rollback первого — ключ свободен и запрос выполнится заново;
+  * store_responses() сохраняет ответ перед commit, remember() — в LRU после.
+"""
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+READING_IDEMPOTENCY_LRU_SIZE = int(os.getenv("READING_IDEMPOTENCY_LRU_SIZE", "4096"))
+READING_IDEMPOTENCY_RETENTION_DAYS = int(os.getenv("READING_IDEMPOTENCY_RETENTION_DAYS", "7"))
+
+
+class _RecentKeys:
+    """Потокобезопасный LRU: ключ → исходный ответ."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+
+_recent = _RecentKeys(READING_IDEMPOTENCY_LRU_SIZE)
+
+_CLAIM_SQL = text("""
+    INSERT INTO reading_idempotency_keys (idempotency_key, machine_id)
+    VALUES (:key, :machine_id)
+    ON CONFLICT (idempotency_key) DO NOTHING
+    RETURNING idempotency_key
+""")
+
+_CLAIM_MANY_SQL = text("""
+    INSERT INTO reading_idempotency_keys (idempotency_key, machine_id)
+    SELECT k, m FROM unnest(CAST(:keys AS text[]), CAST(:machine_ids AS integer[])) AS t(k, m)
+    ON CONFLICT (idempotency_key) DO NOTHING
+    RETURNING idempotency_key
+""")
+
+_LOAD_SQL = text("""
+    SELECT idempotency_key, response
+    FROM reading_idempotency_keys
+    WHERE idempotency_key IN :keys
+""").bindparams(bindparam("keys", expanding=True))
+
+_STORE_SQL = text("""
+    UPDATE reading_idempotency_keys AS k
+    SET reading_id = t.reading_id, response = CAST(t.response AS jsonb)
+    FROM unnest(CAST(:keys AS text[]), CAST(:reading_ids AS integer[]), CAST(:responses AS text[]))
+         AS t(idempotency_key, reading_id, response)
+    WHERE k.idempotency_key = t.idempotency_key
+""")
+
+
+def _replayed(response: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    result = dict(response or {"success": True, "message": "Показания уже сохранены"})
+    result["replayed"] = True
+    return result
+
+
+def lookup_cached(key: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Ответ из LRU этого worker (без БД) или None."""
+    if not key:
+        return None
+    response = _recent.get(key)
+    return _replayed(response) if response is not None else None
+
+
+async def _load_responses(db: AsyncSession, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+    rows = (await db.execute(_LOAD_SQL, {"keys": keys})).fetchall()
+    responses: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        response = row.response
+        if isinstance(response, str):
+            response = json.loads(response)
+        responses[row.idempotency_key] = _replayed(response)
+    return responses
+
+
+async def claim_key(db: AsyncSession, key: str, machine_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Занимает ключ в текущей транзакции.
+    None — ключ новый, запрос нужно выполнить; иначе — исходный ответ для повтора.
+    """
+    claimed = await db.scalar(_CLAIM_SQL, {"key": key, "machine_id": machine_id})
+    if claimed is not None:
+        return None
+    responses = await _load_responses(db, [key])
+    logger.info(f"Idempotent replay of reading key {key!r}")
+    return responses.get(key) or _replayed(None)
+
+
+async def claim_keys(db: AsyncSession, items: Iterable[Tuple[str, int]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Пакетный claim_key(): занимает все новые ключи одним запросом.
+    Возвращает {ключ: исходный ответ} для уже использованных ключей.
+    """
+    pairs = list(dict(items).items())
+    if not pairs:
+        return {}
+    claimed = set((await db.scalars(_CLAIM_MANY_SQL, {
+        "keys": [k for k, _ in pairs],
+        "machine_ids": [m for _, m in pairs],
+    })).all())
+    replays = [k for k, _ in pairs if k not in claimed]
+    if not replays:
+        return {}
+    responses = await _load_responses(db, replays)
+    logger.info(f"Idempotent replay of {len(replays)} reading keys in batch")
+    return {k: responses.get(k) or _replayed(None) for k in replays}
+
+
+async def store_responses(db: AsyncSession, items: Iterable[Tuple[str, Optional[int], Dict[str, Any]]]) -> None:
+    """Сохраняет ответы для будущих повторов одним UPDATE (в транзакции показаний, до commit)."""
+    items = list(items)
+    if not items:
+        return
+    await db.execute(_STORE_SQL, {
+        "keys": [key for key, _, _ in items],
+        "reading_ids": [reading_id for _, reading_id, _ in items],
+        "responses": [json.dumps(response, ensure_ascii=False, default=str) for _, _, response in items],
+    })
+
+
+async def release_keys(db: AsyncSession, keys: Iterable[str]) -> None:
+    """Освобождает занятые ключи элементов, которые не были сохранены."""
+    keys = list(keys)
+    if keys:
+        await db.execute(
+            text("DELETE FROM reading_idempotency_keys WHERE idempotency_key = ANY(CAST(:keys AS text[]))"),
+            {"keys": keys},
+        )
+
+
+def remember(key: Optional[str], response: Dict[str, Any]) -> None:
+    """Кладёт ответ в LRU после успешного commit."""
+    if key:
+        _recent.put(key, response)
+
+
+def purge_expired_keys(db: Session) -> int:
+    """Удаляет ключи старше READING_IDEMPOTENCY_RETENTION_DAYS (ежедневная задача)."""
+    result = db.execute(
+        text("DELETE FROM reading_idempotency_keys WHERE created_at < NOW() - make_interval(days => :days)"),
+        {"days": READING_IDEMPOTENCY_RETENTION_DAYS},
+    )
+    db.commit()
+    return result.rowcount or 0
@@ -0,0 +1,186 @@
+"""
+Запись показания счётчика: проверка, предыдущее показание станка, статус
+наладки и батч. Общая часть POST /readings (src/main.py) и
+POST /readings/batch (src/routers/readings.py).
+"""
+import logging
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models.models import BatchDB, LotDB, ReadingDB, SetupDB
+
+logger = logging.getLogger(__name__)
+
+
+# Статусы наладки, в которых принимаются показания
+READING_ACTIVE_SETUP_STATUSES = ['created', 'pending_qc', 'allowed', 'started']
+
+
+def validate_reading_value(setup_status: str, value: int) -> None:
+    """Проверки показания до записи (те же ошибки, что отдаёт POST /readings)."""
+    if value < 0:
+        raise HTTPException(status_code=400, detail="Показания не могут быть отрицательными")
+    if setup_status not in ['created', 'allowed', 'started']:
+        if value == 0:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Нельзя вводить нулевые показания в статусе {setup_status}"
+            )
+        raise HTTPException(
+            status_code=400,
+            detail=f"Нельзя вводить показания в статусе {setup_status}"
+        )
+
+
+# machine_last_reading обновляет триггер на machine_readings (миграция 062) —
+# читать её нужно до вставки нового показания
+_LAST_READINGS_SQL = text("""
+    SELECT machine_id, reading, created_at
+    FROM machine_last_reading
+    WHERE machine_id = ANY(CAST(:machine_ids AS integer[]))
+""")
+
+
+async def load_last_readings(db: AsyncSession, machine_ids: List[int]) -> Dict[int, Any]:
+    """Строки machine_last_reading по станкам (до вставки показаний в этой транзакции)."""
+    rows = (await db.execute(_LAST_READINGS_SQL, {"machine_ids": list(machine_ids)})).all()
+    return {row.machine_id: row for row in rows}
+
+
+async def load_prev_reading(db: AsyncSession, machine_id: int, before: datetime, last: Any) -> Optional[int]:
+    """
+    Последнее показание станка до момента before.
+    Обычно это строка machine_last_reading (last); история machine_readings читается,
+    только если показание пришло задним числом (раньше последнего известного).
+    """
+    if last is not None and last.created_at < before:
+        return last.reading
+    return await db.scalar(
+        select(ReadingDB.reading)
+        .where(ReadingDB.machine_id == machine_id)
+        .where(ReadingDB.created_at < before)
+        .order_by(ReadingDB.created_at.desc())
+        .limit(1)
+    )
+
+
+async def apply_reading(
+    db: AsyncSession,
+    setup: SetupDB,
+    reading_db: ReadingDB,
+    load_prev_reading: Callable[[], Awaitable[Optional[int]]],
+) -> Tuple[str, str]:
+    """
+    Обновляет статус наладки и создаёт батч по новому показанию.
+    reading_db уже добавлен в сессию. load_prev_reading — предыдущее показание станка.
+    Возвращает (новый статус наладки, сообщение для оператора).
+    """
+    value = reading_db.reading
+    operator_id = reading_db.employee_id
+    validate_reading_value(setup.status, value)
+
+    new_setup_status = setup.status
+    batch_message = ""
+
+    if value == 0:
+        if setup.status in ['created', 'allowed']:
+            logger.info(f"Updating setup {setup.id} status from {setup.status} to started (reading is 0)")
+            setup.status = 'started'
+            setup.start_time = reading_db.created_at # Используем время показаний
+            new_setup_status = 'started'
+            batch_message = "Наладка активирована"
+
+            # Сбрасываем assigned_order лота - он больше не в очереди, а в активной работе
+            lot = await db.get(LotDB, setup.lot_id) if setup.lot_id else None
+            if lot and lot.assigned_order is not None:
+                logger.info(f"Clearing assigned_order for lot {lot.id} (was {lot.assigned_order})")
+                lot.assigned_order = None
+        # Для статуса 'started' нулевые показания просто сохраняются, батч не создается
+        return new_setup_status, batch_message
+
+    # Для ненулевых показаний
+    if setup.status in ['created', 'allowed']:
+        # Случай пропуска нуля
+        logger.info(f"Updating setup {setup.id} status from {setup.status} to started (reading > 0, zero skipped)")
+        setup.status = 'started'
+        setup.start_time = reading_db.created_at
+        new_setup_status = 'started'
+        batch_message = ("⚠️ Внимание! В начале работы необходимо вводить нулевые показания. "
+                         "Наладка автоматически активирована.")
+
+        # Сбрасываем assigned_order лота - он больше не в очереди, а в активной работе
+        lot = await db.get(LotDB, setup.lot_id) if setup.lot_id else None
+        if lot and lot.assigned_order is not None:
+            logger.info(f"Clearing assigned_order for lot {lot.id} (was {lot.assigned_order})")
+            lot.assigned_order = None
+
+        # Ищем существующий батч production (на всякий случай, хотя его не должно быть)
+        existing_batch = await db.scalar(
+            select(BatchDB)
+            .where(BatchDB.setup_job_id == setup.id)
+            .where(BatchDB.current_location == 'production')
+            .limit(1)
+        )
+
+        # 🔧 ИСПРАВЛЕНО 2026-01-20: Ищем ПРЕДЫДУЩЕЕ показание с этого станка
+        # Не предполагаем что счётчик был на 0 - он мог не сброситься!
+        prev_reading_zero_skip = await load_prev_reading()
+
+        baseline = prev_reading_zero_skip if prev_reading_zero_skip is not None else 0
+        actual_batch_quantity = value - baseline
+
+        logger.info(f"Zero skipped: baseline={baseline}, reading={value}, batch_qty={actual_batch_quantity}")
+
+        if not existing_batch:
+            logger.info(f"Creating initial production batch for setup {setup.id} (zero skipped)")
+            new_batch = BatchDB(
+                setup_job_id=setup.id,
+                lot_id=setup.lot_id,
+                initial_quantity=baseline,
+                current_quantity=actual_batch_quantity,  # Разница, а не полное показание!
+                current_location='production',
+                original_location='production',  # Сохраняем исходный статус
+                batch_time=reading_db.created_at,
+                operator_id=operator_id,
+                created_at=reading_db.created_at # Используем время показаний
+            )
+            db.add(new_batch)
+        else:
+             logger.warning(f"Found existing production batch {existing_batch.id} when zero was skipped. Updating quantity.")
+             existing_batch.current_quantity = actual_batch_quantity  # Разница!
+             existing_batch.initial_quantity = baseline
+             existing_batch.operator_id = operator_id
+             existing_batch.batch_time = reading_db.created_at
+
+    elif setup.status == 'started':
+        # Наладка уже была начата, ищем предыдущее показание
+        prev_reading_obj = await load_prev_reading()
+
+        prev_reading = prev_reading_obj if prev_reading_obj is not None else 0 # Считаем 0, если нет предыдущего
+        quantity_in_batch = value - prev_reading
+        logger.info(f"Prev reading: {prev_reading}, Current: {value}, Diff: {quantity_in_batch}")
+
+        if quantity_in_batch > 0:
+            # --- ИСПРАВЛЕНИЕ: Всегда создаем НОВЫЙ батч ---
+            logger.info(f"Creating NEW production batch for setup {setup.id} (started state)")
+            new_batch = BatchDB(
+                setup_job_id=setup.id,
+                lot_id=setup.lot_id,
+                initial_quantity=prev_reading, # Начальное кол-во = предыдущие показания
+                current_quantity=quantity_in_batch, # Текущее кол-во = разница
+                current_location='production',
+                original_location='production',  # Сохраняем исходный статус
+                batch_time=reading_db.created_at,
+                operator_id=operator_id,
+                created_at=reading_db.created_at # Используем время показаний
+            )
+            db.add(new_batch)
+            # --- Конец исправления ---
+        else:
+             logger.warning(f"Quantity difference is not positive ({quantity_in_batch}), not creating batch.")
+
+    return new_setup_status, batch_message
@@ -0,0 +1,308 @@
+"""
+Общий (между uvicorn workers) кэш с межпроцессным single-flight.
+
+В проде запускается `uvicorn --workers 8`, и кэш в памяти процесса означает,
+что тяжёлый запрос пересчитывается каждым воркером отдельно. Здесь результат
+хранится сериализованным (JSON) во внешнем хранилище, а пересчёт делает только
+один воркер — остальные ждут и читают готовое значение.
+
+Backend выбирается переменной SHARED_CACHE_BACKEND:
+  postgres (по умолчанию) — UNLOGGED таблица shared_cache (миграция 053),
+                            single-flight через pg_try_advisory_lock;
+  file                    — файлы в SHARED_CACHE_DIR, single-flight через flock
+                            (только для одного хоста);
+  memory                  — кэш в памяти процесса (старое поведение).
+"""
+import abc
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import text
+
+from src import database
+
+try:
+    import fcntl  # нет на Windows — там file backend работает без межпроцессной блокировки
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SHARED_CACHE_BACKEND = os.getenv("SHARED_CACHE_BACKEND", "postgres").lower()
+SHARED_CACHE_DIR = os.getenv("SHARED_CACHE_DIR", "/tmp/mls_shared_cache")
+SHARED_CACHE_WAIT_TIMEOUT = float(os.getenv("SHARED_CACHE_WAIT_TIMEOUT", "10"))    # сек (ожидание лидера)
+SHARED_CACHE_POLL_INTERVAL = float(os.getenv("SHARED_CACHE_POLL_INTERVAL", "0.1"))  # сек
+
+
+class SharedCacheBackend(abc.ABC):
+    """Интерфейс backend. Значения — JSON-сериализуемые объекты."""
+
+    name = "base"
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Возвращает (значение, возраст в секундах) или None."""
+
+    @abc.abstractmethod
+    async def set(self, key: str, value: Any) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    def single_flight(self, key: str):
+        """Async context manager -> True, если этот процесс стал лидером пересчёта."""
+
+
+class MemorySharedCache(SharedCacheBackend):
+    name = "memory"
+
+    def __init__(self) -> None:
+        self._data: Dict[str, Tuple[str, float]] = {}
+
+    async def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        payload, stored_at = entry
+        return json.loads(payload), time.time() - stored_at
+
+    async def set(self, key: str, value: Any) -> None:
+        self._data[key] = (json.dumps(value, default=str), time.time())
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    @asynccontextmanager
+    async def single_flight(self, key: str) -> AsyncIterator[bool]:
+        # Внутри процесса single-flight обеспечивает asyncio.Lock вызывающего кода
+        yield True
+
+
+class PostgresSharedCache(SharedCacheBackend):
+    """UNLOGGED таблица: без WAL, при крэше БД просто очищается — для кэша это нормально."""
+
+    name = "postgres"
+
+    async def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        async with database.async_engine.connect() as conn:
+            row = (await conn.execute(
+                text("""
+                    SELECT payload, EXTRACT(EPOCH FROM (NOW() - updated_at)) AS age
+                    FROM shared_cache
+                    WHERE cache_key = :key
+                """),
+                {"key": key},
+            )).first()
+        if row is None:
+            return None
+        return json.loads(row.payload), float(row.age)
+
+    async def set(self, key: str, value: Any) -> None:
+        payload = json.dumps(value, default=str)
+        async with database.async_engine.begin() as conn:
+            await conn.execute(
+                text("""
+                    INSERT INTO shared_cache (cache_key, payload, updated_at)
+                    VALUES (:key, :payload, NOW())
+                    ON CONFLICT (cache_key) DO UPDATE
+                    SET payload = EXCLUDED.payload, updated_at = EXCLUDED.updated_at
+                """),
+                {"key": key, "payload": payload},
+            )
+
+    async def delete(self, key: str) -> None:
+        async with database.async_engine.begin() as conn:
+            await conn.execute(text("DELETE FROM shared_cache WHERE cache_key = :key"), {"key": key})
+
+    @asynccontextmanager
+    async def single_flight(self, key: str) -> AsyncIterator[bool]:
+        lock_key = f"shared_cache:{key}"
+        async with database.async_engine.connect() as conn:
+            acquired = bool(await conn.scalar(
+                text("SELECT pg_try_advisory_lock(hashtext(:k))"), {"k": lock_key}
+            ))
+            # session-level lock не снимается rollback'ом — commit, чтобы не держать транзакцию
+            await conn.commit()
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    await conn.execute(text("SELECT pg_advisory_unlock(hashtext(:k))"), {"k": lock_key})
+                    await conn.commit()
+
+
+class FileSharedCache(SharedCacheBackend):
+    """Файлы в общем каталоге — для запуска нескольких воркеров на одном хосте без БД-кэша."""
+
+    name = "file"
+
+    def __init__(self, directory: str) -> None:
+        self._dir = Path(directory)
+
+    def _path(self, key: str, suffix: str) -> Path:
+        safe_key = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in key)
+        return self._dir / f"{safe_key}{suffix}"
+
+    def _read(self, key: str) -> Optional[Tuple[Any, float]]:
+        path = self._path(key, ".json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        return entry["payload"], time.time() - float(entry["at"])
+
+    def _write(self, key: str, value: Any) -> None:
+        self._dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(key, ".json")
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"at": time.time(), "payload": value}, f, default=str)
+        os.replace(tmp_path, path)  # атомарная замена — читатели не видят полузаписанный файл
+
+    def _remove(self, key: str) -> None:
+        try:
+            os.remove(self._path(key, ".json"))
+        except FileNotFoundError:
+            pass
+
+    async def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        return await asyncio.to_thread(self._read, key)
+
+    async def set(self, key: str, value: Any) -> None:
+        await asyncio.to_thread(self._write, key, value)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._remove, key)
+
+    @asynccontextmanager
+    async def single_flight(self, key: str) -> AsyncIterator[bool]:
+        if fcntl is None:
+            yield True
+            return
+        self._dir.mkdir(parents=True, exist_ok=True)
+        lock_file = open(self._path(key, ".lock"), "a+")
+        try:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                acquired = True
+            except BlockingIOError:
+                acquired = False
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        finally:
+            lock_file.close()
+
+
+_backend: Optional[SharedCacheBackend] = None
+
+
+def get_shared_cache() -> SharedCacheBackend:
+    global _backend
+    if _backend is None:
+        if SHARED_CACHE_BACKEND == "postgres" and database.async_engine is not None:
+            _backend = PostgresSharedCache()
+        elif SHARED_CACHE_BACKEND == "file":
+            _backend = FileSharedCache(SHARED_CACHE_DIR)
+        else:
+            if SHARED_CACHE_BACKEND not in ("memory", "postgres"):
+                logger.warning(f"Unknown SHARED_CACHE_BACKEND={SHARED_CACHE_BACKEND}, using memory")
+            _backend = MemorySharedCache()
+        logger.info(f"Shared cache backend: {_backend.name}")
+    return _backend
+
+
+async def _set_quietly(backend: SharedCacheBackend, key: str, value: Any) -> None:
+    try:
+        await backend.set(key, value)
+    except Exception as e:
+        logger.warning(f"Shared cache set failed for {key}: {e}")
+
+
+async def get_or_refresh(
+    key: str,
+    ttl: float,
+    loader: Callable[[], Awaitable[Any]],
+    wait_timeout: float = SHARED_CACHE_WAIT_TIMEOUT,
+) -> Tuple[Any, float]:
+    """
+    Возвращает (значение, возраст) из общего кэша; если значение старше ttl —
+    пересчитывает его ровно в одном процессе. Остальные процессы ждут появления
+    свежего значения до wait_timeout, после чего считают сами.
+
+    Ошибки backend (например, таблица ещё не создана) не ломают запрос —
+    значение просто считается через loader без кэша.
+    """
+    backend = get_shared_cache()
+
+    try:
+        hit = await backend.get(key)
+    except Exception as e:
+        logger.warning(f"Shared cache get failed for {key}: {e}")
+        return await loader(), 0.0
+    if hit is not None and hit[1] <= ttl:
+        return hit
+
+    result: Optional[Tuple[Any, float]] = None
+    loading = False
+    try:
+        async with backend.single_flight(key) as leader:
+            if leader:
+                try:
+                    hit = await backend.get(key)
+                except Exception as e:
+                    logger.warning(f"Shared cache get failed for {key}: {e}")
+                    hit = None
+                if hit is not None and hit[1] <= ttl:
+                    result = hit
+                else:
+                    loading = True
+                    value = await loader()
+                    loading = False
+                    await _set_quietly(backend, key, value)
+                    result = value, 0.0
+    except Exception as e:
+        if loading:
+            raise
+        if result is None:
+            logger.warning(f"Shared cache single-flight failed for {key}: {e}")
+            return await loader(), 0.0
+        # Значение уже есть, не удалось только снять блокировку
+        logger.warning(f"Shared cache single-flight release failed for {key}: {e}")
+    if result is not None:
+        return result
+
+    # Пересчитывает другой воркер — ждём его результат
+    deadline = time.monotonic() + wait_timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(SHARED_CACHE_POLL_INTERVAL)
+        try:
+            hit = await backend.get(key)
+        except Exception:
+            break
+        if hit is not None and hit[1] <= ttl:
+            return hit
+
+    logger.warning(f"Shared cache: leader did not refresh {key} in {wait_timeout}s, computing locally")
+    value = await loader()
+    await _set_quietly(backend, key, value)
+    return value, 0.0
+
+
+async def invalidate(key: str) -> None:
+    try:
+        await get_shared_cache().delete(key)
+    except Exception as e:
+        logger.warning(f"Shared cache invalidate failed for {key}: {e}")
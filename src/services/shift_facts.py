@@ -0,0 +1,194 @@
+"""
+Факты производства по сменам (таблица shift_production_facts, миграция 058).
+
+Отчёты раньше каждый раз заново раскладывали сырые показания по сменам
+(06:00–18:00 / 18:00–06:00 Asia/Jerusalem). Теперь смена пересобирается
+один раз и отчёты читают готовые строки:
+    (смена, станок, наладка, оператор) → деталей, первое/последнее показание.
+
+Поддержка:
+  * refresh_open_shifts() — задача планировщика (только лидер): открытая
+    смена каждые SHIFT_FACTS_REFRESH_MINUTES и смены из
+    shift_production_facts_pending — закрывшаяся открытая смена (задача
+    отмечает её сама) и поздние правки показаний (отмечаются триггером на
+    machine_readings);
+  * refresh_shift() — пересборка одной смены (используется и backfill-скриптом
+    scripts/backfill_shift_production_facts.py).
+
+Пересборка закрытой смены сбрасывает daily_production_report_cache начиная
+с её отчётной даты: отчёт за дату и начальные показания следующих дней
+читаются из фактов.
+"""
+import logging
+import os
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from src.services.production_day import ShiftWindow, shift_window_at
+
+logger = logging.getLogger(__name__)
+
+SHIFT_FACTS_REFRESH_MINUTES = int(os.getenv("SHIFT_FACTS_REFRESH_MINUTES", "5"))
+
+# Одна пересборка смены за раз (задача планировщика и backfill могут пересечься)
+_LOCK_SHIFT_SQL = text(
+    "SELECT pg_advisory_xact_lock(hashtext('shift_production_facts'), "
+    "CAST(EXTRACT(EPOCH FROM CAST(:shift_start AS timestamp)) AS integer))"
+)
+
+_DELETE_FACTS_SQL = text("DELETE FROM shift_production_facts WHERE shift_start = :shift_start")
+
+# Дельты счётчика внутри наладки: предыдущее показание — соседнее в смене
+# или последнее до начала смены (baseline). Сброс счётчика (показание меньше
+# предыдущего) — считается новое значение, как в ежедневном отчёте.
+_INSERT_FACTS_SQL = text("""
+    INSERT INTO shift_production_facts (
+        shift_start, shift_date, shift_type, machine_id, operator_id, setup_id, lot_id,
+        parts_produced, readings_count, first_reading, last_reading,
+        first_reading_at, last_reading_at, updated_at
+    )
+    WITH shift_readings AS (
+        SELECT
+            mr.id, mr.machine_id, mr.employee_id, mr.setup_job_id, mr.reading, mr.created_at,
+            LAG(mr.reading) OVER (PARTITION BY mr.setup_job_id ORDER BY mr.created_at, mr.id) AS prev_in_shift
+        FROM machine_readings mr
+        WHERE mr.created_at >= :shift_start
+          AND mr.created_at < :shift_end
+          AND mr.setup_job_id IS NOT NULL
+          AND mr.reading IS NOT NULL
+    ),
+    baseline AS (
+        SELECT s.setup_job_id, b.reading
+        FROM (SELECT DISTINCT setup_job_id FROM shift_readings) s
+        CROSS JOIN LATERAL (
+            SELECT p.reading
+            FROM machine_readings p
+            WHERE p.setup_job_id = s.setup_job_id
+              AND p.created_at < :shift_start
+              AND p.reading IS NOT NULL
+            ORDER BY p.created_at DESC, p.id DESC
+            LIMIT 1
+        ) b
+    ),
+    deltas AS (
+        SELECT r.*, COALESCE(r.prev_in_shift, b.reading, 0) AS prev_reading
+        FROM shift_readings r
+        LEFT JOIN baseline b ON b.setup_job_id = r.setup_job_id
+    )
+    SELECT
+        :shift_start, :shift_date, :shift_type,
+        d.machine_id, d.employee_id, d.setup_job_id, sj.lot_id,
+        SUM(CASE WHEN d.reading >= d.prev_reading THEN d.reading - d.prev_reading ELSE d.reading END),
+        COUNT(*),
+        (ARRAY_AGG(d.reading ORDER BY d.created_at, d.id))[1],
+        (ARRAY_AGG(d.reading ORDER BY d.created_at DESC, d.id DESC))[1],
+        MIN(d.created_at),
+        MAX(d.created_at),
+        NOW()
+    FROM deltas d
+    JOIN setup_jobs sj ON sj.id = d.setup_job_id
+    GROUP BY d.machine_id, d.employee_id, d.setup_job_id, sj.lot_id
+""")
+
+_INVALIDATE_REPORT_CACHE_SQL = text(
+    "DELETE FROM daily_production_report_cache WHERE report_date >= :report_date"
+)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def refresh_shift(db: Session, shift: ShiftWindow, invalidate_cache: bool = True) -> int:
+    """Пересобирает факты одной смены в одной транзакции. Возвращает число строк."""
+    params = {
+        "shift_start": shift.shift_start,
+        "shift_end": shift.shift_end,
+        "shift_date": shift.report_date,
+        "shift_type": shift.shift_type,
+    }
+    try:
+        db.execute(_LOCK_SHIFT_SQL, params)
+        db.execute(_DELETE_FACTS_SQL, params)
+        inserted = db.execute(_INSERT_FACTS_SQL, params).rowcount or 0
+        if invalidate_cache:
+            db.execute(_INVALIDATE_REPORT_CACHE_SQL, {"report_date": shift.report_date})
+        db.commit()
+        return inserted
+    except Exception:
+        db.rollback()
+        raise
+
+
+def _claim_pending_shifts(db: Session, before: datetime) -> List[datetime]:
+    rows = db.execute(
+        text("DELETE FROM shift_production_facts_pending WHERE shift_start < :before RETURNING shift_start"),
+        {"before": before},
+    ).fetchall()
+    db.commit()
+    return sorted(row.shift_start for row in rows)
+
+
+def _mark_pending_shift(db: Session, shift_start: datetime) -> None:
+    db.execute(
+        text("""
+            INSERT INTO shift_production_facts_pending (shift_start) VALUES (:shift_start)
+            ON CONFLICT (shift_start) DO NOTHING
+        """),
+        {"shift_start": shift_start},
+    )
+    db.commit()
+
+
+def refresh_open_shifts(db: Session, now_utc: Optional[datetime] = None) -> dict:
+    """
+    Задача планировщика: открытая смена и закрытые смены из
+    shift_production_facts_pending.
+
+    Открытая смена сама отмечается в pending и остаётся там, пока не закроется:
+    первый запуск после её окончания добирает показания последних минут, как бы
+    поздно он ни случился (простой планировщика, смена лидера). Смена, которую
+    не удалось пересобрать, возвращается в pending.
+    """
+    now_utc = now_utc or _utcnow()
+    open_shift = shift_window_at(now_utc)
+    stats = {"open_rows": 0, "closed_shifts": 0}
+
+    # Открытая смена: её дата ещё не закрыта и не кэшируется
+    try:
+        _mark_pending_shift(db, open_shift.shift_start)
+        stats["open_rows"] = refresh_shift(db, open_shift, invalidate_cache=False)
+    except Exception:
+        logger.error(f"Shift facts refresh failed for open shift {open_shift.shift_start}", exc_info=True)
+        db.rollback()
+
+    # Сначала забираем отметки: правка, пришедшая во время пересборки, отметит смену снова
+    try:
+        closed = [shift_window_at(shift_start) for shift_start in _claim_pending_shifts(db, open_shift.shift_start)]
+    except Exception:
+        logger.error("Shift facts: failed to claim pending shifts", exc_info=True)
+        db.rollback()
+        return stats
+
+    for shift in closed:
+        try:
+            refresh_shift(db, shift)
+            stats["closed_shifts"] += 1
+        except Exception:
+            logger.error(f"Shift facts refresh failed for {shift.shift_start}", exc_info=True)
+            _mark_pending_shift(db, shift.shift_start)
+    return stats
+
+
+def refresh_range(db: Session, start_utc: datetime, end_utc: datetime) -> int:
+    """Пересобирает все смены, пересекающие [start_utc, end_utc) (backfill)."""
+    shift = shift_window_at(start_utc)
+    open_start = shift_window_at(_utcnow()).shift_start
+    total = 0
+    while shift.shift_start < end_utc:
+        total += refresh_shift(db, shift, invalidate_cache=shift.shift_start < open_start)
+        shift = shift.next()
+    return total
@@ -0,0 +1,112 @@
+"""
+Broadcast для SSE: одно сериализованное событие — всем подписчикам.
+
+Публикатор (например, dashboard collector) сериализует снимок в bytes один
+раз и кладёт ссылку на них в ограниченную очередь каждого подписчика.
+SSE-генератор клиента спит на своей очереди и просыпается только когда есть
+что отправить — без опроса раз в секунду и без json.dumps на каждого клиента.
+
+Если клиент не успевает забирать события (медленный Wi-Fi, зависший планшет)
+и его очередь переполнилась — он отключается, чтобы не копить память и не
+держать устаревшие данные. Клиент переподключится сам (retry в SSE).
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+SSE_SUBSCRIBER_QUEUE_SIZE = int(os.getenv("SSE_SUBSCRIBER_QUEUE_SIZE", "10"))
+
+# Элемент очереди: (payload, время публикации по monotonic, версия) или None — сигнал отключения
+QueueItem = Optional[Tuple[bytes, float, int]]
+
+
+class Subscriber:
+    """Один SSE-клиент."""
+
+    __slots__ = ("client", "queue", "connected_at", "sent", "last_lag_ms", "max_lag_ms", "dropped")
+
+    def __init__(self, client: str, queue_size: int):
+        self.client = client
+        self.queue: "asyncio.Queue[QueueItem]" = asyncio.Queue(maxsize=queue_size)
+        self.connected_at = time.time()
+        self.sent = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.dropped = False
+
+    def mark_sent(self, published_at: float) -> None:
+        """Вызывается после отправки события клиенту: лаг = публикация → отправка."""
+        lag_ms = (time.monotonic() - published_at) * 1000
+        self.sent += 1
+        self.last_lag_ms = lag_ms
+        if lag_ms > self.max_lag_ms:
+            self.max_lag_ms = lag_ms
+
+
+class Broadcaster:
+    def __init__(self, name: str, queue_size: int = SSE_SUBSCRIBER_QUEUE_SIZE):
+        self.name = name
+        self.queue_size = queue_size
+        self._subscribers: Set[Subscriber] = set()
+        self.published = 0
+        self.last_published_at: Optional[float] = None
+        self.dropped_total = 0
+
+    def subscribe(self, client: str) -> Subscriber:
+        sub = Subscriber(client, self.queue_size)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        self._subscribers.discard(sub)
+
+    def publish(self, payload: bytes, version: int = 0) -> None:
+        """Раздаёт уже сериализованное событие всем подписчикам (без копирования)."""
+        stamp = time.monotonic()
+        self.published += 1
+        self.last_published_at = time.time()
+        for sub in list(self._subscribers):
+            try:
+                sub.queue.put_nowait((payload, stamp, version))
+            except asyncio.QueueFull:
+                self._drop(sub)
+
+    def _drop(self, sub: Subscriber) -> None:
+        sub.dropped = True
+        self._subscribers.discard(sub)
+        self.dropped_total += 1
+        # Освобождаем очередь и кладём сигнал отключения
+        while not sub.queue.empty():
+            sub.queue.get_nowait()
+        sub.queue.put_nowait(None)
+        logger.warning(f"📡 [{self.name}] slow SSE client dropped: {sub.client} (queue full, sent={sub.sent})")
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def status(self) -> Dict[str, Any]:
+        now = time.time()
+        subscribers: List[Dict[str, Any]] = [
+            {
+                "client": sub.client,
+                "connected_sec": round(now - sub.connected_at, 1),
+                "sent": sub.sent,
+                "queued": sub.queue.qsize(),
+                "last_lag_ms": round(sub.last_lag_ms, 1),
+                "max_lag_ms": round(sub.max_lag_ms, 1),
+            }
+            for sub in self._subscribers
+        ]
+        lags = [s["last_lag_ms"] for s in subscribers]
+        return {
+            "subscribers": len(subscribers),
+            "published": self.published,
+            "dropped_total": self.dropped_total,
+            "max_last_lag_ms": max(lags) if lags else 0.0,
+            "clients": sorted(subscribers, key=lambda s: s["last_lag_ms"], reverse=True),
+        }
@@ -0,0 +1,160 @@
+"""
+Delta-кодирование SSE-снимков дашборда.
+
+Вместо полного JSON на каждое обновление клиент получает:
+  event: snapshot — полный снимок в индексированном виде (станки — dict по id);
+  event: delta    — список операций в стиле JSON Patch относительно предыдущей версии.
+
+Каждое событие имеет id "<epoch>:<version>". epoch — идентификатор процесса
+(воркера): при переподключении на другой воркер (или после рестарта) версия
+не сравнима, и клиент получает полный снимок. Если версия из Last-Event-ID
+ещё есть в кольцевом буфере — досылаются только пропущенные delta.
+
+Формат delta:
+  {"version": 12, "base": 11, "ops": [
+      {"op": "replace", "path": "/machines/5", "value": {...}},
+      {"op": "remove",  "path": "/setup_times/SR-32"}
+  ], "collected_at": "..."}
+"""
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from src.services.sse_broadcast import Broadcaster
+
+logger = logging.getLogger(__name__)
+
+SSE_DELTA_RING_SIZE = int(os.getenv("SSE_DELTA_RING_SIZE", "64"))
+
+# Секции снимка, которые сравниваются по ключам
+KEYED_SECTIONS = ("machines", "setup_times", "prev_setup_times")
+# Секции, которые заменяются целиком
+PLAIN_SECTIONS = ("shift",)
+# Служебные поля: меняются каждый сбор, в diff не участвуют
+META_FIELDS = ("timestamp", "collected_at", "collection_time_ms")
+
+
+def index_dashboard_data(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Приводит снимок коллектора к виду, удобному для diff (станки — по id)."""
+    indexed: Dict[str, Any] = {
+        "machines": {str(m["id"]): m for m in data.get("machines", [])},
+        "setup_times": dict(data.get("setup_times") or {}),
+        "prev_setup_times": dict(data.get("prev_setup_times") or {}),
+    }
+    for section in PLAIN_SECTIONS:
+        indexed[section] = data.get(section)
+    return indexed
+
+
+def _pointer(*parts: str) -> str:
+    """JSON Pointer (RFC 6901): '~' -> '~0', '/' -> '~1'."""
+    return "".join("/" + str(p).replace("~", "~0").replace("/", "~1") for p in parts)
+
+
+def diff_indexed(old: Dict[str, Any], new: Dict[str, Any]) -> List[Dict[str, Any]]:
+    ops: List[Dict[str, Any]] = []
+    for section in PLAIN_SECTIONS:
+        if old.get(section) != new.get(section):
+            ops.append({"op": "replace", "path": _pointer(section), "value": new.get(section)})
+    for section in KEYED_SECTIONS:
+        old_items = old.get(section) or {}
+        new_items = new.get(section) or {}
+        for key, value in new_items.items():
+            if key not in old_items:
+                ops.append({"op": "add", "path": _pointer(section, key), "value": value})
+            elif old_items[key] != value:
+                ops.append({"op": "replace", "path": _pointer(section, key), "value": value})
+        for key in old_items:
+            if key not in new_items:
+                ops.append({"op": "remove", "path": _pointer(section, key)})
+    return ops
+
+
+def _sse_event(event: str, event_id: str, payload: Dict[str, Any]) -> bytes:
+    data = json.dumps(payload, ensure_ascii=False, default=str)
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n".encode("utf-8")
+
+
+class DeltaStream:
+    """Версионированный поток snapshot/delta с кольцевым буфером пропущенных delta."""
+
+    def __init__(self, name: str, ring_size: int = SSE_DELTA_RING_SIZE):
+        self.epoch = f"{os.getpid():x}{int(time.time()):x}"
+        self.version = 0
+        self.broadcaster = Broadcaster(f"{name}-delta")
+        self.snapshot_bytes: bytes = b""
+        self._indexed: Optional[Dict[str, Any]] = None
+        self._ring: Deque[Tuple[int, bytes]] = deque(maxlen=ring_size)
+        self.skipped_unchanged = 0
+
+    def event_id(self, version: Optional[int] = None) -> str:
+        return f"{self.epoch}:{self.version if version is None else version}"
+
+    def publish(self, data: Dict[str, Any]) -> None:
+        indexed = index_dashboard_data(data)
+        meta = {field: data.get(field) for field in META_FIELDS}
+
+        if self._indexed is not None:
+            ops = diff_indexed(self._indexed, indexed)
+            if not ops:
+                # Ничего не изменилось — клиентам нечего отправлять (keep-alive держит heartbeat)
+                self.skipped_unchanged += 1
+                return
+        else:
+            ops = None
+
+        self.version += 1
+        self._indexed = indexed
+        self.snapshot_bytes = _sse_event(
+            "snapshot", self.event_id(), {"version": self.version, "data": indexed, **meta}
+        )
+        if ops is None:
+            # Первый снимок: delta не из чего строить, подписчики получат snapshot
+            self._ring.clear()
+            self.broadcaster.publish(self.snapshot_bytes, self.version)
+            return
+
+        delta_bytes = _sse_event(
+            "delta", self.event_id(), {"version": self.version, "base": self.version - 1, "ops": ops, **meta}
+        )
+        self._ring.append((self.version, delta_bytes))
+        self.broadcaster.publish(delta_bytes, self.version)
+
+    def parse_last_event_id(self, last_event_id: Optional[str]) -> Optional[int]:
+        """Версия из Last-Event-ID, если он выдан этим же процессом."""
+        if not last_event_id:
+            return None
+        epoch, _, version = last_event_id.strip().partition(":")
+        if epoch != self.epoch or not version.isdigit():
+            return None
+        return int(version)
+
+    def resume_events(self, last_event_id: Optional[str]) -> Tuple[List[bytes], int]:
+        """
+        События для (пере)подключившегося клиента и версия, до которой он догнан.
+        Пропущенные delta — если все есть в буфере, иначе полный снимок.
+        """
+        if not self.snapshot_bytes:
+            return [], 0
+        known = self.parse_last_event_id(last_event_id)
+        if known is not None:
+            if known == self.version:
+                return [], self.version
+            missing = [payload for version, payload in self._ring if version > known]
+            if self._ring and known >= self._ring[0][0] - 1 and known < self.version:
+                return missing, self.version
+        return [self.snapshot_bytes], self.version
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "epoch": self.epoch,
+            "version": self.version,
+            "ring_size": len(self._ring),
+            "ring_oldest_version": self._ring[0][0] if self._ring else None,
+            "skipped_unchanged": self.skipped_unchanged,
+            "snapshot_bytes": len(self.snapshot_bytes),
+            "broadcast": self.broadcaster.status(),
+        }
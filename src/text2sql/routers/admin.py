@@ -5,12 +5,13 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from src.database import get_db_session
+from src.utils.sync_db_offload import SyncDBOffloadRoute
 import logging
 import psycopg2.extras
 from pydantic import BaseModel
 from .text2sql import _ru_from_sql
 
-router = APIRouter(prefix="/api/text2sql/admin", tags=["Text2SQL Admin"])
+router = APIRouter(prefix="/api/text2sql/admin", tags=["Text2SQL Admin"], route_class=SyncDBOffloadRoute)
 logger = logging.getLogger(__name__)
 
 
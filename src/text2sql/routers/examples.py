@@ -7,6 +7,7 @@ from sqlalchemy import text
 from typing import List, Optional
 from pydantic import BaseModel
 from src.database import get_db_session
+from src.utils.sync_db_offload import SyncDBOffloadRoute
 from src.text2sql.utils.sql_normalizer import (
     normalize_sql, 
     extract_table_names, 
@@ -16,7 +17,7 @@ from src.text2sql.utils.sql_normalizer import (
     suggest_business_question
 )
 
-router = APIRouter(prefix="/api/text2sql/examples", tags=["text2sql-examples"])
+router = APIRouter(prefix="/api/text2sql/examples", tags=["text2sql-examples"], route_class=SyncDBOffloadRoute)
 
 
 class ExampleResponse(BaseModel):
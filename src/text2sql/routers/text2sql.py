@@ -3,6 +3,7 @@ from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from src.database import get_db_session
+from src.utils.sync_db_offload import SyncDBOffloadRoute
 from src.text2sql.services.text2sql_service import Text2SQLService
 from src.text2sql.services.text2sql_metrics import Text2SQLMetrics
 from src.text2sql.services.sql_validator import SQLValidator, ValidationLevel
@@ -14,7 +15,7 @@ import os
 import re
 import json
 
-router = APIRouter(prefix="/api/text2sql", tags=["text2sql"])
+router = APIRouter(prefix="/api/text2sql", tags=["text2sql"], route_class=SyncDBOffloadRoute)
 
 class NLQuery(BaseModel):
     question: str
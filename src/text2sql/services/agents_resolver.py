@@ -7,15 +7,7 @@ import httpx
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
-
-def _normalize_machine_name(name: str) -> str:
-    s = (name or "").strip().lower()
-    # убираем префикс вида m_2_
-    s = re.sub(r"^m_\d+_", "", s)
-    # заменяем не буквенно-цифровые на дефис
-    s = re.sub(r"[^a-z0-9]+", "-", s)
-    s = re.sub(r"-+", "-", s).strip("-")
-    return s
+from src.services.machine_resolver import get_machine_index
 
 
 def _normalize_person_name(name: str) -> str:
@@ -66,8 +58,7 @@ async def resolve_entities_llm(question: str, db: Session, api_key: str, example
         emp_rows = db.execute(text("SELECT COALESCE(full_name, username)::text AS name FROM employees WHERE is_active IS NULL OR is_active = TRUE")).fetchall()
         employees_list = [r.name for r in emp_rows if r.name]
         
-        mach_rows = db.execute(text("SELECT name FROM machines WHERE is_active=TRUE")).fetchall()
-        machines_list = [r.name for r in mach_rows if r.name]
+        machines_list = [m.name for m in get_machine_index(db).active()]
     except Exception:
         employees_list = []
         machines_list = []
@@ -152,12 +143,11 @@ Extract entities and intent. Return JSON only."""
         
         # Machines
         if result.get("machines"):
-            mach_names = [n.strip() for n in result["machines"]]
-            mach_rows = db.execute(text("""
-                SELECT id FROM machines
-                WHERE is_active=TRUE AND name = ANY(:names)
-            """), {"names": mach_names}).fetchall()
-            resolved["machines"] = [r.id for r in mach_rows]
+            index = get_machine_index(db)
+            mach_ids = (index.resolve(n.strip()) for n in result["machines"])
+            resolved["machines"] = list(dict.fromkeys(
+                mid for mid in mach_ids if mid is not None and index.by_id[mid].is_active
+            ))
         
         return resolved
     
@@ -261,14 +251,12 @@ def resolve_entities(question: str, db: Session) -> Dict[str, Any]:
     # 4) machines
     machines: List[int] = []
     try:
-        rows = db.execute(text("SELECT id, name FROM machines WHERE is_active=TRUE")).fetchall()
-        canon = [(r.id, _normalize_machine_name(r.name)) for r in rows]
         tokens = [t for t in re.findall(r"[\w]+", qlow) if len(t) >= 2]
         cand: Set[int] = set()
-        for mid, mname in canon:
+        for machine in get_machine_index(db).active():
             for t in tokens:
-                if t in mname:
-                    cand.add(mid)
+                if t in machine.key:
+                    cand.add(machine.id)
                     break
         machines = list(cand)[:10]
     except Exception:
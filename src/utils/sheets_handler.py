@@ -1,13 +1,45 @@
+"""
+Запись показаний в Google Sheets (строка — станок, столбец — оператор).
+
+Раньше каждое показание запускало save_to_sheets(): новая авторизация,
+open_by_key, get_all_values() всей таблицы и синхронный update_cell прямо
+в event loop. В конце смены ~40 операторов за несколько минут упирались
+в квоту Sheets API и подвешивали loop.
+
+Теперь SheetsWriter (один на worker) работает как write-behind очередь:
+  * enqueue() только кладёт значение в словарь (ячейка → последнее значение),
+    повтор в ту же ячейку в пределах окна перезаписывает предыдущий;
+  * фоновая задача раз в SHEETS_FLUSH_INTERVAL_SEC отправляет все ячейки
+    одним worksheet.batch_update в потоке (gspread синхронный);
+  * worksheet и индекс строк станков / столбцов операторов кэшируются,
+    индекс перечитывается раз в SHEETS_INDEX_TTL_SEC или при промахе;
+  * при 429/5xx значения возвращаются в очередь (если их не перезаписали
+    более новые), следующая попытка — с экспоненциальной задержкой.
+
+Использование:
+    get_sheets_writer().enqueue(operator="Vova", machine="SR-32", reading=1234)
+"""
 import gspread
+from gspread.utils import rowcol_to_a1
 from google.oauth2.service_account import Credentials
+import asyncio
 import logging
-from datetime import datetime
-import pytz
 import os
 import json
+import random
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+SPREADSHEET_ID = '1aHjKbs4v6wgdqDpHP7_JWxY8pbVNW5betIXlt1GK2y8'
+SHEETS_FLUSH_INTERVAL_SEC = float(os.getenv("SHEETS_FLUSH_INTERVAL_SEC", "5"))
+SHEETS_INDEX_TTL_SEC = float(os.getenv("SHEETS_INDEX_TTL_SEC", "300"))
+SHEETS_INDEX_MISS_REFRESH_SEC = float(os.getenv("SHEETS_INDEX_MISS_REFRESH_SEC", "60"))
+SHEETS_BACKOFF_BASE_SEC = float(os.getenv("SHEETS_BACKOFF_BASE_SEC", "5"))
+SHEETS_BACKOFF_MAX_SEC = float(os.getenv("SHEETS_BACKOFF_MAX_SEC", "300"))
+
 SCOPES = [
     'https://www.googleapis.com/auth/spreadsheets',
     'https://www.googleapis.com/auth/drive'
@@ -32,7 +64,6 @@ def init_google_sheets():
         )
         
         gc = gspread.authorize(credentials)
-        SPREADSHEET_ID = '1aHjKbs4v6wgdqDpHP7_JWxY8pbVNW5betIXlt1GK2y8'
         worksheet = gc.open_by_key(SPREADSHEET_ID).sheet1
         
         logger.info("Successfully connected to Google Sheets using environment variable")
@@ -41,7 +72,7 @@ def init_google_sheets():
         logger.error(f"Error connecting to Google Sheets: {e}")
         return None
 
-async def normalize_machine_name(machine: str) -> str:
+def normalize_machine_name(machine: str) -> str:
     """Нормализует название станка для соответствия таблице"""
     machine_mappings = {
         'XD-38': 'XD38',
@@ -65,7 +96,7 @@ async def normalize_machine_name(machine: str) -> str:
     }
     return machine_mappings.get(machine, machine)
 
-async def normalize_operator_name(operator: str) -> str:
+def normalize_operator_name(operator: str) -> str:
     """Нормализует имя оператора для соответствия таблице"""
     operator_mappings = {
         'Roman': 'Roman',
@@ -80,59 +111,182 @@ async def normalize_operator_name(operator: str) -> str:
     }
     return operator_mappings.get(operator, operator)
 
-async def save_to_sheets(operator: str, machine: str, reading: int):
-    logger.info(f"Attempting to save to sheets: operator={operator}, machine={machine}, reading={reading}")
-    
-    worksheet = init_google_sheets()
-    if not worksheet:
-        logger.error("Failed to initialize Google Sheets")
-        return False
-        
-    try:
-        # Получаем все значения для поиска индексов
-        logger.info("Getting all values from sheet")
-        all_values = worksheet.get_all_values()
-        
-        # Нормализуем название станка и имя оператора
-        normalized_machine = await normalize_machine_name(machine)
-        normalized_operator = await normalize_operator_name(operator)
-        logger.info(f"Normalized machine name: {machine} -> {normalized_machine}")
-        logger.info(f"Normalized operator name: {operator} -> {normalized_operator}")
-        
-        # Находим индекс строки для станка
-        machine_row = None
+CellKey = Tuple[str, str]  # (станок, оператор) после нормализации
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Квота (429) и ошибки сервера Google — повторяем; остальное (400, 404) — нет."""
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is None:
+        return True  # сеть / таймаут
+    return status == 429 or status >= 500
+
+
+class SheetsWriter:
+    def __init__(self):
+        self._pending: Dict[CellKey, str] = {}
+        self._lock = threading.Lock()  # enqueue вызывается из основного loop и из пула offload
+        self._worksheet = None
+        self._machine_rows: Dict[str, int] = {}
+        self._operator_cols: Dict[str, int] = {}
+        self._index_loaded_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._failures = 0
+        self._retry_at = 0.0
+        self.flushed_cells = 0
+        self.flush_count = 0
+        self.dropped_cells = 0
+        self.last_error: Optional[str] = None
+
+    # --- очередь ---
+
+    def enqueue(self, operator: str, machine: str, reading: Any) -> None:
+        """Неблокирующая постановка значения в очередь (последнее значение ячейки выигрывает)."""
+        key = (normalize_machine_name(machine), normalize_operator_name(operator))
+        with self._lock:
+            self._pending[key] = str(reading)
+
+    def _take_pending(self) -> Dict[CellKey, str]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def _requeue(self, cells: Dict[CellKey, str]) -> None:
+        with self._lock:
+            for key, value in cells.items():
+                self._pending.setdefault(key, value)  # более новое значение не затираем
+
+    # --- worksheet и индекс (только в потоке flush) ---
+
+    def _load_index(self) -> None:
+        all_values = self._worksheet.get_all_values()
+        self._machine_rows = {}
         for i, row in enumerate(all_values):
-            if row[0].strip() == normalized_machine:
-                machine_row = i + 1
-                break
-                
-        if not machine_row:
-            logger.error(f"Machine {machine} (normalized: {normalized_machine}) not found in sheet")
-            return False
-            
-        logger.info(f"Found machine row: {machine_row}")
-            
-        # Находим индекс столбца для оператора
-        operator_col = None
-        headers = all_values[0]
+            if row and row[0].strip():
+                self._machine_rows.setdefault(row[0].strip(), i + 1)
+        headers = all_values[0] if all_values else []
+        self._operator_cols = {}
         for i, header in enumerate(headers):
-            if header.strip() == normalized_operator:
-                operator_col = i + 1
-                break
-                
-        if not operator_col:
-            logger.error(f"Operator {normalized_operator} not found in sheet. Available headers: {headers}")
-            return False
-            
-        logger.info(f"Found operator column: {operator_col}")
-            
-        # Обновляем конкретную ячейку
-        logger.info(f"Updating cell at row={machine_row}, col={operator_col} with value={reading}")
-        worksheet.update_cell(machine_row, operator_col, str(reading))
-        
-        logger.info(f"Successfully saved to sheet: machine={machine}({machine_row}), operator={operator}({operator_col}), reading={reading}")
+            if header.strip():
+                self._operator_cols.setdefault(header.strip(), i + 1)
+        self._index_loaded_at = time.time()
+        logger.info(f"Sheets index loaded: {len(self._machine_rows)} machines, {len(self._operator_cols)} operators")
+
+    def _ensure_ready(self) -> bool:
+        if self._worksheet is None:
+            self._worksheet = init_google_sheets()
+            if self._worksheet is None:
+                return False
+            self._index_loaded_at = 0.0
+        if time.time() - self._index_loaded_at > SHEETS_INDEX_TTL_SEC:
+            self._load_index()
         return True
-        
-    except Exception as e:
-        logger.error(f"Error saving to Google Sheets: {e}", exc_info=True)
-        return False 
\ No newline at end of file
+
+    def _resolve(self, cells: Dict[CellKey, str]) -> Tuple[list, list]:
+        updates, missing = [], []
+        for (machine, operator), value in cells.items():
+            row = self._machine_rows.get(machine)
+            col = self._operator_cols.get(operator)
+            if row and col:
+                updates.append({"range": rowcol_to_a1(row, col), "values": [[value]]})
+            else:
+                missing.append((machine, operator))
+        return updates, missing
+
+    def _flush_blocking(self, cells: Dict[CellKey, str]) -> Dict[CellKey, str]:
+        """Отправляет ячейки одним batch_update. Возвращает ячейки, которые стоит повторить."""
+        if not self._ensure_ready():
+            return cells
+        updates, missing = self._resolve(cells)
+        if missing and time.time() - self._index_loaded_at > SHEETS_INDEX_MISS_REFRESH_SEC:
+            # Новый станок / оператор в таблице — перечитываем индекс
+            self._load_index()
+            updates, missing = self._resolve(cells)
+        for machine, operator in missing:
+            logger.error(f"Sheets cell not found: machine={machine}, operator={operator}")
+            cells.pop((machine, operator), None)  # не повторяем при ошибке batch_update
+        self.dropped_cells += len(missing)
+        if updates:
+            self._worksheet.batch_update(updates)
+            self.flushed_cells += len(updates)
+            self.flush_count += 1
+            logger.info(f"Sheets batch_update: {len(updates)} cells")
+        return {}
+
+    # --- фоновая задача ---
+
+    async def flush(self) -> None:
+        if time.time() < self._retry_at:
+            return
+        cells = self._take_pending()
+        if not cells:
+            return
+        try:
+            retry = await asyncio.to_thread(self._flush_blocking, cells)
+        except Exception as e:
+            self.last_error = str(e)
+            if not _is_retryable(e):
+                self.dropped_cells += len(cells)
+                logger.error(f"Sheets batch_update failed, {len(cells)} cells dropped: {e}", exc_info=True)
+                self._failures = 0
+                return
+            retry = cells
+            logger.warning(f"Sheets batch_update failed (retry {self._failures + 1}): {e}")
+        if retry:
+            self._requeue(retry)
+            self._failures += 1
+            delay = min(SHEETS_BACKOFF_MAX_SEC, SHEETS_BACKOFF_BASE_SEC * 2 ** (self._failures - 1))
+            self._retry_at = time.time() + delay * random.uniform(0.8, 1.2)
+        else:
+            self._failures = 0
+            self._retry_at = 0.0
+            self.last_error = None
+
+    async def _run_forever(self) -> None:
+        logger.info(f"Sheets writer started (flush interval: {SHEETS_FLUSH_INTERVAL_SEC}s)")
+        while True:
+            await asyncio.sleep(SHEETS_FLUSH_INTERVAL_SEC)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Sheets writer error: {e}", exc_info=True)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def close(self) -> None:
+        """Останавливает задачу и пытается отправить остаток очереди."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        self._retry_at = 0.0
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning(f"Sheets final flush failed: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "pending_cells": pending,
+            "flushed_cells": self.flushed_cells,
+            "flush_count": self.flush_count,
+            "dropped_cells": self.dropped_cells,
+            "consecutive_failures": self._failures,
+            "retry_in_sec": round(max(0.0, self._retry_at - time.time()), 1),
+            "index_age_sec": round(time.time() - self._index_loaded_at, 1) if self._index_loaded_at else None,
+            "last_error": self.last_error,
+        }
+
+
+_writer = SheetsWriter()
+
+
+def get_sheets_writer() -> SheetsWriter:
+    return _writer
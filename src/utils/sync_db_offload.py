@@ -0,0 +1,255 @@
+"""
+Вынос async-эндпоинтов с синхронной Session из event loop.
+
+Многие эндпоинты объявлены как `async def`, но работают через sync `Session`
+(psycopg2). Каждый такой запрос к БД блокирует event loop воркера целиком —
+все остальные запросы (включая SSE и /health) ждут.
+
+SyncDBOffloadRoute — route_class для FastAPI/APIRouter:
+  * находит `async def` эндпоинты, у которых есть параметр типа `Session`,
+    и выполняет их тело в ограниченном пуле потоков (каждый поток со своим
+    event loop, чтобы `await` и `asyncio.create_task` внутри продолжали работать);
+  * размер пула = pool_size + max_overflow sync engine — больше параллельных
+    запросов всё равно упрутся в ожидание соединения из пула;
+  * для всех async-эндпоинтов меряет, сколько времени event loop был занят
+    синхронным кодом (сумма отрезков между await), и копит статистику по роутам.
+
+Переменные окружения:
+  SYNC_DB_OFFLOAD=0      — только измерять, ничего не выносить в потоки
+  LOOP_BLOCK_WARN_MS=200 — порог для warning в лог
+"""
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Coroutine, Dict, List, Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy.orm import Session
+from starlette.requests import Request
+
+from src import database
+
+logger = logging.getLogger(__name__)
+
+SYNC_DB_OFFLOAD_ENABLED = os.getenv("SYNC_DB_OFFLOAD", "1").lower() in {"1", "true", "yes"}
+LOOP_BLOCK_WARN_MS = float(os.getenv("LOOP_BLOCK_WARN_MS", "200"))
+
+# Ссылка на исходный эндпоинт: include_router пересоздаёт роут уже с обёрнутым
+# эндпоинтом и полным путём (prefix) — оборачиваем заново исходную функцию
+_ORIGINAL_ATTR = "__sync_db_offload_original__"
+
+
+# ---------------------------------------------------------------------------
+# Статистика блокировок по роутам
+# ---------------------------------------------------------------------------
+
+_STATS_LOCK = threading.Lock()
+_ROUTE_STATS: Dict[str, Dict[str, Any]] = {}
+
+
+def _record(route_key: str, offloaded: bool, blocked_ms: float, wait_ms: float = 0.0) -> None:
+    with _STATS_LOCK:
+        st = _ROUTE_STATS.get(route_key)
+        if st is None:
+            st = {
+                "route": route_key,
+                "offloaded": offloaded,
+                "calls": 0,
+                "blocked_total_ms": 0.0,
+                "blocked_max_ms": 0.0,
+                "slow_calls": 0,
+                "pool_wait_total_ms": 0.0,
+            }
+            _ROUTE_STATS[route_key] = st
+        st["calls"] += 1
+        st["blocked_total_ms"] += blocked_ms
+        st["blocked_max_ms"] = max(st["blocked_max_ms"], blocked_ms)
+        st["pool_wait_total_ms"] += wait_ms
+        if blocked_ms >= LOOP_BLOCK_WARN_MS:
+            st["slow_calls"] += 1
+
+    if blocked_ms >= LOOP_BLOCK_WARN_MS:
+        if offloaded:
+            logger.info(f"[offload] {route_key}: синхронный код {blocked_ms:.0f}ms (в потоке, основной loop свободен)")
+        else:
+            logger.warning(f"[loop-block] {route_key}: event loop заблокирован на {blocked_ms:.0f}ms")
+
+
+def get_loop_block_stats() -> List[Dict[str, Any]]:
+    """
+    Статистика по роутам, отсортированная по суммарному времени блокировки.
+    Для offloaded-роутов blocked_* — время синхронного кода в потоке пула
+    (то, что без выноса блокировало бы основной event loop).
+    """
+    with _STATS_LOCK:
+        rows = [dict(st) for st in _ROUTE_STATS.values()]
+    for row in rows:
+        calls = row["calls"] or 1
+        row["blocked_avg_ms"] = round(row["blocked_total_ms"] / calls, 1)
+        row["blocked_total_ms"] = round(row["blocked_total_ms"], 1)
+        row["blocked_max_ms"] = round(row["blocked_max_ms"], 1)
+        row["pool_wait_total_ms"] = round(row["pool_wait_total_ms"], 1)
+    rows.sort(key=lambda r: r["blocked_total_ms"], reverse=True)
+    return rows
+
+
+# ---------------------------------------------------------------------------
+# Измерение времени между await
+# ---------------------------------------------------------------------------
+
+class _TimedAwaitable:
+    """
+    Оборачивает корутину и суммирует время каждого шага (send/throw) —
+    ровно столько event loop был занят этой корутиной без возможности
+    переключиться на другие задачи.
+    """
+
+    __slots__ = ("_coro", "blocked")
+
+    def __init__(self, coro: Coroutine):
+        self._coro = coro
+        self.blocked = 0.0
+
+    def __await__(self):
+        gen = self._coro.__await__()
+        send_value: Any = None
+        throw_exc: Optional[BaseException] = None
+        while True:
+            started = time.perf_counter()
+            try:
+                if throw_exc is not None:
+                    exc, throw_exc = throw_exc, None
+                    yielded = gen.throw(exc)
+                else:
+                    yielded = gen.send(send_value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.blocked += time.perf_counter() - started
+            try:
+                send_value = yield yielded
+            except BaseException as exc:  # CancelledError и т.п. пробрасываем внутрь корутины
+                throw_exc = exc
+                send_value = None
+
+
+# ---------------------------------------------------------------------------
+# Пул потоков с собственными event loop
+# ---------------------------------------------------------------------------
+
+class _LoopWorker:
+    """Поток с постоянно работающим event loop (create_task внутри эндпоинта не теряется)."""
+
+    def __init__(self, index: int):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name=f"sync-db-offload-{index}", daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+
+class _OffloadPool:
+    def __init__(self) -> None:
+        self._workers: List[_LoopWorker] = []
+        self._idle: deque = deque()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.size = 0
+
+    def _ensure_started(self) -> None:
+        if self._slots is not None:
+            return
+        self.size = max(1, database.DB_POOL_SIZE + database.DB_MAX_OVERFLOW)
+        self._workers = [_LoopWorker(i) for i in range(self.size)]
+        self._idle = deque(self._workers)
+        self._slots = asyncio.Semaphore(self.size)
+        logger.info(f"[offload] Пул потоков для sync-DB эндпоинтов запущен: {self.size} потоков")
+
+    async def run(self, route_key: str, coro: Coroutine) -> Any:
+        self._ensure_started()
+        queued_at = time.perf_counter()
+        async with self._slots:
+            wait_ms = (time.perf_counter() - queued_at) * 1000
+            worker = self._idle.popleft()
+            timed = _TimedAwaitable(coro)
+
+            async def _body():
+                return await timed
+
+            try:
+                future = asyncio.run_coroutine_threadsafe(_body(), worker.loop)
+                return await asyncio.wrap_future(future)
+            finally:
+                self._idle.append(worker)
+                _record(route_key, True, timed.blocked * 1000, wait_ms)
+
+    def status(self) -> Dict[str, Any]:
+        busy = self.size - len(self._idle) if self._slots is not None else 0
+        return {"enabled": SYNC_DB_OFFLOAD_ENABLED, "size": self.size, "busy": busy}
+
+
+_pool = _OffloadPool()
+
+
+def get_offload_pool_status() -> Dict[str, Any]:
+    return _pool.status()
+
+
+# ---------------------------------------------------------------------------
+# Route class
+# ---------------------------------------------------------------------------
+
+def _takes_sync_session(endpoint: Callable) -> bool:
+    try:
+        params = inspect.signature(endpoint).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    for param in params:
+        annotation = param.annotation
+        if inspect.isclass(annotation) and issubclass(annotation, Session):
+            return True
+    return False
+
+
+def _wrap_endpoint(endpoint: Callable, route_key: str) -> Callable:
+    if SYNC_DB_OFFLOAD_ENABLED and _takes_sync_session(endpoint):
+        @functools.wraps(endpoint)
+        async def offloaded_endpoint(*args, **kwargs):
+            # Тело читается из ASGI receive основного loop — дочитываем его здесь,
+            # в потоке пула request.json()/form() вернут уже прочитанное
+            for value in kwargs.values():
+                if isinstance(value, Request):
+                    await value.body()
+            return await _pool.run(route_key, endpoint(*args, **kwargs))
+        setattr(offloaded_endpoint, _ORIGINAL_ATTR, endpoint)
+        return offloaded_endpoint
+
+    @functools.wraps(endpoint)
+    async def measured_endpoint(*args, **kwargs):
+        timed = _TimedAwaitable(endpoint(*args, **kwargs))
+        try:
+            return await timed
+        finally:
+            _record(route_key, False, timed.blocked * 1000)
+    setattr(measured_endpoint, _ORIGINAL_ATTR, endpoint)
+    return measured_endpoint
+
+
+class SyncDBOffloadRoute(APIRoute):
+    """
+    route_class для FastAPI/APIRouter. Sync-эндпоинты (def) FastAPI и так
+    выполняет в threadpool — их не трогаем.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any) -> None:
+        endpoint = getattr(endpoint, _ORIGINAL_ATTR, endpoint)
+        if asyncio.iscoroutinefunction(endpoint):
+            methods = ",".join(sorted(kwargs.get("methods") or ["GET"]))
+            endpoint = _wrap_endpoint(endpoint, f"{methods} {path}")
+        super().__init__(path, endpoint, **kwargs)
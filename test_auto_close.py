@@ -3,7 +3,6 @@
 Простой тест для проверки автоматического закрытия лотов
 """
 
-import asyncio
 import sys
 import os
 from datetime import datetime
@@ -13,9 +12,9 @@ from sqlalchemy.orm import sessionmaker
 # Добавляем путь к src для импорта
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
-from src.main import check_lot_auto_completion
+from src.services.lot_lifecycle import close_inspected_lots
 
-async def test_auto_close():
+def test_auto_close():
     """Тестирует автоматическое закрытие лота 159"""
     
     # Создаем подключение к БД
@@ -31,8 +30,9 @@ async def test_auto_close():
         lot = result.fetchone()
         print(f"До теста - Лот {lot[1]}: статус {lot[2]}")
         
-        # Вызываем функцию автоматического закрытия
-        await check_lot_auto_completion(lot[0], db)
+        # Вызываем автоматическое закрытие (post_production → closed)
+        close_inspected_lots(db, [lot[0]])
+        db.commit()
         
         # Проверяем статус после теста
         result = db.execute(text("SELECT id, lot_number, status FROM lots WHERE lot_number = '159'"))
@@ -51,4 +51,4 @@ async def test_auto_close():
         db.close()
 
 if __name__ == "__main__":
-    asyncio.run(test_auto_close()) 
\ No newline at end of file
+    test_auto_close() 
\ No newline at end of file
@@ -0,0 +1,29 @@
+import os
+import sys
+
+# Корень репозитория в sys.path — импорт как в приложении: from src.services...
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from src.services.machine_queue_snapshot import MachineQueue, QueuedLot, drawing_base  # noqa: E402
+
+
+# Общие построители снимка очередей (test_planning_scoring, test_queue_simulator)
+
+def queued_lot(lot_id, drawing_number, work_hours, status="assigned", diameter=None,
+               position=1, quantity=100, cycle_time_sec=None):
+    return QueuedLot(
+        lot_id=lot_id, lot_number=f"L{lot_id}", status=status, position=position,
+        drawing_number=drawing_number, base_drawing=drawing_base(drawing_number),
+        quantity=quantity, produced=0, cycle_time_sec=cycle_time_sec, work_hours=work_hours,
+        changeover_hours=0.0, due_date=None, diameter=diameter,
+    )
+
+
+def machine_queue(machine_id, name, min_d, max_d, max_len=None, current_d=None,
+                  lots=(), work_hours=0.0, is_jbs=False):
+    return MachineQueue(
+        machine_id=machine_id, name=name,
+        min_diameter=min_d, max_diameter=max_d, max_bar_length=None, max_part_length=max_len,
+        is_jbs=is_jbs, supports_no_guidebush=False, location_id=None,
+        current_diameter=current_d, lots=tuple(lots), work_hours=work_hours,
+    )
@@ -0,0 +1,59 @@
+"""
+Лидер снимает лидерство, если heartbeat не ответил за LEADER_HEARTBEAT_SEC.
+Соединение asyncpg заменено заглушкой, у которой SELECT 1 зависает.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+from src import database
+from src.services import leader_election
+
+
+class _HangingConnection:
+    def __init__(self):
+        self.terminated = False
+
+    async def fetchval(self, query, *args):
+        return True
+
+    async def execute(self, query, *args, timeout=None):
+        if query == "SELECT 1":
+            await asyncio.wait_for(asyncio.sleep(3600), timeout)
+        if self.terminated:
+            raise ConnectionError("connection is closed")
+
+    def terminate(self):
+        self.terminated = True
+
+
+class _Engine:
+    def __init__(self, pg):
+        self.pg = pg
+
+    @asynccontextmanager
+    async def connect(self):
+        async def get_raw_connection():
+            return SimpleNamespace(driver_connection=self.pg)
+
+        yield SimpleNamespace(get_raw_connection=get_raw_connection)
+
+
+def test_heartbeat_timeout_demotes_leader(monkeypatch):
+    pg = _HangingConnection()
+    monkeypatch.setattr(database, "async_engine", _Engine(pg))
+    monkeypatch.setattr(leader_election, "LEADER_HEARTBEAT_SEC", 0.1)
+    monkeypatch.setattr(leader_election, "LEADER_RETRY_SEC", 10)
+    election = leader_election.LeaderElection("test")
+
+    async def run():
+        task = asyncio.create_task(election.run())
+        await asyncio.sleep(0.15)
+        assert election.is_leader  # первый heartbeat ещё идёт
+        await asyncio.sleep(0.25)
+        leader = election.is_leader
+        task.cancel()
+        return leader
+
+    assert asyncio.run(run()) is False
+    assert pg.terminated
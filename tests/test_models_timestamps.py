@@ -0,0 +1,69 @@
+"""
+Значения по умолчанию колонок DateTime — naive UTC.
+
+Колонки — timestamp without time zone; asyncpg (POST /readings,
+/readings/batch, POST /parts через AsyncSession) отклоняет aware datetime
+с DataError. Проверка через БД — только при заданном TEST_DATABASE_URL,
+всё откатывается.
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import DateTime, text
+
+from src.database import Base
+from src.models.models import BatchDB
+
+
+def _python_defaults():
+    for table in Base.metadata.sorted_tables:
+        for column in table.columns:
+            if not isinstance(column.type, DateTime) or column.type.timezone:
+                continue
+            for kind in ("default", "onupdate"):
+                generator = getattr(column, kind)
+                if generator is not None and generator.is_callable:
+                    yield f"{table.name}.{column.name} ({kind})", generator
+
+
+def test_datetime_defaults_are_naive_utc():
+    defaults = list(_python_defaults())
+    assert any(name == "batches.updated_at (onupdate)" for name, _ in defaults)
+    for name, generator in defaults:
+        value = generator.arg(None)
+        assert value.tzinfo is None, name
+        assert abs(value - datetime.now(timezone.utc).replace(tzinfo=None)) < timedelta(minutes=1), name
+
+
+@pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL не задан")
+def test_batch_flush_through_asyncpg():
+    pytest.importorskip("asyncpg")
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+    from src.database import _to_async_url
+
+    async def run():
+        url, connect_args = _to_async_url(os.environ["TEST_DATABASE_URL"])
+        engine = create_async_engine(url, connect_args=connect_args)
+        try:
+            async with engine.connect() as conn:
+                transaction = await conn.begin()
+                try:
+                    lot_id = await conn.scalar(text("SELECT id FROM lots ORDER BY id LIMIT 1"))
+                    if lot_id is None:
+                        pytest.skip("в тестовой БД нет лотов")
+                    async with AsyncSession(bind=conn) as db:
+                        batch = BatchDB(lot_id=lot_id, initial_quantity=0, current_quantity=5)
+                        db.add(batch)
+                        await db.flush()        # INSERT: created_at / updated_at / batch_time по умолчанию
+                        batch.current_quantity = 7
+                        await db.flush()        # UPDATE: onupdate updated_at
+                        assert batch.id is not None
+                finally:
+                    await transaction.rollback()
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
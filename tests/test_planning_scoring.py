@@ -0,0 +1,142 @@
+"""
+Score рекомендаций станков (planning_scoring + /planning/recommend-*) на
+посчитанном вручную примере.
+
+Станки:
+    1 SR-20  Ø10–20, длина ≤100, сейчас Ø15.0, очередь пуста
+    2 SR-32  без ограничений (0 / None), диаметр не известен, очередь 30ч
+             (assigned 1409-04-2), JBS
+    3 K-16   Ø5–12, длина ≤50, сейчас Ø12.2, очередь 250ч
+
+Лоты (диаметр, длина, чертёж, история):
+    A  15.2  80    1409-04-1  делали 1 раз на станке 2
+    B  12.0  —     —          —
+    C  11.0  60    —          —
+    D  25.0  —     —          —
+
+score = 50 + min(30, делали*10) + очередь + тот же диаметр + родственный + JBS, ≤ 100
+    A: 1 → 50+0+25+10          = 85    2 → 50+10+7+0+20+5 = 92    3 — Ø > 12
+    B: 1 → 50+25               = 75    2 → 50+7+5         = 62    3 → 50−20+5 = 35
+    C: 1 → 75                          2 → 62                     3 — длина 60 > 50
+    D: 1 — Ø > 20                      2 → 62                     3 — Ø > 12
+"""
+import numpy as np
+import pytest
+
+from conftest import machine_queue, queued_lot
+
+from src.routers import planning
+from src.services.planning_scoring import (
+    MachineArrays,
+    _limits,
+    fits_matrix,
+    queue_score,
+    rank,
+    score_lots,
+)
+
+
+MACHINES = [
+    machine_queue(1, "SR-20", 10, 20, 100, 15.0),
+    machine_queue(2, "SR-32", 0, None, 0, None, lots=[queued_lot(7, "1409-04-2", 30.0)], work_hours=30.0, is_jbs=True),
+    machine_queue(3, "K-16", 5, 12, 50, 12.2, work_hours=250.0),
+]
+DIAMETERS = np.array([15.2, 12.0, 11.0, 25.0])
+PART_LENGTHS = np.array([80, np.nan, 60, np.nan])
+HISTORY = np.array([[0, 1, 0], [0, 0, 0], [0, 0, 0], [0, 0, 0]])
+RELATED = np.array([[False, True, False]] + [[False, False, False]] * 3)
+
+EXPECTED_FITS = np.array([
+    [True, True, False],
+    [True, True, True],
+    [True, True, False],
+    [False, True, False],
+])
+EXPECTED_SCORES = {  # только подходящие пары
+    (0, 0): 85, (0, 1): 92,
+    (1, 0): 75, (1, 1): 62, (1, 2): 35,
+    (2, 0): 75, (2, 1): 62,
+    (3, 1): 62,
+}
+
+
+def test_limits_zero_and_none_mean_no_limit():
+    assert np.array_equal(np.isnan(_limits([None, 0, 12.5, 0.0])), [True, True, False, True])
+    assert _limits([12.5])[0] == 12.5
+
+
+@pytest.mark.parametrize("hours, expected", [
+    (0, 25), (0.5, 17), (23.9, 17), (24, 7), (71.9, 7), (72, -10), (199.9, -10), (200, -20), (1000, -20),
+])
+def test_queue_score(hours, expected):
+    assert queue_score(np.array([hours], dtype=float))[0] == expected
+
+
+def test_machine_arrays_nan_for_missing_values():
+    arrays = MachineArrays.from_machines(MACHINES)
+    assert np.isnan(arrays.min_diameter[1]) and np.isnan(arrays.max_diameter[1])
+    assert np.isnan(arrays.max_part_length[1])
+    assert np.isnan(arrays.current_diameter[1])
+    assert arrays.queue_hours.tolist() == [0.0, 30.0, 250.0]
+
+
+def test_fits_matrix_with_missing_limits_and_part_length():
+    arrays = MachineArrays.from_machines(MACHINES)
+    assert np.array_equal(fits_matrix(arrays, DIAMETERS, PART_LENGTHS), EXPECTED_FITS)
+
+
+def test_score_lots_matches_hand_computed():
+    scores, fits = score_lots(MachineArrays.from_machines(MACHINES), DIAMETERS, PART_LENGTHS, HISTORY, RELATED)
+    assert np.array_equal(fits, EXPECTED_FITS)
+    assert {ij: int(scores[ij]) for ij in EXPECTED_SCORES} == EXPECTED_SCORES
+
+
+def test_score_is_capped():
+    history = np.full((1, 3), 5)
+    related = np.ones((1, 3), dtype=bool)
+    scores, _ = score_lots(MachineArrays.from_machines(MACHINES), np.array([15.2]), np.array([np.nan]), history, related)
+    assert scores[0, 0] == 100  # 50+30+25+10+20 = 135
+
+
+def test_rank_orders_by_score_and_skips_unfit():
+    scores, fits = score_lots(MachineArrays.from_machines(MACHINES), DIAMETERS, PART_LENGTHS, HISTORY, RELATED)
+    assert rank(scores, fits, 5) == [[1, 0], [0, 1, 2], [0, 1], [1]]
+    assert rank(scores, fits, 1) == [[1], [0], [0], [1]]
+
+
+def test_rank_ties_keep_machine_order():
+    scores = np.array([[60, 70, 70, 60]])
+    fits = np.array([[True, True, True, True]])
+    assert rank(scores, fits, 4) == [[1, 2, 0, 3]]
+
+
+def test_recommend_lots_end_to_end(monkeypatch):
+    history = {0: {2: 1, 99: 4}}  # станок 99 не в снимке — игнорируется
+    monkeypatch.setattr(
+        planning, "_load_history",
+        lambda db, keys: [history.get(i, {}) for i in range(len(keys))],
+    )
+    lots = [
+        planning.LotCandidate(diameter=15.2, quantity=100, due_days=10, part_length=80, drawing_number="1409-04-1"),
+        planning.LotCandidate(diameter=12.0, quantity=100, due_days=10),
+        planning.LotCandidate(diameter=11.0, quantity=100, due_days=10, part_length=60),
+        planning.LotCandidate(diameter=25.0, quantity=100, due_days=10, cycle_time_sec=3600),
+    ]
+    results = planning._recommend_lots(None, MACHINES, lots, top_n=5)
+
+    assert [[(r.machine_id, r.score) for r in recs] for recs in results] == [
+        [(2, 92), (1, 85)],
+        [(1, 75), (2, 62), (3, 35)],
+        [(1, 75), (2, 62)],
+        [(2, 62)],
+    ]
+    sr32 = results[0][0]
+    assert "✅ Делали раньше (1 раз)" in sr32.reasons
+    assert "🔗 Родственный чертёж: после лота L7 (1409-04-2)" in sr32.reasons
+    assert "🔧 JBS (неидеальный диаметр)" in sr32.reasons
+    assert not any("переналадк" in reason.lower() for reason in sr32.reasons)  # диаметр на станке не известен
+    assert "✅ Без переналадки (сейчас 15.0мм)" in results[0][1].reasons
+    assert "✅ Без переналадки (сейчас 12.2мм, но очередь!)" in results[1][2].reasons
+    # 100 шт × 1ч = 4.2 дня, к сроку 10 дней успеваем всё
+    assert results[3][0].forecast.completion_rate == 100
+    assert results[3][0].forecast.days_for_full == 4.2
@@ -0,0 +1,119 @@
+"""
+Границы смен: production_day_window / shift_window_at и их паритет с SQL
+production_shift_start() из migrations/058_shift_production_facts.sql.
+
+Asia/Jerusalem: зима UTC+2, лето UTC+3. В 2026 году летнее время начинается
+27.03 в 02:00 (ночная смена 26.03 — 11 часов) и заканчивается 25.10 в 02:00
+(ночная смена 24.10 — 13 часов).
+
+Паритет с SQL проверяется только при заданном TEST_DATABASE_URL
+(база с применённой миграцией 058).
+"""
+import os
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from src.services.production_day import production_day_window, report_date_of, shift_window_at
+
+US = timedelta(microseconds=1)
+
+
+@pytest.mark.parametrize("report_date, morning, evening, evening_end", [
+    # зима, UTC+2
+    (date(2026, 1, 15), datetime(2026, 1, 15, 4), datetime(2026, 1, 15, 16), datetime(2026, 1, 16, 4)),
+    # лето, UTC+3
+    (date(2026, 7, 15), datetime(2026, 7, 15, 3), datetime(2026, 7, 15, 15), datetime(2026, 7, 16, 3)),
+    # ночь перехода на летнее время: 18:00 IST → 06:00 IDT
+    (date(2026, 3, 26), datetime(2026, 3, 26, 4), datetime(2026, 3, 26, 16), datetime(2026, 3, 27, 3)),
+    # ночь перехода на зимнее время: 18:00 IDT → 06:00 IST
+    (date(2026, 10, 24), datetime(2026, 10, 24, 3), datetime(2026, 10, 24, 15), datetime(2026, 10, 25, 4)),
+])
+def test_production_day_window(report_date, morning, evening, evening_end):
+    window = production_day_window(report_date)
+    assert window.morning_start == morning
+    assert window.evening_start == evening
+    assert window.evening_end == evening_end
+    assert window.morning_start - window.day_start == timedelta(hours=6)
+
+
+@pytest.mark.parametrize("report_date, hours", [
+    (date(2026, 3, 25), 12),
+    (date(2026, 3, 26), 11),
+    (date(2026, 10, 24), 13),
+    (date(2026, 10, 25), 12),
+])
+def test_night_shift_length_around_dst(report_date, hours):
+    window = production_day_window(report_date)
+    assert window.evening_end - window.evening_start == timedelta(hours=hours)
+    assert window.evening_start - window.morning_start == timedelta(hours=12)
+
+
+@pytest.mark.parametrize("report_date", [
+    date(2026, 1, 15), date(2026, 7, 15),
+    date(2026, 3, 26), date(2026, 3, 27), date(2026, 10, 24), date(2026, 10, 25),
+])
+def test_shift_window_at_boundaries(report_date):
+    window = production_day_window(report_date)
+
+    morning = shift_window_at(window.morning_start)
+    assert (morning.shift_start, morning.shift_end) == (window.morning_start, window.evening_start)
+    assert (morning.report_date, morning.shift_type) == (report_date, "morning")
+
+    before_morning = shift_window_at(window.morning_start - US)
+    assert before_morning.shift_type == "evening"
+    assert before_morning.report_date == report_date - timedelta(days=1)
+    assert before_morning.shift_end == window.morning_start
+
+    assert shift_window_at(window.evening_start - US) == morning
+
+    evening = shift_window_at(window.evening_start)
+    assert (evening.shift_start, evening.shift_end) == (window.evening_start, window.evening_end)
+    assert (evening.report_date, evening.shift_type) == (report_date, "evening")
+    assert shift_window_at(window.evening_end - US) == evening
+
+    # Полночь и ночь до 06:00 — вечерняя смена отчётной даты
+    assert shift_window_at(window.day_end) == evening
+    assert report_date_of(window.day_end) == report_date
+    assert report_date_of(window.evening_end) == report_date + timedelta(days=1)
+
+
+def test_shift_chain_is_continuous_across_dst():
+    shift = shift_window_at(datetime(2026, 3, 25, 12))
+    for _ in range(2 * 240):  # до ноября
+        following = shift.next()
+        assert following.shift_start == shift.shift_end
+        assert following.previous() == shift
+        assert following.shift_type != shift.shift_type
+        shift = following
+    assert shift.shift_start > datetime(2026, 10, 26)
+
+
+def _sample_moments():
+    """Каждые 20 минут вокруг переходов и ±1 мкс / ±1 с у каждой границы смены."""
+    moments = []
+    for start in (datetime(2026, 1, 14), datetime(2026, 3, 25), datetime(2026, 7, 14), datetime(2026, 10, 23)):
+        moments.extend(start + timedelta(minutes=20 * i) for i in range(4 * 72))
+        for offset in range(4):
+            window = production_day_window(start.date() + timedelta(days=offset))
+            for boundary in (window.morning_start, window.evening_start, window.evening_end):
+                moments.extend([boundary - timedelta(seconds=1), boundary - US, boundary, boundary + US])
+    return moments
+
+
+@pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL не задан")
+def test_sql_production_shift_start_matches_python():
+    psycopg2 = pytest.importorskip("psycopg2")
+    moments = _sample_moments()
+    conn = psycopg2.connect(os.environ["TEST_DATABASE_URL"])
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT ts, production_shift_start(ts) FROM unnest(%s::timestamp[]) AS ts",
+                (moments,),
+            )
+            rows = cur.fetchall()
+    finally:
+        conn.close()
+    mismatches = [(ts, sql) for ts, sql in rows if sql != shift_window_at(ts).shift_start]
+    assert not mismatches, mismatches[:5]
@@ -0,0 +1,126 @@
+"""
+simulate_assignment на посчитанном вручную примере.
+
+Станки (now = 2026-01-01 00:00 UTC):
+    1 SR-20  Ø10–20, в очереди 500-1 на 10ч
+    2 SR-32  Ø10–20, очередь пуста
+    3 K-16   Ø30–40, очередь пуста
+
+Лоты по сроку (окончание = конец очереди + переналадка 12ч / 6ч для той же базы + работа):
+    L1  700    10ч  1: 10+12+10=32   2: 0+12+10=22          → 2 (22)
+    L2  500-2  10ч  1: 10+6+10=26    2: 22+12+10=44         → 1 (26), база 500 как у 500-1
+    L3  700-1  10ч  1: 26+12+10=48   2: 22+6+10=38          → 2 (38), база 700
+    L4  900    5ч   1: 26+12+5=43    2: 38+12+5=55          → 1 (43), очередь 2 уже длиннее
+    L5  901    1ч   1: 43+12+1=56−8  2: 38+12+1=51          → 1 (56), делали на станке 1
+    L6  902    1ч   закреплён за 2: 38+12+1=51              → 2 (51)
+    L7  903         закреплён за 3 (Ø не подходит)          → не поставлен
+    L8  904         закреплён за 99 (нет в снимке)          → не поставлен
+    L9  905         диаметр не задан                        → не поставлен
+    L10 906         Ø50 — ни один станок                    → не поставлен
+    L11 907    —    Ø35, без времени цикла, без срока       → 3 (12), предупреждение
+"""
+from datetime import datetime, timedelta, timezone
+
+from conftest import machine_queue, queued_lot
+
+from src.services.queue_simulator import SimLot, simulate_assignment
+
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def _lot(lot_id, drawing_number, diameter=15.0, hours=1, due_day=None, pinned=None, cycle_time_sec=3600):
+    return SimLot(
+        lot_id=lot_id, lot_number=f"L{lot_id}", part_id=None, drawing_number=drawing_number,
+        diameter=diameter, quantity=hours, cycle_time_sec=cycle_time_sec, part_length=None,
+        due_date=NOW + timedelta(days=due_day) if due_day is not None else None,
+        pinned_machine_id=pinned,
+    )
+
+
+MACHINES = [
+    machine_queue(1, "SR-20", 10, 20, lots=[
+        queued_lot(100, "500-1", 10.0, status="in_production", diameter=15.0, position=0, quantity=10, cycle_time_sec=3600),
+    ], work_hours=10.0),
+    machine_queue(2, "SR-32", 10, 20),
+    machine_queue(3, "K-16", 30, 40),
+]
+
+LOTS = [
+    _lot(11, "907", diameter=35.0, cycle_time_sec=None),
+    _lot(10, "906", diameter=50.0, due_day=12),
+    _lot(9, "905", diameter=None, due_day=11),
+    _lot(8, "904", due_day=10, pinned=99),
+    _lot(7, "903", due_day=9, pinned=3),
+    _lot(6, "902", due_day=8, pinned=2),
+    _lot(5, "901", due_day=7),
+    _lot(4, "900", hours=5, due_day=6),
+    _lot(3, "700-1", hours=10, due_day=5),
+    _lot(2, "500-2", hours=10, due_day=3),
+    _lot(1, "700", hours=10, due_day=2),
+]
+
+
+def _simulate():
+    return simulate_assignment(MACHINES, LOTS, history={5: {1: 2}}, now=NOW)
+
+
+def _planned(result):
+    return {m.machine_id: [(lot.lot_id, lot.changeover_hours, lot.position) for lot in m.planned] for m in result.machines}
+
+
+def test_assignment_accumulates_queue_load():
+    result = _simulate()
+    assert _planned(result) == {
+        1: [(2, 6.0, 2), (4, 12.0, 3), (5, 12.0, 4)],
+        2: [(1, 12.0, 1), (3, 6.0, 2), (6, 12.0, 3)],
+        3: [(11, 12.0, 1)],
+    }
+    assert [m.queue_hours for m in result.machines] == [56.0, 51.0, 12.0]
+    assert [m.existing_queue_hours for m in result.machines] == [10.0, 0.0, 0.0]
+    assert result.planned_count == 7
+    assert result.finish_at == NOW + timedelta(hours=56)
+
+
+def test_changeover_by_drawing_base():
+    by_lot = {lot.lot_id: lot for m in _simulate().machines for lot in m.planned}
+    # 500-2 после 500-1 и 700-1 после 700 — родственная переналадка
+    assert by_lot[2].changeover_hours == 6.0 and by_lot[2].start_at == NOW + timedelta(hours=16)
+    assert by_lot[3].changeover_hours == 6.0 and by_lot[3].start_at == NOW + timedelta(hours=28)
+    assert by_lot[3].finish_at == NOW + timedelta(hours=38)
+
+
+def test_history_preference_and_timing():
+    by_lot = {lot.lot_id: lot for m in _simulate().machines for lot in m.planned}
+    assert by_lot[5].made_before is True
+    assert by_lot[5].finish_at == NOW + timedelta(hours=56)  # на 5ч позже станка 2, но делали на станке 1
+    assert by_lot[1].made_before is False
+    assert by_lot[1].slack_days == round((48 - 22) / 24, 1)
+
+
+def test_pinned_machine():
+    result = _simulate()
+    assert [lot.lot_id for lot in result.machines[1].planned][-1] == 6
+    unplaced = {lot.lot_id: lot.reason for lot in result.unplaced}
+    assert unplaced[7] == "Закреплённый станок недоступен или не подходит"
+    assert unplaced[8] == "Закреплённый станок недоступен или не подходит"
+
+
+def test_unplaced_without_diameter_or_fitting_machine():
+    result = _simulate()
+    unplaced = {lot.lot_id: lot.reason for lot in result.unplaced}
+    assert unplaced[9] == "Не задан диаметр материала"
+    assert unplaced[10] == "Нет подходящих станков (диаметр / длина детали)"
+    assert set(unplaced) == {7, 8, 9, 10}
+
+
+def test_lot_without_cycle_time_counts_only_changeover():
+    result = _simulate()
+    lot = result.machines[2].planned[0]
+    assert (lot.work_hours, lot.due_date, lot.slack_days) == (0.0, None, None)
+    assert result.warnings == ["⚠️ Лот L11: нет времени цикла — учтена только переналадка"]
+
+
+def test_input_is_not_modified():
+    _simulate()
+    assert [m.queue_hours for m in MACHINES] == [10.0, 0.0, 0.0]
+    assert len(MACHINES[0].lots) == 1
@@ -0,0 +1,80 @@
+"""
+get_or_refresh: сбой backend на любом шаге не ломает запрос — значение
+считается через loader; ошибки самого loader пробрасываются.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from src.services import shared_cache
+from src.services.shared_cache import MemorySharedCache, SharedCacheBackend, get_or_refresh
+
+
+class _FlakyCache(MemorySharedCache):
+    def __init__(self, fail=()):
+        super().__init__()
+        self.fail = set(fail)
+        self.first_get = True
+
+    async def get(self, key):
+        if self.first_get:  # первое чтение — до single_flight, промах
+            self.first_get = False
+            return None
+        if "get" in self.fail:
+            raise RuntimeError("get")
+        return await super().get(key)
+
+    async def set(self, key, value):
+        if "set" in self.fail:
+            raise RuntimeError("set")
+        await super().set(key, value)
+
+    @asynccontextmanager
+    async def single_flight(self, key):
+        if "enter" in self.fail:
+            raise RuntimeError("enter")
+        yield True
+        if "release" in self.fail:
+            raise RuntimeError("release")
+
+
+def _run(backend, loader):
+    shared_cache._backend = backend
+    try:
+        return asyncio.run(get_or_refresh("k", 60, loader))
+    finally:
+        shared_cache._backend = None
+
+
+async def _load():
+    return {"v": 1}
+
+
+@pytest.mark.parametrize("fail", [(), ("enter",), ("get",), ("set",), ("release",), ("get", "set", "release")])
+def test_leader_path_survives_backend_errors(fail):
+    value, age = _run(_FlakyCache(fail), _load)
+    assert (value, age) == ({"v": 1}, 0.0)
+
+
+def test_leader_stores_value():
+    backend = _FlakyCache()
+    _run(backend, _load)
+    assert "k" in backend._data
+
+
+def test_loader_error_is_not_swallowed():
+    async def broken():
+        raise ValueError("loader")
+
+    with pytest.raises(ValueError):
+        _run(_FlakyCache(("release",)), broken)
+
+
+def test_backend_is_abstract():
+    class Incomplete(SharedCacheBackend):
+        async def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,90 @@
+"""
+refresh_open_shifts: закрытая смена дособирается после окончания, как бы
+поздно ни запустилась задача, и сбой открытой смены не мешает закрытым.
+БД заменена отметками pending в памяти.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.services import shift_facts
+from src.services.production_day import shift_window_at
+
+NOON = datetime(2026, 1, 15, 10)  # утренняя смена 15.01 (04:00–16:00 UTC)
+
+
+class _FakeDB:
+    def rollback(self):
+        pass
+
+
+@pytest.fixture
+def pending(monkeypatch):
+    marks = set()
+    refreshed = []
+
+    def claim(db, before):
+        claimed = sorted(s for s in marks if s < before)
+        marks.difference_update(claimed)
+        return claimed
+
+    def refresh(db, shift, invalidate_cache=True):
+        refreshed.append((shift.shift_start, invalidate_cache))
+        return 1
+
+    monkeypatch.setattr(shift_facts, "_claim_pending_shifts", claim)
+    monkeypatch.setattr(shift_facts, "_mark_pending_shift", lambda db, start: marks.add(start))
+    monkeypatch.setattr(shift_facts, "refresh_shift", refresh)
+    return marks, refreshed
+
+
+def test_open_shift_is_finalized_after_close_even_if_job_is_late(pending):
+    marks, refreshed = pending
+    morning = shift_window_at(NOON)
+
+    shift_facts.refresh_open_shifts(_FakeDB(), NOON)
+    assert marks == {morning.shift_start}
+    assert refreshed == [(morning.shift_start, False)]
+
+    # Задача не запускалась почти сутки: утренняя смена всё равно пересобирается
+    later = morning.shift_end + timedelta(hours=20)
+    refreshed.clear()
+    stats = shift_facts.refresh_open_shifts(_FakeDB(), later)
+    open_start = shift_window_at(later).shift_start
+    assert refreshed == [(open_start, False), (morning.shift_start, True)]
+    assert stats == {"open_rows": 1, "closed_shifts": 1}
+    assert marks == {open_start}
+
+
+def test_open_shift_failure_does_not_skip_closed_shifts(pending, monkeypatch):
+    marks, refreshed = pending
+    late_edit = shift_window_at(NOON - timedelta(days=2)).shift_start
+    marks.add(late_edit)
+
+    def refresh(db, shift, invalidate_cache=True):
+        if not invalidate_cache:
+            raise RuntimeError("open shift")
+        refreshed.append(shift.shift_start)
+        return 1
+
+    monkeypatch.setattr(shift_facts, "refresh_shift", refresh)
+    stats = shift_facts.refresh_open_shifts(_FakeDB(), NOON)
+    assert refreshed == [late_edit]
+    assert stats == {"open_rows": 0, "closed_shifts": 1}
+    assert marks == {shift_window_at(NOON).shift_start}
+
+
+def test_failed_closed_shift_is_marked_again(pending, monkeypatch):
+    marks, _ = pending
+    late_edit = shift_window_at(NOON - timedelta(days=2)).shift_start
+    marks.add(late_edit)
+
+    def refresh(db, shift, invalidate_cache=True):
+        if invalidate_cache:
+            raise RuntimeError("closed shift")
+        return 0
+
+    monkeypatch.setattr(shift_facts, "refresh_shift", refresh)
+    stats = shift_facts.refresh_open_shifts(_FakeDB(), NOON)
+    assert stats["closed_shifts"] == 0
+    assert late_edit in marks
@@ -0,0 +1,61 @@
+"""
+Все async-эндпоинты с синхронной Session в роутерах выносятся в пул потоков.
+
+include_router сохраняет route_class роутера: роутер без
+route_class=SyncDBOffloadRoute блокирует event loop и не виден в
+/health/loop-blocking.
+"""
+import asyncio
+import importlib
+import pkgutil
+import threading
+
+import pytest
+from fastapi.routing import APIRoute
+
+from src.utils.sync_db_offload import _ORIGINAL_ATTR, SyncDBOffloadRoute, _takes_sync_session
+
+ROUTER_PACKAGES = ("src.routers", "src.text2sql.routers")
+
+
+def _router_modules():
+    for package_name in ROUTER_PACKAGES:
+        package = importlib.import_module(package_name)
+        for info in pkgutil.iter_modules(package.__path__):
+            yield f"{package_name}.{info.name}"
+
+
+@pytest.mark.parametrize("module_name", list(_router_modules()))
+def test_async_sync_session_endpoints_are_offloaded(module_name):
+    module = importlib.import_module(module_name)
+    router = getattr(module, "router", None)
+    if router is None:
+        pytest.skip("модуль без router")
+    missing = []
+    for route in router.routes:
+        if not isinstance(route, APIRoute):
+            continue
+        endpoint = getattr(route.endpoint, _ORIGINAL_ATTR, route.endpoint)
+        if asyncio.iscoroutinefunction(endpoint) and _takes_sync_session(endpoint):
+            if not isinstance(route, SyncDBOffloadRoute):
+                missing.append(f"{','.join(sorted(route.methods))} {route.path}")
+    assert not missing, missing
+
+
+def test_offloaded_endpoint_reads_request_body():
+    from fastapi import APIRouter, Depends, FastAPI, Request
+    from fastapi.testclient import TestClient
+    from sqlalchemy.orm import Session
+
+    router = APIRouter(route_class=SyncDBOffloadRoute)
+
+    @router.post("/echo")
+    async def echo(request: Request, db: Session = Depends(lambda: None)):
+        return {"payload": await request.json(), "thread": threading.current_thread().name}
+
+    app = FastAPI()
+    app.include_router(router)
+    response = TestClient(app).post("/echo", json={"a": 1})
+    assert response.status_code == 200
+    assert response.json()["payload"] == {"a": 1}
+    assert response.json()["thread"].startswith("sync-db-offload-")